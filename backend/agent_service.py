@@ -1,54 +1,186 @@
+"""
+Agente di indagine su startup: ricerca web (Tavily) + sintesi LLM.
+
+- `investigate_companies` indaga una watchlist in parallelo: ricerche e sintesi girano in
+  thread separati, con un tetto di chiamate concorrenti per servizio (rate limit del piano
+  Tavily e del provider LLM), quindi il batch dura circa quanto l'azienda più lenta.
+- I risultati di ricerca sono in cache Redis per (query, giorno): la stessa azienda indagata
+  più volte nella giornata non consuma ricerche.
+- Ricerca e LLM passano da resilience.py (retry, backoff, breaker); gli endpoint si
+  reindirizzano con TAVILY_BASE_URL / MISTRAL_API_BASE (llm.py, benchmarks/stubs.py).
+
+Esposto come task Celery (worker.investigate_companies_task) e su POST /api/agent/investigations.
+Uso da riga di comando (dalla cartella backend):
+    python agent_service.py Eoliann "D-Orbit"
+"""
+import argparse
+import hashlib
+import json
 import os
-from tavily import TavilyClient
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from typing import Dict, List, Optional
+
+import redis
 from litellm import completion
 
-# 1. Setup Strumenti
-# Tavily è gratuito fino a 1000 ricerche/mese, ottimo per testare
-tavily = TavilyClient(api_key="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") 
+import resilience
+from llm import llm_route
+
+TAVILY_BASE_URL = os.getenv("TAVILY_BASE_URL", "https://api.tavily.com")
+REDIS_URL = os.getenv("REDIS_URL", os.getenv("CELERY_BROKER_URL", "redis://redis:6379/0"))
+SEARCH_CACHE_PREFIX = "spacescraper:agent_search"
+SEARCH_CACHE_TTL_SECONDS = 2 * 24 * 3600
+
+# Chiamate concorrenti per processo (condivise da tutti i batch del processo)
+SEARCH_CONCURRENCY = int(os.getenv("AGENT_SEARCH_CONCURRENCY", "4"))
+LLM_CONCURRENCY = int(os.getenv("AGENT_LLM_CONCURRENCY", "4"))
+MAX_BATCH_WORKERS = 16
+
+_search_slots = threading.BoundedSemaphore(SEARCH_CONCURRENCY)
+_llm_slots = threading.BoundedSemaphore(LLM_CONCURRENCY)
+_cache_client: Optional[redis.Redis] = None
+
+SYSTEM_PROMPT = ("Sei un Financial Controller. Analizza il testo fornito (che è una raccolta di risultati web) "
+                 "ed estrai l'ultimo deal rilevante in formato JSON.")
+
+
+# ==========================================
+# 1. CACHE DELLE RICERCHE (query, giorno)
+# ==========================================
+def _cache_key(query: str, day: str) -> str:
+    digest = hashlib.sha1(query.strip().lower().encode("utf-8")).hexdigest()
+    return f"{SEARCH_CACHE_PREFIX}:{day}:{digest}"
+
+
+def _cache():
+    global _cache_client
+    if _cache_client is None:
+        _cache_client = redis.Redis.from_url(REDIS_URL, socket_timeout=1)
+    return _cache_client
+
+
+def _cache_get(key: str) -> Optional[Dict]:
+    try:
+        raw = _cache().get(key)
+    except Exception as e:
+        print(f"[Agent] Cache ricerche non disponibile: {e}")
+        return None
+    return json.loads(raw) if raw else None
+
+
+def _cache_set(key: str, value: Dict) -> None:
+    try:
+        _cache().set(key, json.dumps(value), ex=SEARCH_CACHE_TTL_SECONDS)
+    except Exception as e:
+        print(f"[Agent] Impossibile salvare la ricerca in cache: {e}")
 
+
+# ==========================================
+# 2. AGENTE
+# ==========================================
 class StartupAgent:
-    def __init__(self, model="mistral/mistral-large-latest"):
+    def __init__(self, model: str = "mistral-large-latest", api_key: Optional[str] = None,
+                 tavily_api_key: Optional[str] = None):
         self.model = model
+        self.api_key = api_key or os.getenv("MISTRAL_API_KEY", "")
+        # Tavily è gratuito fino a 1000 ricerche/mese, ottimo per testare
+        self.tavily_api_key = tavily_api_key or os.getenv("TAVILY_API_KEY", "")
+        self.retry_budget = resilience.RetryBudget()
 
-    def investigate_company(self, company_name: str):
-        print(f"AGENTE: Inizio indagine su {company_name}...")
+    def search(self, query: str) -> Dict:
+        """Ricerca Tavily, in cache per (query, giorno UTC). Restituisce {'results': [...], 'cached': bool}."""
+        key = _cache_key(query, datetime.now(timezone.utc).date().isoformat())
+        cached = _cache_get(key)
+        if cached is not None:
+            return {**cached, "cached": True}
+        if not self.tavily_api_key:
+            raise ValueError("TAVILY_API_KEY mancante")
+
+        with _search_slots:
+            # Tavily cerca, entra nei siti, e ci ridà il contenuto testuale (il context)
+            r = resilience.http_request("POST", f"{TAVILY_BASE_URL}/search", component="search", key="tavily",
+                                        budget=self.retry_budget, timeout=60, json={
+                "api_key": self.tavily_api_key,
+                "query": query,
+                "search_depth": "advanced",  # Cerca in profondità
+                "max_results": 5,            # Leggi i primi 5 siti
+                "include_raw_content": False,
+            })
+        r.raise_for_status()
+        result = {"results": [{"url": x.get("url"), "content": x.get("content", "")}
+                              for x in r.json().get("results", [])]}
+        _cache_set(key, result)
+        return {**result, "cached": False}
 
-        # PASSO 1: Ricerca Intelligente (The 'Tools')
-        # Chiediamo a Tavily di cercare news recenti, escludendo risultati vecchi
-        query = f"{company_name} space startup contract investment partnership 2024 2025"
-        
-        # Tavily cerca, entra nei siti, e ci ridà il contenuto testuale (il context)
-        search_result = tavily.search(
-            query=query, 
-            search_depth="advanced", # Cerca in profondità
-            max_results=5,           # Leggi i primi 5 siti
-            include_raw_content=False
-        )
-
-        # PASSO 2: Sintesi e Estrazione (The 'Brain')
-        # Uniamo i testi trovati in un unico "dossier"
-        context_text = ""
-        for result in search_result['results']:
-            context_text += f"\n--- SOURCE: {result['url']} ---\n{result['content']}\n"
-
-        print(f"AGENTE: Trovati dati da {len(search_result['results'])} fonti. Analisi Mistral in corso...")
-
-        # PASSO 3: Chiamata a Mistral con il tuo Prompt "Financial Controller"
-        # Usiamo il contesto recuperato dal web dinamico invece che dall'RSS
-        response = completion(
-            model=self.model,
-            messages=[{
-                "role": "system",
-                "content": "Sei un Financial Controller. Analizza il testo fornito (che è una raccolta di risultati web) ed estrai l'ultimo deal rilevante in formato JSON."
-            }, {
-                "role": "user",
-                "content": f"Dossier su {company_name}:\n{context_text}"
-            }]
-        )
+    def synthesize(self, company_name: str, context_text: str) -> str:
+        final_model, api_key, api_base = llm_route(self.model, self.api_key)
+        messages = [
+            {"role": "system", "content": SYSTEM_PROMPT},
+            {"role": "user", "content": f"Dossier su {company_name}:\n{context_text}"},
+        ]
 
+        def attempt():
+            try:
+                with _llm_slots:
+                    return completion(model=final_model, api_key=api_key, api_base=api_base, messages=messages)
+            except Exception as e:
+                retryable = resilience.as_retryable_llm_error(e)
+                if retryable is not None:
+                    raise retryable from e
+                raise
+
+        response = resilience.call_with_retry(attempt, component="llm", key=resilience.llm_provider(self.model),
+                                              budget=self.retry_budget)
         return response.choices[0].message.content
 
-# Esempio di utilizzo
-agent = StartupAgent()
-report = agent.investigate_company("Eoliann")
-print(report)
\ No newline at end of file
+    def investigate(self, company_name: str) -> Dict:
+        """Indagine su una singola azienda; gli errori finiscono nel risultato, non vengono sollevati."""
+        started = time.monotonic()
+        print(f"AGENTE: Inizio indagine su {company_name}...")
+        result = {"company": company_name, "report": None, "sources": [], "search_cached": False, "error": None}
+        try:
+            # PASSO 1: Ricerca Intelligente, escludendo risultati vecchi
+            query = f"{company_name} space startup contract investment partnership 2024 2025"
+            search_result = self.search(query)
+            result["search_cached"] = search_result["cached"]
+            result["sources"] = [x["url"] for x in search_result["results"]]
+
+            # PASSO 2: Uniamo i testi trovati in un unico "dossier"
+            context_text = "".join(f"\n--- SOURCE: {x['url']} ---\n{x['content']}\n" for x in search_result["results"])
+            print(f"AGENTE: {company_name}: dati da {len(result['sources'])} fonti. Analisi LLM in corso...")
+
+            # PASSO 3: Sintesi "Financial Controller" sul contesto recuperato dal web
+            result["report"] = self.synthesize(company_name, context_text)
+        except Exception as e:
+            print(f"AGENTE: Errore su {company_name}: {e}")
+            result["error"] = str(e)
+        result["seconds"] = round(time.monotonic() - started, 3)
+        return result
+
+    def investigate_company(self, company_name: str):
+        """Compatibilità: il solo report (None in caso di errore)."""
+        return self.investigate(company_name)["report"]
+
+    def investigate_companies(self, company_names: List[str]) -> List[Dict]:
+        """Indagine parallela su più aziende (duplicati rimossi), risultati nell'ordine ricevuto."""
+        companies = list(dict.fromkeys(c.strip() for c in company_names if c and c.strip()))
+        if not companies:
+            return []
+        with ThreadPoolExecutor(max_workers=min(MAX_BATCH_WORKERS, len(companies))) as executor:
+            return list(executor.map(self.investigate, companies))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Indagine web + LLM su una o più startup")
+    parser.add_argument("companies", nargs="+")
+    parser.add_argument("--model", default="mistral-large-latest")
+    args = parser.parse_args()
+    for report in StartupAgent(model=args.model).investigate_companies(args.companies):
+        print(json.dumps(report, ensure_ascii=False, indent=2))
+
+
+if __name__ == "__main__":
+    main()
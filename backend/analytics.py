@@ -0,0 +1,265 @@
+"""
+Analytics deal-flow vettoriale.
+
+Il processo API tiene in memoria uno snapshot colonnare (array NumPy) dei deal,
+aggiornato in modo incrementale leggendo solo le righe con updated_at oltre
+l'ultimo watermark. I risultati delle aggregazioni restano in cache finché
+lo snapshot non cambia.
+
+Come heatmap ed export, un deal conta per ogni suo target: search_target più
+i matched_targets delle watchlist.
+"""
+import asyncio
+import os
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List, Optional
+
+import numpy as np
+from sqlalchemy import func, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from models import DealModel
+
+# Ogni quanto (s) controllare se ci sono scritture nuove
+REFRESH_INTERVAL = float(os.getenv("ANALYTICS_REFRESH_INTERVAL", "2"))
+# Sovrapposizione del watermark: copre transazioni lunghe con updated_at "nel passato"
+WATERMARK_OVERLAP = timedelta(seconds=120)
+FREQUENCIES = {"day": "D", "week": "W", "month": "M", "year": "Y"}
+# Le settimane numpy contano dall'epoca 1970-01-01, un giovedì: +3 giorni per partire dal lunedì ISO
+WEEK_SHIFT = np.timedelta64(3, "D")
+
+
+def _periods(day: np.ndarray, freq: str) -> np.ndarray:
+    """Inizio del periodo di ogni giorno (le settimane come data del lunedì)."""
+    if freq == "week":
+        return (day + WEEK_SHIFT).astype("datetime64[W]").astype("datetime64[D]") - WEEK_SHIFT
+    return day.astype(f"datetime64[{FREQUENCIES[freq]}]")
+
+
+def _to_float(value) -> float:
+    if value is None or isinstance(value, bool):
+        return np.nan
+    try:
+        return float(str(value).replace(",", "").strip())
+    except ValueError:
+        return np.nan
+
+
+class _Categories:
+    """Codifica stringhe -> int32 (0 = valore mancante)."""
+
+    def __init__(self):
+        self.labels: List[Optional[str]] = [None]
+        self.codes: Dict[str, int] = {}
+
+    def code(self, label: Optional[str]) -> int:
+        if not label:
+            return 0
+        if label not in self.codes:
+            self.codes[label] = len(self.labels)
+            self.labels.append(label)
+        return self.codes[label]
+
+
+class DealSnapshot:
+    def __init__(self):
+        self.ids = np.empty(0, dtype=np.int64)
+        # Tuple di codici target per deal (search_target + matched_targets)
+        self.target = np.empty(0, dtype=object)
+        self.deal_type = np.empty(0, dtype=np.int32)
+        self.day = np.empty(0, dtype="datetime64[D]")
+        self.amount = np.empty(0, dtype=np.float64)
+        self.relevance = np.empty(0, dtype=np.float64)
+        self.relevant = np.empty(0, dtype=bool)
+        self.targets = _Categories()
+        self.deal_types = _Categories()
+
+        self.watermark: Optional[datetime] = None
+        self.version = 0
+        self._last_check = 0.0
+        self._lock = asyncio.Lock()
+        self._cache: Dict[tuple, object] = {}
+
+    # --- AGGIORNAMENTO INCREMENTALE ---
+    async def refresh(self, db: AsyncSession, force: bool = False) -> None:
+        if not force and time.monotonic() - self._last_check < REFRESH_INTERVAL:
+            return
+        async with self._lock:
+            if not force and time.monotonic() - self._last_check < REFRESH_INTERVAL:
+                return
+            stmt = select(
+                DealModel.id, DealModel.search_target, DealModel.matched_targets, DealModel.is_relevant,
+                func.coalesce(DealModel.published_date, DealModel.created_at),
+                DealModel.updated_at,
+                DealModel.analysis_payload["deal_type"].astext,
+                DealModel.analysis_payload["amount"].astext,
+                DealModel.analysis_payload["relevance_score"].astext,
+            )
+            if self.watermark is not None:
+                stmt = stmt.filter(DealModel.updated_at >= self.watermark - WATERMARK_OVERLAP)
+            rows = (await db.execute(stmt)).all()
+            self._last_check = time.monotonic()
+            if rows:
+                self._merge(rows)
+
+    def _merge(self, rows) -> None:
+        n = len(rows)
+        ids = np.fromiter((r[0] for r in rows), dtype=np.int64, count=n)
+        target = np.empty(n, dtype=object)
+        for i, r in enumerate(rows):
+            names = dict.fromkeys(t for t in [r[1], *(r[2] or [])] if t)
+            target[i] = tuple(self.targets.code(t) for t in names)
+        relevant = np.fromiter((bool(r[3]) for r in rows), dtype=bool, count=n)
+        day = np.array([r[4].date() if r[4] else None for r in rows], dtype="datetime64[D]")
+        deal_type = np.fromiter(
+            (self.deal_types.code((r[6] or "none").lower()) for r in rows), dtype=np.int32, count=n
+        )
+        amount = np.fromiter((_to_float(r[7]) for r in rows), dtype=np.float64, count=n)
+        relevance = np.fromiter((_to_float(r[8]) for r in rows), dtype=np.float64, count=n)
+
+        changed = False
+        # Righe già presenti: aggiornamento sul posto (gli id sono ordinati)
+        pos = np.searchsorted(self.ids, ids)
+        pos_clipped = np.minimum(pos, max(len(self.ids) - 1, 0))
+        existing = (pos < len(self.ids)) & (self.ids[pos_clipped] == ids) if len(self.ids) else np.zeros(n, bool)
+        if existing.any():
+            p = pos[existing]
+            new_cols = (target, relevant, day, deal_type, amount, relevance)
+            old_cols = (self.target, self.relevant, self.day, self.deal_type, self.amount, self.relevance)
+            for old, new in zip(old_cols, new_cols):
+                if not np.array_equal(old[p], new[existing], equal_nan=old.dtype.kind == "f"):
+                    changed = True
+                old[p] = new[existing]
+
+        # Righe nuove: append e riordino per id
+        fresh = ~existing
+        if fresh.any():
+            changed = True
+            self.ids = np.concatenate([self.ids, ids[fresh]])
+            self.target = np.concatenate([self.target, target[fresh]])
+            self.relevant = np.concatenate([self.relevant, relevant[fresh]])
+            self.day = np.concatenate([self.day, day[fresh]])
+            self.deal_type = np.concatenate([self.deal_type, deal_type[fresh]])
+            self.amount = np.concatenate([self.amount, amount[fresh]])
+            self.relevance = np.concatenate([self.relevance, relevance[fresh]])
+            order = np.argsort(self.ids, kind="stable")
+            for name in ("ids", "target", "relevant", "day", "deal_type", "amount", "relevance"):
+                setattr(self, name, getattr(self, name)[order])
+
+        latest = max((r[5] for r in rows if r[5] is not None), default=None)
+        if latest and (self.watermark is None or latest > self.watermark):
+            self.watermark = latest
+        if changed:
+            self.version += 1
+            self._cache.clear()
+
+    # --- CACHE DEI RISULTATI ---
+    def cached(self, key: tuple, compute):
+        if key not in self._cache:
+            self._cache[key] = compute()
+        return self._cache[key]
+
+    def _pairs(self):
+        """Coppie (riga, codice target), una per ogni target del deal; ricalcolate a ogni versione."""
+        def build():
+            lengths = np.fromiter((len(t) for t in self.target), dtype=np.int64, count=len(self.target))
+            rows = np.repeat(np.arange(len(self.target)), lengths)
+            codes = np.fromiter((c for t in self.target for c in t), dtype=np.int32, count=int(lengths.sum()))
+            return rows, codes
+        return self.cached(("_pairs", self.version), build)
+
+    def _target_codes(self, targets: List[str]) -> List[int]:
+        return [self.targets.codes[t] for t in targets if t in self.targets.codes]
+
+    def _mask(self, targets: Optional[List[str]], relevant_only: bool) -> np.ndarray:
+        """Deal da considerare: con `targets`, quelli che ne citano almeno uno."""
+        mask = ~np.isnat(self.day)
+        if relevant_only:
+            mask &= self.relevant
+        if targets:
+            rows, codes = self._pairs()
+            hit = np.zeros(len(mask), dtype=bool)
+            hit[rows[np.isin(codes, self._target_codes(targets))]] = True
+            mask &= hit
+        return mask
+
+    def _expand(self, mask: np.ndarray, targets: Optional[List[str]]):
+        """(righe, codici target) dei deal in `mask`, un elemento per target (solo quelli richiesti)."""
+        rows, codes = self._pairs()
+        sel = mask[rows]
+        if targets:
+            sel &= np.isin(codes, self._target_codes(targets))
+        return rows[sel], codes[sel]
+
+    # --- AGGREGAZIONI ---
+    def volume_over_time(self, freq: str = "month", targets: Optional[List[str]] = None,
+                         relevant_only: bool = True) -> List[Dict]:
+        """Numero di deal e importo totale per (target, periodo)."""
+        rows, target = self._expand(self._mask(targets, relevant_only), targets)
+        period = _periods(self.day[rows], freq)
+        amount = np.nan_to_num(self.amount[rows])
+        if period.size == 0:
+            return []
+
+        period_int = period.astype(np.int64)
+        keys, inverse = np.unique(np.stack([target.astype(np.int64), period_int]), axis=1, return_inverse=True)
+        inverse = inverse.ravel()
+        counts = np.bincount(inverse)
+        totals = np.bincount(inverse, weights=amount)
+        periods = keys[1].astype(period.dtype)
+        return [
+            {"target": self.targets.labels[t], "period": str(p), "deals": int(c), "amount": float(a)}
+            for t, p, c, a in zip(keys[0], periods, counts, totals)
+        ]
+
+    def deal_type_mix(self, targets: Optional[List[str]] = None, relevant_only: bool = True) -> List[Dict]:
+        """Distribuzione dei deal_type (conteggio e quota)."""
+        mask = self._mask(targets, relevant_only)
+        codes = self.deal_type[mask]
+        if codes.size == 0:
+            return []
+        counts = np.bincount(codes, minlength=len(self.deal_types.labels))
+        total = counts.sum()
+        mix = [
+            {"deal_type": self.deal_types.labels[c] or "none", "deals": int(n), "share": round(float(n / total), 4)}
+            for c, n in enumerate(counts) if n
+        ]
+        return sorted(mix, key=lambda x: x["deals"], reverse=True)
+
+    def moving_scores(self, window_days: int = 90, targets: Optional[List[str]] = None,
+                      days: int = 365) -> List[Dict]:
+        """
+        Punteggio su finestra mobile per target, con la stessa formula della heatmap:
+        relevance * 3 (+2 se l'importo supera 1M), sommato sugli ultimi `window_days` giorni.
+        """
+        mask = self._mask(targets, relevant_only=True)
+        if not mask.any():
+            return []
+        end = np.datetime64(datetime.now(timezone.utc).date(), "D")
+        start = end - np.timedelta64(days + window_days, "D")
+        mask &= (self.day >= start) & (self.day <= end)
+
+        rows, target = self._expand(mask, targets)
+        day_idx = (self.day[rows] - start).astype(np.int64)
+        points = np.nan_to_num(self.relevance[rows], nan=0.5) * 3.0 + np.where(self.amount[rows] > 1_000_000, 2.0, 0.0)
+        n_days = days + window_days + 1
+        dates = [str(d) for d in np.arange(end - np.timedelta64(days, "D"), end + np.timedelta64(1, "D"))]
+
+        results = []
+        for t in np.unique(target):
+            sel = target == t
+            daily = np.bincount(day_idx[sel], weights=points[sel], minlength=n_days)
+            cumulative = np.concatenate([[0.0], np.cumsum(daily)])
+            rolling = cumulative[window_days:] - cumulative[:-window_days]
+            rolling = rolling[-(days + 1):]
+            results.append({
+                "target": self.targets.labels[t],
+                "window_days": window_days,
+                "dates": dates,
+                "scores": np.round(rolling, 2).tolist(),
+            })
+        return results
+
+
+snapshot = DealSnapshot()
@@ -0,0 +1,119 @@
+"""
+Archivio degli articoli scaricati, per rianalizzare senza riscaricare dalle sorgenti.
+
+- Al fetch (`SpaceScraperService.scrape`) ogni articolo viene archiviato: metadati in
+  archived_articles (uno per URL), HTML in raw_contents indirizzato per contenuto (sha256),
+  compresso zlib come nel record in memoria (articles.Article), quindi senza ricomprimere.
+- La rianalisi (`SpaceScraperService.reanalyze`, task execute_reanalyze_task) legge in
+  streaming gli articoli che rientrano nei filtri di ScrapeSettings (date e sorgenti; i target
+  vengono confrontati col testo) e li manda direttamente all'analisi: cambiare prompt o
+  modello diventa un lavoro solo LLM, anche offline.
+"""
+import hashlib
+import os
+import zlib
+from datetime import date, datetime, timedelta, timezone
+from typing import Iterator, List
+
+from sqlalchemy import literal_column, or_
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.orm import Session
+
+from articles import Article
+from database import SessionLocal
+from models import ArchivedArticleModel, RawContentModel, ScrapeSettings
+
+ARCHIVE_ENABLED = os.getenv("ARCHIVE_RAW_ARTICLES", "1") == "1"
+REANALYZE_CONCURRENCY = int(os.getenv("REANALYZE_CONCURRENCY", "4"))
+WRITE_BATCH = 500
+STREAM_BATCH = 200
+
+
+# ==========================================
+# 1. SCRITTURA (al fetch)
+# ==========================================
+def archive_articles(db: Session, articles: List[Article], parse_date) -> int:
+    """
+    Archivia gli articoli (URL già deduplicati). Un URL riscaricato aggiorna metadati e
+    contenuto; i target trovati si sommano a quelli già noti. Restituisce gli articoli archiviati.
+    """
+    archived = 0
+    for i in range(0, len(articles), WRITE_BATCH):
+        contents, rows = {}, []
+        for art in articles[i:i + WRITE_BATCH]:
+            blob = art.raw_blob
+            if not art.url or blob is None:
+                continue
+            raw = zlib.decompress(blob)
+            content_hash = hashlib.sha256(raw).hexdigest()
+            contents[content_hash] = {"content_hash": content_hash, "data": blob, "size": len(raw)}
+            rows.append({
+                "url": art.url,
+                "source": art.source,
+                "source_labels": list(art.source_labels),
+                "title": art.title,
+                "date_raw": art.date,
+                "published_date": parse_date(art.date),
+                "matched_targets": list(art.matched_targets),
+                "content_hash": content_hash,
+            })
+        if not rows:
+            continue
+
+        db.execute(insert(RawContentModel).values(list(contents.values()))
+                   .on_conflict_do_nothing(index_elements=["content_hash"]))
+        stmt = insert(ArchivedArticleModel).values(rows)
+        db.execute(stmt.on_conflict_do_update(index_elements=["url"], set_={
+            "content_hash": stmt.excluded.content_hash,
+            "title": stmt.excluded.title,
+            "date_raw": stmt.excluded.date_raw,
+            "published_date": stmt.excluded.published_date,
+            "source_labels": stmt.excluded.source_labels,
+            "matched_targets": literal_column(
+                "ARRAY(SELECT DISTINCT unnest(archived_articles.matched_targets || excluded.matched_targets))"
+            ),
+            "fetched_at": literal_column("now()"),
+        }))
+        db.commit()
+        archived += len(rows)
+    return archived
+
+
+# ==========================================
+# 2. LETTURA (rianalisi)
+# ==========================================
+def iter_archived(settings: ScrapeSettings) -> Iterator[Article]:
+    """
+    Articoli archiviati nella finestra di date e nelle sorgenti di `settings`, dal più recente,
+    letti a blocchi con una sessione dedicata (il chiamante può fare commit sulla sua).
+    Le date illeggibili restano incluse, come nel filtro lato client degli adapter.
+    """
+    sources = [s.value for s in settings.sources]
+    start, end = settings.date_window()
+    db = SessionLocal()
+    try:
+        query = (
+            db.query(ArchivedArticleModel.source, ArchivedArticleModel.url, ArchivedArticleModel.title,
+                     ArchivedArticleModel.date_raw, ArchivedArticleModel.matched_targets,
+                     ArchivedArticleModel.source_labels, RawContentModel.data)
+            .join(RawContentModel, RawContentModel.content_hash == ArchivedArticleModel.content_hash)
+            .filter(or_(ArchivedArticleModel.source.in_(sources), ArchivedArticleModel.source_labels.overlap(sources)))
+        )
+        if start:
+            query = query.filter(or_(ArchivedArticleModel.published_date.is_(None),
+                                     ArchivedArticleModel.published_date >= _utc(start)))
+        if end:
+            query = query.filter(or_(ArchivedArticleModel.published_date.is_(None),
+                                     ArchivedArticleModel.published_date < _utc(end + timedelta(days=1))))
+        query = query.order_by(ArchivedArticleModel.published_date.desc().nullslast(), ArchivedArticleModel.id)
+
+        for row in query.yield_per(STREAM_BATCH):
+            yield Article.from_archive(row.source, row.url, row.title, row.date_raw, row.data,
+                                       matched_targets=row.matched_targets or (),
+                                       source_labels=row.source_labels or ())
+    finally:
+        db.close()
+
+
+def _utc(day: date) -> datetime:
+    return datetime.combine(day, datetime.min.time(), tzinfo=timezone.utc)
@@ -0,0 +1,109 @@
+"""
+Rappresentazione compatta degli articoli in lavorazione in `SpaceScraperService.scrape`.
+
+Un run tiene in memoria tutti gli articoli scaricati fino alla fine dell'analisi:
+- sorgenti ed etichette sono stringhe/tuple internate (una sola copia per run);
+- l'HTML grezzo è conservato compresso (zlib, UTF-8) e viene scartato appena pulito;
+- il testo pulito resta compresso fino alla chiamata LLM e viene rilasciato dopo la scrittura nel DB.
+
+Benchmark della memoria: benchmarks/memory_bench.py.
+"""
+import sys
+import zlib
+from typing import Dict, Iterable, Optional, Tuple
+
+from bs4 import BeautifulSoup
+
+# Livello 1: compressione ~3-5x sull'HTML, costo trascurabile rispetto al parsing
+COMPRESS_LEVEL = 1
+
+# Tuple di etichette distinte tenute in cache (il worker vive per molti run)
+LABELS_CACHE_MAX = 4096
+
+_labels_cache: Dict[Tuple[str, ...], Tuple[str, ...]] = {}
+
+
+def intern_labels(labels: Iterable[str]) -> Tuple[str, ...]:
+    """Tupla di etichette internate; tuple uguali sono lo stesso oggetto."""
+    key = tuple(sys.intern(str(label)) for label in labels)
+    cached = _labels_cache.get(key)
+    if cached is None:
+        if len(_labels_cache) >= LABELS_CACHE_MAX:
+            # Si riparte da zero: le tuple già assegnate agli articoli restano valide
+            _labels_cache.clear()
+        cached = _labels_cache[key] = key
+    return cached
+
+
+def _pack(text: Optional[str]) -> bytes:
+    return zlib.compress((text or "").encode("utf-8"), COMPRESS_LEVEL)
+
+
+def _unpack(data: Optional[bytes]) -> str:
+    return zlib.decompress(data).decode("utf-8") if data else ""
+
+
+def clean_html(raw_html: str) -> str:
+    """Testo leggibile dell'articolo (senza script/style)."""
+    soup = BeautifulSoup(raw_html, "html.parser")
+    for s in soup(["script", "style"]):
+        s.decompose()
+    return soup.get_text(separator=" ", strip=True)
+
+
+class Article:
+    __slots__ = ("source", "url", "title", "date", "source_labels", "matched_targets", "target_hit",
+                 "_raw", "_text")
+
+    def __init__(self, source: str, url: str, title: str, date: str, raw_content: str,
+                 matched_targets: Iterable[str] = (), target_hit: bool = False,
+                 source_labels: Iterable[str] = ()):
+        self.source = sys.intern(source)
+        self.url = url
+        self.title = title
+        self.date = date
+        self.source_labels = intern_labels(source_labels or (source,))
+        self.matched_targets = intern_labels(matched_targets)
+        self.target_hit = target_hit
+        self._raw: Optional[bytes] = _pack(raw_content)
+        self._text: Optional[bytes] = None
+
+    @classmethod
+    def from_archive(cls, source: str, url: str, title: str, date: str, blob: bytes,
+                     matched_targets: Iterable[str] = (), source_labels: Iterable[str] = ()) -> "Article":
+        """Record da un contenuto dell'archivio (blob già compresso, vedi archive.py)."""
+        article = cls(source, url, title, date, "", matched_targets=matched_targets, target_hit=True,
+                      source_labels=source_labels)
+        article._raw = blob
+        return article
+
+    @property
+    def raw_blob(self) -> Optional[bytes]:
+        """HTML grezzo compresso (None se già pulito)."""
+        return self._raw
+
+    @property
+    def raw_content(self) -> str:
+        """HTML grezzo (vuoto se l'articolo è già stato pulito)."""
+        return _unpack(self._raw)
+
+    def clean(self, cleaner=clean_html) -> str:
+        """Pulisce l'HTML una volta sola: da qui in poi resta solo il testo (compresso)."""
+        if self._text is None:
+            self._text = _pack(cleaner(_unpack(self._raw)))
+            self._raw = None
+        return _unpack(self._text)
+
+    def release(self) -> None:
+        """Articolo elaborato: libera HTML e testo, restano solo i metadati."""
+        self._raw = None
+        self._text = None
+
+    def merge(self, other: "Article") -> None:
+        """Stesso URL da un'altra sorgente: unione di sorgenti e target."""
+        self.source_labels = intern_labels(dict.fromkeys(self.source_labels + other.source_labels))
+        self.matched_targets = intern_labels(dict.fromkeys(self.matched_targets + other.matched_targets))
+        self.target_hit = self.target_hit or other.target_hit
+
+    def __repr__(self) -> str:
+        return f"Article({self.source!r}, {self.url!r})"
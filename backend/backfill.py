@@ -0,0 +1,245 @@
+"""
+Backfill storico a chunk con checkpoint in Postgres.
+
+Un job (intervallo di date x target x sorgenti) viene diviso in chunk mensili
+(backfill_chunks). Ogni chunk è un task Celery indipendente sulla coda bulk:
+- prima di partire il chunk viene "reclamato" con un UPDATE condizionale, così un
+  chunk duplicato in coda (resume ripetuti, redelivery) non gira due volte;
+- a fine chunk lo stato diventa `done` e non viene più rieseguito;
+- dopo un crash o un riavvio, resume ridistribuisce tutto ciò che non è `done`
+  (i deal già salvati vengono saltati dal controllo sull'URL nel DB).
+
+Uso da riga di comando (dalla cartella backend):
+    python backfill.py resume [--job 12]
+    python backfill.py status --job 12
+"""
+import argparse
+import os
+from datetime import date, datetime, timedelta, timezone
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy import and_, func, or_, select
+from sqlalchemy.orm import Session
+
+from models import BackfillChunkModel, BackfillJobModel, BackfillRequest, ScrapeSettings
+
+# Un chunk "running" senza aggiornamenti da più di così è considerato orfano (worker morto)
+STALE_RUNNING_SECONDS = int(os.getenv("BACKFILL_STALE_SECONDS", str(2 * 3600)))
+MAX_CHUNKS_PER_JOB = int(os.getenv("BACKFILL_MAX_CHUNKS", "5000"))
+
+CLAIMABLE = ("pending", "queued", "failed")
+
+
+# ==========================================
+# 1. PIANIFICAZIONE
+# ==========================================
+def month_periods(date_from: date, date_to: date) -> List[Tuple[date, date]]:
+    """[(inizio, fine)] inclusivi, un periodo per mese di calendario."""
+    periods = []
+    start = date_from
+    while start <= date_to:
+        next_month = (start.replace(day=1) + timedelta(days=32)).replace(day=1)
+        end = min(next_month - timedelta(days=1), date_to)
+        periods.append((start, end))
+        start = next_month
+    return periods
+
+
+def plan_chunks(settings: ScrapeSettings, date_from: date, date_to: date) -> List[Dict]:
+    # Watchlist: un chunk per (sorgente, mese) con tutti i target, i feed si scaricano una volta
+    targets = [settings.target_companies] if settings.is_watchlist() else settings.target_list()
+    sources = list(dict.fromkeys(s.value for s in settings.sources))
+    return [
+        {"target": target, "source": source, "period_start": start, "period_end": end}
+        for start, end in month_periods(date_from, date_to)
+        for target in targets
+        for source in sources
+    ]
+
+
+def create_job(db: Session, request: BackfillRequest) -> BackfillJobModel:
+    if request.date_from > request.date_to:
+        raise ValueError("date_from deve precedere date_to")
+    chunks = plan_chunks(request.settings, request.date_from, request.date_to)
+    if not chunks:
+        raise ValueError("Nessun chunk: servono almeno un target e una sorgente")
+    if len(chunks) > MAX_CHUNKS_PER_JOB:
+        raise ValueError(f"Backfill troppo grande ({len(chunks)} chunk, massimo {MAX_CHUNKS_PER_JOB})")
+
+    base_settings = request.settings.model_dump(mode="json", exclude={"date_from", "date_to"})
+    job = BackfillJobModel(settings=base_settings, date_from=request.date_from, date_to=request.date_to)
+    db.add(job)
+    db.flush()
+    db.add_all(BackfillChunkModel(job_id=job.id, **chunk) for chunk in chunks)
+    db.commit()
+    db.refresh(job)
+    return job
+
+
+# ==========================================
+# 2. CHECKPOINT
+# ==========================================
+def _now():
+    return datetime.now(timezone.utc)
+
+
+def resumable_chunk_ids(db: Session, job_id: Optional[int] = None, automatic: bool = False) -> List[int]:
+    """
+    Chunk da (ri)mettere in coda: tutto ciò che non è done, tranne i running ancora vivi.
+    `automatic` (ripresa all'avvio del worker): solo pending e running orfani; i queued sono
+    già nel broker e i failed si riprendono esplicitamente, per non ripetere errori permanenti.
+    """
+    stale_before = _now() - timedelta(seconds=STALE_RUNNING_SECONDS)
+    statuses = ("pending",) if automatic else CLAIMABLE
+    query = (
+        db.query(BackfillChunkModel.id)
+        .join(BackfillJobModel, BackfillJobModel.id == BackfillChunkModel.job_id)
+        .filter(BackfillJobModel.status == "running")
+        .filter(or_(
+            BackfillChunkModel.status.in_(statuses),
+            and_(BackfillChunkModel.status == "running", BackfillChunkModel.updated_at < stale_before),
+        ))
+    )
+    if job_id is not None:
+        query = query.filter(BackfillChunkModel.job_id == job_id)
+    return [row.id for row in query.order_by(BackfillChunkModel.period_start.desc(), BackfillChunkModel.id)]
+
+
+def mark_queued(db: Session, chunk_ids: List[int]) -> None:
+    if not chunk_ids:
+        return
+    (db.query(BackfillChunkModel)
+       .filter(BackfillChunkModel.id.in_(chunk_ids), BackfillChunkModel.status.in_(("pending", "failed")))
+       .update({"status": "queued", "updated_at": _now()}, synchronize_session=False))
+    db.commit()
+
+
+def claim_chunk(db: Session, chunk_id: int, task_id: str) -> Optional[BackfillChunkModel]:
+    """Passa il chunk a running in modo atomico. None se è già done, in esecuzione altrove o il job è fermo."""
+    stale_before = _now() - timedelta(seconds=STALE_RUNNING_SECONDS)
+    active_job = select(BackfillJobModel.id).where(BackfillJobModel.status == "running")
+    claimed = (
+        db.query(BackfillChunkModel)
+        .filter(BackfillChunkModel.id == chunk_id)
+        .filter(BackfillChunkModel.job_id.in_(active_job))
+        .filter(or_(
+            BackfillChunkModel.status.in_(CLAIMABLE),
+            and_(BackfillChunkModel.status == "running", BackfillChunkModel.updated_at < stale_before),
+        ))
+        .update({
+            "status": "running",
+            "task_id": task_id,
+            "attempts": BackfillChunkModel.attempts + 1,
+            "error": None,
+            "updated_at": _now(),
+        }, synchronize_session=False)
+    )
+    db.commit()
+    if not claimed:
+        return None
+    return db.get(BackfillChunkModel, chunk_id)
+
+
+def chunk_settings(db: Session, chunk: BackfillChunkModel) -> ScrapeSettings:
+    job = db.get(BackfillJobModel, chunk.job_id)
+    return ScrapeSettings(**{
+        **job.settings,
+        "target_companies": chunk.target,
+        "sources": [chunk.source],
+        "date_from": chunk.period_start,
+        "date_to": chunk.period_end,
+    })
+
+
+def _set_chunk(db: Session, chunk_id: int, **values) -> None:
+    (db.query(BackfillChunkModel)
+       .filter(BackfillChunkModel.id == chunk_id)
+       .update({**values, "updated_at": _now()}, synchronize_session=False))
+    db.commit()
+
+
+def complete_chunk(db: Session, chunk_id: int, results_count: int) -> None:
+    _set_chunk(db, chunk_id, status="done", results_count=results_count)
+    chunk = db.get(BackfillChunkModel, chunk_id)
+    remaining = (db.query(func.count(BackfillChunkModel.id))
+                   .filter(BackfillChunkModel.job_id == chunk.job_id, BackfillChunkModel.status != "done")
+                   .scalar())
+    if remaining == 0:
+        (db.query(BackfillJobModel)
+           .filter(BackfillJobModel.id == chunk.job_id, BackfillJobModel.status == "running")
+           .update({"status": "completed"}, synchronize_session=False))
+        db.commit()
+        print(f"[Backfill] Job {chunk.job_id} completato.")
+
+
+def release_chunk(db: Session, chunk_id: int) -> None:
+    """Chunk interrotto (scadenza/cancellazione): torna pending, i deal già salvati restano."""
+    _set_chunk(db, chunk_id, status="pending")
+
+
+def fail_chunk(db: Session, chunk_id: int, error: str) -> None:
+    _set_chunk(db, chunk_id, status="failed", error=error[:2000])
+
+
+def set_job_status(db: Session, job_id: int, status: str) -> bool:
+    updated = (db.query(BackfillJobModel)
+                 .filter(BackfillJobModel.id == job_id)
+                 .update({"status": status}, synchronize_session=False))
+    db.commit()
+    return bool(updated)
+
+
+def job_progress(db: Session, job_id: int) -> Optional[Dict]:
+    job = db.get(BackfillJobModel, job_id)
+    if job is None:
+        return None
+    counts = dict(
+        db.query(BackfillChunkModel.status, func.count(BackfillChunkModel.id))
+          .filter(BackfillChunkModel.job_id == job_id)
+          .group_by(BackfillChunkModel.status)
+          .all()
+    )
+    total = sum(counts.values())
+    results = (db.query(func.coalesce(func.sum(BackfillChunkModel.results_count), 0))
+                 .filter(BackfillChunkModel.job_id == job_id).scalar())
+    return {
+        "job_id": job.id,
+        "status": job.status,
+        "date_from": job.date_from.isoformat(),
+        "date_to": job.date_to.isoformat(),
+        "chunks_total": total,
+        "chunks": counts,
+        "progress": round(counts.get("done", 0) / total, 4) if total else 0.0,
+        "relevant_results": int(results),
+    }
+
+
+# ==========================================
+# 3. CLI
+# ==========================================
+def main():
+    from database import SessionLocal
+    from worker import dispatch_backfill_chunks
+
+    parser = argparse.ArgumentParser(description="Backfill storico a chunk")
+    sub = parser.add_subparsers(dest="command", required=True)
+    resume = sub.add_parser("resume", help="rimette in coda i chunk non completati")
+    resume.add_argument("--job", type=int, help="solo questo job (default: tutti i job attivi)")
+    status = sub.add_parser("status", help="avanzamento di un job")
+    status.add_argument("--job", type=int, required=True)
+    args = parser.parse_args()
+
+    db = SessionLocal()
+    try:
+        if args.command == "resume":
+            chunk_ids = resumable_chunk_ids(db, args.job)
+            dispatch_backfill_chunks(db, chunk_ids)
+            print(f"Rimessi in coda {len(chunk_ids)} chunk.")
+        else:
+            print(job_progress(db, args.job))
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    main()
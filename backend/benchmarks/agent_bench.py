@@ -0,0 +1,72 @@
+"""
+Benchmark offline di `StartupAgent`: indagine sequenziale vs batch parallelo.
+
+Ricerca Tavily e LLM sono serviti dallo stub locale (vedi `stubs.py`) con latenze
+simulate. Dalla cartella backend/:
+
+    python -m benchmarks.agent_bench --companies ICEYE "Rocket Lab" D-Orbit Eoliann \\
+        --search-latency 1.5 --llm-latency 3 --output agent.json
+
+Con Redis raggiungibile (REDIS_URL) il secondo passaggio batch legge le ricerche dalla cache.
+"""
+import argparse
+import json
+import os
+import sys
+import time
+from typing import Dict
+
+from benchmarks.stubs import StubConfig, StubServer
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark offline dell'agente di indagine")
+    parser.add_argument("--companies", nargs="+", default=["ICEYE", "Rocket Lab", "D-Orbit", "Eoliann"])
+    parser.add_argument("--model", default="stub-model")
+    parser.add_argument("--search-latency", type=float, default=1.0, help="latenza ricerca simulata (s)")
+    parser.add_argument("--llm-latency", type=float, default=2.0, help="latenza LLM simulata (s)")
+    parser.add_argument("--output", help="file JSON in cui salvare i risultati")
+    return parser.parse_args(argv)
+
+
+def timed(stub: StubServer, fn) -> Dict:
+    stub.state.reset()
+    started = time.perf_counter()
+    reports = fn()
+    return {
+        "elapsed_s": round(time.perf_counter() - started, 3),
+        "errors": sum(1 for r in reports if r["error"]),
+        "search_cached": sum(1 for r in reports if r["search_cached"]),
+        "search_calls": stub.state.counters.get("search_calls", 0),
+        "llm_calls": stub.state.counters.get("llm_calls", 0),
+        "slowest_company_s": max((r["seconds"] for r in reports), default=0.0),
+    }
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    config = StubConfig(llm_latency=args.llm_latency, search_latency=args.search_latency)
+    with StubServer(config) as stub:
+        os.environ.update(stub.env())
+        # Import tardivo: deve vedere le variabili d'ambiente dello stub
+        from agent_service import StartupAgent
+
+        agent = StartupAgent(model=args.model, api_key="stub-key")
+        results = {
+            "sequential": timed(stub, lambda: [agent.investigate(c) for c in args.companies]),
+            "batch": timed(stub, lambda: agent.investigate_companies(args.companies)),
+        }
+
+    print("\n=== AGENT BENCHMARK ===")
+    for name, res in results.items():
+        print(f"{name:>10}: {res}")
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump({"args": vars(args), "results": results}, f, indent=2)
+        print(f"[Bench] Risultati salvati in {args.output}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
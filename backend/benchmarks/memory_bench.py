@@ -0,0 +1,180 @@
+"""
+Benchmark della memoria degli articoli in lavorazione (tracemalloc).
+
+Confronta, per N articoli sintetici costruiti dalle fixture di `cache_deals/`:
+- `dict`: la rappresentazione precedente (dict per articolo, HTML grezzo tenuto fino a fine run);
+- `compact`: `articles.Article` (slot, etichette internate, HTML compresso e scartato dopo la
+  pulizia, coda consumata man mano come in `SpaceScraperService.scrape`).
+
+Per ogni variante misura la memoria trattenuta dopo il download (tutti gli articoli in coda)
+e il picco dell'intero run (download + pulizia sequenziale). Dalla cartella backend/:
+
+    python -m benchmarks.memory_bench --sizes 10000 100000 --output memory.json
+
+Con --cleaner bs4 si usa la stessa pulizia della pipeline (BeautifulSoup, molto più lenta).
+
+Nota: il riempimento sintetico (un link ripetuto) si comprime molto meglio delle pagine reali e
+i feed analizzati tenuti dal coalescer durante il download non sono inclusi: i numeri sono un
+limite superiore del risparmio, non una base per dimensionare la concorrenza dei worker.
+"""
+import argparse
+import gc
+import json
+import re
+import sys
+import time
+import tracemalloc
+from collections import deque
+from typing import Callable, Dict, List
+
+from articles import Article, clean_html, intern_labels
+from benchmarks.stubs import _fixture_date, _fixture_html, load_fixtures
+
+SOURCES = ["SpaceNews", "SNAPI", "Via Satellite", "NASA TechPort"]
+TAG_RE = re.compile(r"<script.*?</script>|<style.*?</style>|<[^>]+>", re.S)
+
+# Pagina tipica di un feed completo: navigazione, script e widget attorno al testo dell'articolo
+PAGE_TEMPLATE = (
+    "<div class=\"site-header\"><nav>{nav}</nav></div>"
+    "<script>window.dataLayer = window.dataLayer || []; {script}</script>"
+    "<style>.entry-content p {{ margin: 0 0 1em; }} {style}</style>"
+    "<article class=\"entry-content\">{body}<p>“Ref. {n}” – continua a leggere…</p></article>"
+    "<div class=\"share\">{share}</div>"
+)
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark della memoria degli articoli in lavorazione")
+    parser.add_argument("--sizes", nargs="+", type=int, default=[10000, 100000])
+    parser.add_argument("--variants", nargs="+", choices=["dict", "compact"], default=["dict", "compact"])
+    parser.add_argument("--html-kb", type=float, default=6.0, help="dimensione indicativa dell'HTML per articolo")
+    parser.add_argument("--targets", default="ICEYE, Rocket Lab, Isar Aerospace")
+    parser.add_argument("--cleaner", choices=["regex", "bs4"], default="regex")
+    parser.add_argument("--output", help="file JSON in cui salvare i risultati")
+    return parser.parse_args(argv)
+
+
+def regex_clean(raw_html: str) -> str:
+    return " ".join(TAG_RE.sub(" ", raw_html).split())
+
+
+def synthetic_html(fx: Dict, n: int, html_kb: float) -> str:
+    body = _fixture_html(fx)
+    pad = max(0, int(html_kb * 1024) - len(body) - 400)
+    filler = (f"<a href=\"/category/{n % 97}\">Launch</a> " * (pad // 160 + 1))[: pad // 4]
+    return PAGE_TEMPLATE.format(nav=filler, script=filler, style=filler, share=filler, body=body, n=n)
+
+
+def article_fields(fixtures: List[Dict], n: int, html_kb: float, targets: List[str]) -> Dict:
+    fx = fixtures[n % len(fixtures)]
+    return {
+        "source": SOURCES[n % len(SOURCES)],
+        "url": f"{fx['url']}?n={n}",
+        "title": fx.get("title") or "",
+        "date": _fixture_date(fx),
+        "raw_content": synthetic_html(fx, n, html_kb),
+        "matched_targets": [targets[n % len(targets)].upper()],
+    }
+
+
+# ==========================================
+# VARIANTI
+# ==========================================
+def build_dict(fields: Dict) -> Dict:
+    fields["target_hit"] = True
+    fields["source_labels"] = [fields["source"]]
+    return fields
+
+
+def build_compact(fields: Dict) -> Article:
+    return Article(fields["source"], fields["url"], fields["title"], fields["date"], fields["raw_content"],
+                   matched_targets=fields["matched_targets"], target_hit=True,
+                   source_labels=intern_labels([fields["source"]]))
+
+
+def process_dict(batch: List[Dict], cleaner: Callable) -> int:
+    # Come la pipeline precedente: la lista resta viva (con l'HTML) fino a fine run
+    chars = 0
+    for art in batch:
+        chars += len(cleaner(art["raw_content"]))
+    return chars
+
+
+def process_compact(batch: List[Article], cleaner: Callable) -> int:
+    pending = deque(batch)
+    batch.clear()
+    chars = 0
+    while pending:
+        art = pending.popleft()
+        chars += len(art.clean(cleaner))
+    return chars
+
+
+VARIANTS = {
+    "dict": (build_dict, process_dict),
+    "compact": (build_compact, process_compact),
+}
+
+
+def run_variant(name: str, size: int, args, fixtures: List[Dict]) -> Dict:
+    build, process = VARIANTS[name]
+    targets = [t.strip() for t in args.targets.split(",") if t.strip()]
+    cleaner = clean_html if args.cleaner == "bs4" else regex_clean
+
+    gc.collect()
+    tracemalloc.start()
+    started = time.perf_counter()
+    batch = [build(article_fields(fixtures, n, args.html_kb, targets)) for n in range(size)]
+    fetched_s = time.perf_counter() - started
+    retained, _ = tracemalloc.get_traced_memory()
+    chars = process(batch, cleaner)
+    elapsed = time.perf_counter() - started
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del batch
+    gc.collect()
+
+    return {
+        "variant": name,
+        "articles": size,
+        "retained_mb": round(retained / 1024 / 1024, 2),
+        "bytes_per_article": round(retained / size),
+        "peak_mb": round(peak / 1024 / 1024, 2),
+        "build_s": round(fetched_s, 3),
+        "elapsed_s": round(elapsed, 3),
+        "clean_chars": chars,
+    }
+
+
+def print_report(results: List[Dict]):
+    print("\n=== MEMORY BENCHMARK ===")
+    print(f"{'variant':>8} {'articles':>9} {'retained MB':>12} {'B/article':>10} {'peak MB':>9} {'elapsed s':>10}")
+    for r in results:
+        print(f"{r['variant']:>8} {r['articles']:>9} {r['retained_mb']:>12} {r['bytes_per_article']:>10} "
+              f"{r['peak_mb']:>9} {r['elapsed_s']:>10}")
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    fixtures = load_fixtures()
+    if not fixtures:
+        print("Nessuna fixture in cache_deals/")
+        return 2
+
+    results = []
+    for size in args.sizes:
+        for name in args.variants:
+            res = run_variant(name, size, args, fixtures)
+            print(f"[Bench] {res}")
+            results.append(res)
+    print_report(results)
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump({"args": vars(args), "results": results}, f, indent=2)
+        print(f"[Bench] Risultati salvati in {args.output}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,272 @@
+"""
+Stub locali per i benchmark offline.
+
+Un unico server HTTP (ThreadingHTTPServer) risponde al posto di:
+- SpaceNews / Via Satellite (feed RSS),
+- SNAPI e NASA TechPort (API JSON),
+- provider LLM OpenAI-compatibile (/v1/chat/completions),
+- ricerca Tavily (/tavily/search) usata da agent_service.py.
+
+I contenuti sono ricostruiti dai payload registrati in `cache_deals/`.
+"""
+import json
+import random
+import re
+import threading
+import time
+from dataclasses import dataclass
+from email.utils import format_datetime
+from datetime import datetime, timezone
+from html import escape
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import Dict, List, Optional
+from urllib.parse import urlparse, parse_qs
+
+FIXTURES_DIR = Path(__file__).resolve().parent.parent / "cache_deals"
+URL_RE = re.compile(r"URL:\s*(\S+)")
+
+
+def load_fixtures(cache_dir: Path = FIXTURES_DIR) -> List[Dict]:
+    """Carica i payload registrati (uno per file JSON), ordinati per nome file."""
+    fixtures = []
+    for p in sorted(cache_dir.glob("*.json")):
+        try:
+            data = json.loads(p.read_text(encoding="utf-8"))
+        except Exception:
+            continue
+        if data.get("url"):
+            fixtures.append(data)
+    return fixtures
+
+
+def _fixture_html(fx: Dict) -> str:
+    # Testo dell'articolo: summary + why_it_matters (abbastanza lungo da superare il filtro dei 100 caratteri)
+    parts = [fx.get("title") or "", fx.get("summary") or "", fx.get("why_it_matters") or ""]
+    return "".join(f"<p>{escape(p)}</p>" for p in parts if p)
+
+
+def _fixture_date(fx: Dict) -> str:
+    try:
+        dt = datetime.fromisoformat(str(fx.get("published_date"))[:10]).replace(tzinfo=timezone.utc)
+    except ValueError:
+        dt = datetime(2024, 1, 1, tzinfo=timezone.utc)
+    return format_datetime(dt)
+
+
+def _llm_payload(fx: Dict) -> Dict:
+    """Adatta il payload registrato allo schema DealData (gli investitori possono essere oggetti)."""
+    payload = dict(fx)
+    investors = payload.get("investors") or []
+    payload["investors"] = [i.get("name", "") if isinstance(i, dict) else str(i) for i in investors]
+    return payload
+
+
+@dataclass
+class StubConfig:
+    page_size: int = 10
+    llm_latency: float = 0.0          # secondi di latenza per ogni chiamata LLM
+    llm_rate_limit_ratio: float = 0.0  # probabilità di rispondere 429
+    search_latency: float = 0.0        # secondi di latenza per ogni ricerca Tavily
+    seed: int = 42
+
+
+class StubState:
+    def __init__(self, fixtures: List[Dict], config: StubConfig):
+        self.fixtures = fixtures
+        self.by_url = {fx["url"]: fx for fx in fixtures}
+        self.config = config
+        self.rng = random.Random(config.seed)
+        self.lock = threading.Lock()
+        self.counters = {"http_requests": 0, "llm_calls": 0, "llm_429": 0, "search_calls": 0}
+
+    def incr(self, key: str, n: int = 1):
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + n
+
+    def should_rate_limit(self) -> bool:
+        with self.lock:
+            return self.rng.random() < self.config.llm_rate_limit_ratio
+
+    def reset(self):
+        with self.lock:
+            for k in self.counters:
+                self.counters[k] = 0
+
+    def page(self, page: int) -> List[Dict]:
+        size = self.config.page_size
+        return self.fixtures[(page - 1) * size: page * size]
+
+    def rss(self, items: List[Dict]) -> str:
+        entries = "".join(
+            f"<item><title>{escape(fx.get('title') or '')}</title>"
+            f"<link>{escape(fx['url'])}</link>"
+            f"<pubDate>{_fixture_date(fx)}</pubDate>"
+            f"<description>{escape(_fixture_html(fx))}</description></item>"
+            for fx in items
+        )
+        return f'<?xml version="1.0" encoding="UTF-8"?><rss version="2.0"><channel><title>stub</title>{entries}</channel></rss>'
+
+    def search(self, query: str, max_results: int) -> List[Dict]:
+        """Ricerca Tavily: fixture che citano la prima parola della query (altrimenti le prime)."""
+        word = (query.split() or [""])[0].lower()
+        hits = [fx for fx in self.fixtures if word and word in json.dumps(fx, ensure_ascii=False).lower()]
+        return [
+            {"url": fx["url"], "title": fx.get("title"), "content": _fixture_html(fx), "score": 0.9}
+            for fx in (hits or self.fixtures)[:max_results]
+        ]
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    state: StubState = None
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send(self, status: int, body: str, content_type: str, headers: Optional[Dict] = None):
+        data = body.encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(data)))
+        for k, v in (headers or {}).items():
+            self.send_header(k, v)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self):
+        state = self.state
+        state.incr("http_requests")
+        parsed = urlparse(self.path)
+        qs = parse_qs(parsed.query)
+
+        # SpaceNews: /spacenews/?s=...&feed=rss2&paged=N
+        if parsed.path.startswith("/spacenews"):
+            page = int(qs.get("paged", ["1"])[0])
+            return self._send(200, state.rss(state.page(page)), "application/rss+xml")
+
+        # Via Satellite: feed unico
+        if parsed.path.startswith("/viasatellite"):
+            return self._send(200, state.rss(state.page(1)), "application/rss+xml")
+
+        # SNAPI: /snapi/articles?limit=&offset=
+        if parsed.path.startswith("/snapi/articles"):
+            limit = int(qs.get("limit", ["10"])[0])
+            offset = int(qs.get("offset", ["0"])[0])
+            results = [
+                {"url": fx["url"], "title": fx.get("title"), "published_at": fx.get("published_date"),
+                 "summary": _fixture_html(fx)}
+                for fx in state.fixtures[offset: offset + limit]
+            ]
+            return self._send(200, json.dumps({"results": results}), "application/json")
+
+        # NASA TechPort: /techport/api/projects/search
+        if parsed.path.startswith("/techport/api/projects/search"):
+            projects = [
+                {"id": i, "title": fx.get("title"), "lastUpdated": fx.get("published_date"),
+                 "description": _fixture_html(fx)}
+                for i, fx in enumerate(state.page(1))
+            ]
+            return self._send(200, json.dumps({"projects": projects}), "application/json")
+
+        self._send(404, "not found", "text/plain")
+
+    def do_POST(self):
+        state = self.state
+        state.incr("http_requests")
+        path = self.path.rstrip("/")
+        length = int(self.headers.get("Content-Length", 0))
+        body = json.loads(self.rfile.read(length) or b"{}")
+
+        # Tavily: /tavily/search
+        if path == "/tavily/search":
+            state.incr("search_calls")
+            if state.config.search_latency:
+                time.sleep(state.config.search_latency)
+            results = state.search(body.get("query", ""), int(body.get("max_results", 5)))
+            return self._send(200, json.dumps({"query": body.get("query"), "results": results}), "application/json")
+
+        # OpenAI-compatibile (Mistral, Groq) oppure Ollama nativo (/api/chat, /api/generate)
+        if not (path.endswith("/chat/completions") or path in ("/api/chat", "/api/generate")):
+            return self._send(404, "not found", "text/plain")
+
+        model = body.get("model", "stub")
+        state.incr("llm_calls")
+        state.incr(f"llm_calls:{model}")
+
+        if state.config.llm_latency:
+            time.sleep(state.config.llm_latency)
+
+        if state.should_rate_limit():
+            state.incr("llm_429")
+            error = {"error": {"message": "429 rate limit exceeded (stub)", "type": "rate_limit"}}
+            return self._send(429, json.dumps(error), "application/json", {"Retry-After": "1"})
+
+        user_msg = body.get("prompt") or " ".join(
+            m.get("content", "") for m in body.get("messages", [])
+            if m.get("role") == "user" and isinstance(m.get("content"), str)
+        )
+        match = URL_RE.search(user_msg)
+        fx = state.by_url.get(match.group(1)) if match else None
+        payload = _llm_payload(fx) if fx else {"is_relevant": False, "deal_type": "none", "summary": "stub: unknown url"}
+        content = json.dumps(payload, ensure_ascii=False)
+
+        if path in ("/api/chat", "/api/generate"):
+            response = {"model": model, "created_at": datetime.now(timezone.utc).isoformat(), "done": True,
+                        "prompt_eval_count": len(user_msg) // 4, "eval_count": len(content) // 4}
+            if path == "/api/chat":
+                response["message"] = {"role": "assistant", "content": content}
+            else:
+                response["response"] = content
+            return self._send(200, json.dumps(response), "application/json")
+
+        response = {
+            "id": f"stub-{time.time_ns()}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": model,
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": content}, "finish_reason": "stop"}],
+            "usage": {
+                "prompt_tokens": len(user_msg) // 4,
+                "completion_tokens": len(content) // 4,
+                "total_tokens": (len(user_msg) + len(content)) // 4,
+            },
+        }
+        self._send(200, json.dumps(response), "application/json")
+
+
+class StubServer:
+    """Server di stub in un thread in background. Usare come context manager."""
+
+    def __init__(self, config: StubConfig = None, fixtures: List[Dict] = None, host: str = "127.0.0.1", port: int = 0):
+        self.state = StubState(fixtures if fixtures is not None else load_fixtures(), config or StubConfig())
+        handler = type("BoundStubHandler", (StubHandler,), {"state": self.state})
+        self.httpd = ThreadingHTTPServer((host, port), handler)
+        self.httpd.daemon_threads = True
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+
+    @property
+    def base_url(self) -> str:
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def env(self) -> Dict[str, str]:
+        """Variabili d'ambiente che reindirizzano sorgenti e LLM verso lo stub."""
+        return {
+            "SPACENEWS_BASE_URL": f"{self.base_url}/spacenews",
+            "SNAPI_BASE_URL": f"{self.base_url}/snapi",
+            "VIA_SATELLITE_FEED_URL": f"{self.base_url}/viasatellite/feed/",
+            "NASA_TECHPORT_BASE_URL": f"{self.base_url}/techport",
+            "MISTRAL_API_BASE": f"{self.base_url}/v1",
+            "GROQ_API_BASE": f"{self.base_url}/v1",
+            "OLLAMA_API_BASE": self.base_url,
+            "TAVILY_BASE_URL": f"{self.base_url}/tavily",
+            "TAVILY_API_KEY": "stub-key",
+        }
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.httpd.shutdown()
+        self.httpd.server_close()
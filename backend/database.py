@@ -1,15 +1,31 @@
 import os
 from sqlalchemy import create_engine
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker, AsyncSession
 from sqlalchemy.orm import sessionmaker, declarative_base
 
 # Recupera l'URL dal docker-compose environment
 DATABASE_URL = os.getenv("DATABASE_URL", "postgresql://space_user:space_password@db:5432/spacescraper")
 
-# Creazione Engine
+# URL asincrono (asyncpg) derivato da quello sincrono se non specificato
+ASYNC_DATABASE_URL = os.getenv(
+    "ASYNC_DATABASE_URL",
+    DATABASE_URL.replace("postgresql://", "postgresql+asyncpg://", 1)
+)
+
+# Creazione Engine (sincrono: usato dai worker Celery)
 engine = create_engine(DATABASE_URL)
 
+# Engine asincrono: pool dedicato al processo API
+async_engine = create_async_engine(
+    ASYNC_DATABASE_URL,
+    pool_size=int(os.getenv("ASYNC_DB_POOL_SIZE", "20")),
+    max_overflow=int(os.getenv("ASYNC_DB_MAX_OVERFLOW", "10")),
+    pool_pre_ping=True,
+)
+
 # Session Factory
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+AsyncSessionLocal = async_sessionmaker(async_engine, expire_on_commit=False, autoflush=False)
 
 # Base per i modelli ORM
 Base = declarative_base()
@@ -20,4 +36,9 @@ def get_db():
     try:
         yield db
     finally:
-        db.close()
\ No newline at end of file
+        db.close()
+
+# Dependency Injection asincrona (endpoint di lettura)
+async def get_async_db():
+    async with AsyncSessionLocal() as db:
+        yield db
@@ -0,0 +1,139 @@
+"""
+Entity resolution per investitori e aziende dei deal.
+
+Alla scrittura di un deal, investors / acquirer / target / entities del payload
+vengono normalizzati (maiuscole, punteggiatura, suffissi societari, alias) e
+collegati alla tabella `entities` tramite `deal_entities`, così le query
+"tutti i deal di X" e i co-investimenti usano indici invece di scansioni JSONB.
+
+Reindicizzazione dei deal già presenti:
+    python entities.py reindex
+"""
+import re
+import sys
+import unicodedata
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy import delete, select
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.orm import Session
+
+from models import DealModel, EntityModel, DealEntityModel
+
+# Suffissi societari rimossi in coda al nome
+LEGAL_SUFFIXES = {
+    "inc", "incorporated", "corp", "corporation", "co", "company", "ltd", "limited", "llc", "plc",
+    "gmbh", "ag", "sa", "sas", "spa", "srl", "bv", "nv", "oy", "oyj", "ab", "as", "aps", "kk",
+    "holding", "holdings", "group",
+}
+
+# Alias noti: nome normalizzato -> nome normalizzato canonico
+ALIASES = {
+    "space exploration technologies": "spacex",
+    "esa": "european space agency",
+    "nasa": "national aeronautics and space administration",
+}
+
+# Ruoli salvati nei link deal-entità
+ROLE_INVESTOR = "investor"
+ROLE_ACQUIRER = "acquirer"
+ROLE_TARGET = "target"
+ROLE_MENTIONED = "mentioned"
+
+
+def normalize_name(name: str) -> str:
+    """'ICEYE Oy' -> 'iceye', 'U.K. Space Agency' -> 'uk space agency'."""
+    text = unicodedata.normalize("NFKD", name).encode("ascii", "ignore").decode("ascii").lower()
+    text = text.replace("&", " and ")
+    # Le sigle puntate (U.K., S.p.A.) vengono compattate prima di togliere la punteggiatura
+    text = re.sub(r"\b(?:[a-z]\.){2,}", lambda m: m.group(0).replace(".", ""), text)
+    text = re.sub(r"[^a-z0-9]+", " ", text).strip()
+    tokens = text.split()
+    while len(tokens) > 1 and tokens[-1] in LEGAL_SUFFIXES:
+        tokens.pop()
+    normalized = " ".join(tokens)
+    return ALIASES.get(normalized, normalized)
+
+
+def _names(value: Any) -> List[Tuple[str, Optional[str]]]:
+    """Estrae (nome, ruolo dichiarato) da stringhe, oggetti {name, role} o liste miste."""
+    if not value:
+        return []
+    if isinstance(value, str):
+        return [(value, None)] if value.strip().lower() not in ("none", "null", "n/a", "unknown", "[]") else []
+    if isinstance(value, dict):
+        name = value.get("name")
+        return [(str(name), value.get("role"))] if name else []
+    if isinstance(value, (list, tuple)):
+        return [n for v in value for n in _names(v)]
+    return []
+
+
+def extract_entities(payload: Dict[str, Any]) -> List[Tuple[str, str, str]]:
+    """(nome visualizzato, nome normalizzato, ruolo) per ogni entità del payload, senza duplicati."""
+    found: Dict[Tuple[str, str], str] = {}
+    fields = (
+        ("investors", ROLE_INVESTOR), ("acquirer", ROLE_ACQUIRER),
+        ("target", ROLE_TARGET), ("entities", ROLE_MENTIONED),
+    )
+    for field, role in fields:
+        for name, _ in _names(payload.get(field)):
+            normalized = normalize_name(name)
+            if normalized:
+                found.setdefault((normalized, role), name.strip())
+    return [(display, normalized, role) for (normalized, role), display in found.items()]
+
+
+def index_deal_entities(db: Session, deal: DealModel) -> None:
+    """Aggiorna i link del deal (nessun commit: avviene con quello del deal)."""
+    entities = extract_entities(deal.analysis_payload or {})
+    db.execute(delete(DealEntityModel).where(DealEntityModel.deal_id == deal.id))
+    if not entities:
+        return
+
+    by_name = {normalized: display for display, normalized, _ in entities}
+    db.execute(
+        pg_insert(EntityModel)
+        .values([{"name": display, "normalized_name": normalized} for normalized, display in by_name.items()])
+        .on_conflict_do_nothing(index_elements=["normalized_name"])
+    )
+    ids = dict(db.execute(
+        select(EntityModel.normalized_name, EntityModel.id).where(EntityModel.normalized_name.in_(list(by_name)))
+    ).all())
+    db.execute(
+        pg_insert(DealEntityModel)
+        .values([{"deal_id": deal.id, "entity_id": ids[normalized], "role": role} for _, normalized, role in entities])
+        .on_conflict_do_nothing()
+    )
+
+
+def reindex_all(db: Session, batch_size: int = 1000) -> int:
+    """Reindicizza tutti i deal a blocchi per id (keyset), con un commit per blocco."""
+    count, last_id = 0, 0
+    while True:
+        # Niente cursore aperto tra un commit e l'altro: il commit chiuderebbe il cursore lato server
+        deals = db.execute(
+            select(DealModel).where(DealModel.id > last_id).order_by(DealModel.id).limit(batch_size)
+        ).scalars().all()
+        if not deals:
+            return count
+        for deal in deals:
+            index_deal_entities(db, deal)
+        count += len(deals)
+        last_id = deals[-1].id
+        db.commit()
+        db.expunge_all()
+
+
+if __name__ == "__main__":
+    from database import SessionLocal
+
+    if len(sys.argv) > 1 and sys.argv[1] == "reindex":
+        session = SessionLocal()
+        try:
+            print(f"[Entities] Reindicizzati {reindex_all(session)} deal")
+        finally:
+            session.close()
+    else:
+        for arg in sys.argv[1:]:
+            print(f"{arg!r} -> {normalize_name(arg)!r}")
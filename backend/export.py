@@ -0,0 +1,286 @@
+"""
+Export colonnare dei deal (Parquet / Arrow IPC / CSV) a memoria costante.
+
+I deal vengono letti dal DB a blocchi (cursore lato server) e ogni blocco
+viene appiattito nei campi di DealData e scritto subito nel formato scelto.
+
+Usato da GET /api/export/deals (streaming) e da riga di comando:
+    python export.py --format parquet --output deals.parquet --target ICEYE --date-from 2024-01-01
+"""
+import argparse
+import csv
+import io
+import json
+from datetime import date, datetime, timedelta
+from typing import Any, Dict, Iterable, Iterator, List, Optional
+
+from sqlalchemy import Select, func, or_, select
+
+from models import DealModel
+
+EXPORT_FORMATS = {
+    "parquet": ("application/vnd.apache.parquet", "parquet"),
+    "arrow": ("application/vnd.apache.arrow.stream", "arrows"),
+    "csv": ("text/csv", "csv"),
+}
+DEFAULT_CHUNK_SIZE = 5000
+
+# Campi testuali di DealData esportati così come sono (o serializzati se strutturati)
+TEXT_FIELDS = [
+    "section", "deal_type", "deal_status", "acquirer", "target", "currency",
+    "key_assets", "geography", "technology_readiness_level", "mission_type",
+    "orbit", "payload_capacity", "summary", "why_it_matters",
+]
+NUMERIC_FIELDS = ["relevance_score", "amount", "valuation", "stake_percent"]
+
+
+# ==========================================
+# 1. QUERY
+# ==========================================
+def build_export_query(date_from: Optional[date] = None, date_to: Optional[date] = None,
+                       target: Optional[str] = None, deal_type: Optional[str] = None,
+                       relevant_only: bool = True) -> Select:
+    """
+    Filtri applicati lato server; la data usa published_date (o created_at se assente).
+    date_from e date_to sono inclusivi, come in ScrapeSettings e nel backfill.
+    """
+    deal_date = func.coalesce(DealModel.published_date, DealModel.created_at)
+    stmt = select(
+        DealModel.id, DealModel.url, DealModel.source, DealModel.source_category,
+        DealModel.title, DealModel.published_date, DealModel.created_at,
+        DealModel.search_target, DealModel.matched_targets, DealModel.is_relevant, DealModel.analysis_payload,
+    )
+    if relevant_only:
+        stmt = stmt.filter(DealModel.is_relevant == True)
+    if date_from:
+        stmt = stmt.filter(deal_date >= date_from)
+    if date_to:
+        stmt = stmt.filter(deal_date < date_to + timedelta(days=1))
+    if target:
+        label = target.strip().upper()
+        stmt = stmt.filter(or_(DealModel.search_target == label, DealModel.matched_targets.any(label)))
+    if deal_type:
+        stmt = stmt.filter(func.lower(DealModel.analysis_payload["deal_type"].astext) == deal_type.lower())
+    return stmt.order_by(DealModel.id)
+
+
+# ==========================================
+# 2. APPIATTIMENTO DI DealData
+# ==========================================
+def _to_text(value: Any) -> Optional[str]:
+    if value is None:
+        return None
+    if isinstance(value, str):
+        return value
+    if isinstance(value, dict):
+        return value.get("name") or json.dumps(value, ensure_ascii=False)
+    if isinstance(value, (list, tuple)):
+        return "; ".join(t for t in (_to_text(v) for v in value) if t)
+    return str(value)
+
+
+def _to_float(value: Any) -> Optional[float]:
+    if value is None or isinstance(value, bool):
+        return None
+    if isinstance(value, (int, float)):
+        return float(value)
+    try:
+        return float(str(value).replace(",", "").strip())
+    except ValueError:
+        return None
+
+
+def _investor_names(investors: Any) -> List[str]:
+    # Gli investitori arrivano come stringhe o come oggetti {name, type, role}
+    names = []
+    for inv in investors or []:
+        name = inv.get("name") if isinstance(inv, dict) else inv
+        if name:
+            names.append(str(name).strip())
+    return names
+
+
+def flatten_deal(row) -> Dict[str, Any]:
+    payload = row.analysis_payload or {}
+    record = {
+        "id": row.id,
+        "url": row.url,
+        "source": row.source,
+        "source_category": row.source_category,
+        "title": row.title,
+        "published_date": row.published_date,
+        "published_date_raw": _to_text(payload.get("published_date")),
+        "created_at": row.created_at,
+        "search_target": row.search_target,
+        "matched_targets": list(row.matched_targets or []),
+        "is_relevant": bool(row.is_relevant),
+        "investors": _investor_names(payload.get("investors")),
+    }
+    for field in TEXT_FIELDS:
+        record[field] = _to_text(payload.get(field))
+    for field in NUMERIC_FIELDS:
+        record[field] = _to_float(payload.get(field))
+        record[f"{field}_raw"] = _to_text(payload.get(field))
+    return record
+
+
+def _arrow_schema():
+    import pyarrow as pa
+    fields = [
+        ("id", pa.int64()), ("url", pa.string()), ("source", pa.string()),
+        ("source_category", pa.string()), ("title", pa.string()),
+        ("published_date", pa.timestamp("us", tz="UTC")), ("published_date_raw", pa.string()),
+        ("created_at", pa.timestamp("us", tz="UTC")), ("search_target", pa.string()),
+        ("matched_targets", pa.list_(pa.string())),
+        ("is_relevant", pa.bool_()), ("investors", pa.list_(pa.string())),
+    ]
+    fields += [(f, pa.string()) for f in TEXT_FIELDS]
+    for f in NUMERIC_FIELDS:
+        fields += [(f, pa.float64()), (f"{f}_raw", pa.string())]
+    return pa.schema(fields)
+
+
+# ==========================================
+# 3. ENCODER PER FORMATO
+# ==========================================
+class _DrainableSink:
+    """File-like in cui scrive pyarrow; drain() restituisce i byte accumulati e svuota il buffer."""
+
+    def __init__(self):
+        self._buffer = io.BytesIO()
+        self._position = 0
+        self.closed = False
+
+    def write(self, data) -> int:
+        n = self._buffer.write(data)
+        self._position += n
+        return n
+
+    def tell(self) -> int:
+        return self._position
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+    def drain(self) -> bytes:
+        data = self._buffer.getvalue()
+        self._buffer = io.BytesIO()
+        return data
+
+
+class ExportEncoder:
+    """encode(records) -> bytes per ogni blocco, finish() -> bytes finali (es. footer Parquet)."""
+
+    def __init__(self, fmt: str):
+        if fmt not in EXPORT_FORMATS:
+            raise ValueError(f"Formato non supportato: {fmt}")
+        self.fmt = fmt
+        self._header_written = False
+        if fmt in ("parquet", "arrow"):
+            try:
+                import pyarrow as pa
+                import pyarrow.parquet as pq
+            except ImportError as e:
+                raise RuntimeError("pyarrow non installato: export disponibile solo in CSV") from e
+            self._pa = pa
+            self.schema = _arrow_schema()
+            self._sink = _DrainableSink()
+            if fmt == "parquet":
+                self._writer = pq.ParquetWriter(pa.PythonFile(self._sink, mode="w"), self.schema, compression="zstd")
+            else:
+                self._writer = pa.ipc.new_stream(pa.PythonFile(self._sink, mode="w"), self.schema)
+
+    def encode(self, records: List[Dict[str, Any]]) -> bytes:
+        if self.fmt == "csv":
+            return self._encode_csv(records)
+        batch = self._pa.RecordBatch.from_pylist(records, schema=self.schema)
+        if self.fmt == "arrow":
+            self._writer.write_batch(batch)
+        else:
+            # Un row group Parquet per blocco
+            self._writer.write_table(self._pa.Table.from_batches([batch]))
+        return self._sink.drain()
+
+    def finish(self) -> bytes:
+        if self.fmt == "csv":
+            return b"" if self._header_written else self._encode_csv([])
+        self._writer.close()
+        return self._sink.drain()
+
+    def _encode_csv(self, records: List[Dict[str, Any]]) -> bytes:
+        out = io.StringIO()
+        writer = csv.writer(out)
+        if not self._header_written:
+            writer.writerow(_export_columns())
+            self._header_written = True
+        for rec in records:
+            writer.writerow([_csv_value(rec.get(col)) for col in _export_columns()])
+        return out.getvalue().encode("utf-8")
+
+
+def _export_columns() -> List[str]:
+    cols = ["id", "url", "source", "source_category", "title", "published_date", "published_date_raw",
+            "created_at", "search_target", "matched_targets", "is_relevant", "investors"]
+    cols += TEXT_FIELDS
+    for f in NUMERIC_FIELDS:
+        cols += [f, f"{f}_raw"]
+    return cols
+
+
+def _csv_value(value: Any) -> Any:
+    if value is None:
+        return ""
+    if isinstance(value, list):
+        return "; ".join(value)
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return value
+
+
+def encode_chunks(fmt: str, row_chunks: Iterable[Iterable]) -> Iterator[bytes]:
+    """Versione sincrona: righe DB a blocchi -> byte del file esportato."""
+    encoder = ExportEncoder(fmt)
+    for rows in row_chunks:
+        data = encoder.encode([flatten_deal(r) for r in rows])
+        if data:
+            yield data
+    yield encoder.finish()
+
+
+# ==========================================
+# 4. CLI
+# ==========================================
+def main(argv=None):
+    from database import SessionLocal
+
+    parser = argparse.ArgumentParser(description="Export colonnare dei deal")
+    parser.add_argument("--format", choices=list(EXPORT_FORMATS), default="parquet")
+    parser.add_argument("--output", required=True)
+    parser.add_argument("--date-from", type=date.fromisoformat, help="primo giorno incluso (YYYY-MM-DD)")
+    parser.add_argument("--date-to", type=date.fromisoformat, help="ultimo giorno incluso (YYYY-MM-DD)")
+    parser.add_argument("--target")
+    parser.add_argument("--deal-type")
+    parser.add_argument("--all", action="store_true", help="include anche i deal non rilevanti")
+    parser.add_argument("--chunk-size", type=int, default=DEFAULT_CHUNK_SIZE)
+    args = parser.parse_args(argv)
+
+    stmt = build_export_query(args.date_from, args.date_to, args.target, args.deal_type,
+                              relevant_only=not args.all)
+    db = SessionLocal()
+    try:
+        result = db.execute(stmt.execution_options(yield_per=args.chunk_size))
+        written = 0
+        with open(args.output, "wb") as f:
+            for data in encode_chunks(args.format, result.partitions()):
+                f.write(data)
+                written += len(data)
+        print(f"[Export] {args.output}: {written / 1024 / 1024:.1f} MB")
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,20 @@
+"""
+Routing dei modelli LLM verso i provider (Mistral, Groq, Ollama), condiviso da
+scraper_service e agent_service. Gli endpoint si sovrascrivono da env (es. benchmarks/stubs.py).
+"""
+import os
+from typing import Optional, Tuple
+
+MISTRAL_API_BASE = os.getenv("MISTRAL_API_BASE", "https://api.mistral.ai/v1")
+GROQ_API_BASE = os.getenv("GROQ_API_BASE", "https://api.groq.com/openai/v1")
+OLLAMA_API_BASE = os.getenv("OLLAMA_API_BASE", "http://host.docker.internal:11434")
+
+
+def llm_route(model: str, api_key: Optional[str]) -> Tuple[str, Optional[str], str]:
+    """(modello per litellm, api_key, api_base) per Ollama, Groq o Mistral (default)."""
+    model_name = model.lower()
+    if "ollama" in model_name:
+        return model_name, "ollama", OLLAMA_API_BASE
+    if "groq" in model_name:
+        return f"openai/{model_name.replace('groq/', '')}", api_key, GROQ_API_BASE
+    return f"openai/{model}", api_key, MISTRAL_API_BASE
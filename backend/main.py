@@ -1,16 +1,31 @@
 import logging
-from fastapi import FastAPI, Depends, HTTPException, Depends, Query
+import time
+from fastapi import FastAPI, Depends, HTTPException, Depends, Query, Request, Response
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
 from dotenv import load_dotenv
 from celery.result import AsyncResult
+from sqlalchemy import select, text, func, or_
+from sqlalchemy.orm import aliased
 from sqlalchemy.orm import Session
-from datetime import datetime, timedelta
+from sqlalchemy.ext.asyncio import AsyncSession
+from datetime import datetime, timedelta, date
 from typing import List, Dict, Any, Optional
 
 # --- IMPORT INTERNI ---
-from models import ScrapeSettings, DealModel
-from worker import execute_scrape_task
-from database import engine, Base, get_db
+from models import ScrapeSettings, BackfillRequest, InvestigationRequest, ReanalyzeRequest, DealModel, TaskProfileModel, EntityModel, DealEntityModel
+from worker import celery_app, execute_scrape_task, estimate_job_size, route_scrape, dispatch_backfill_chunks, CELERY_BROKER_URL, SCRAPE_QUEUES
+from worker import investigate_companies_task, route_investigation, execute_reanalyze_task, BULK_QUEUE
+from database import engine, async_engine, Base, get_db, get_async_db, AsyncSessionLocal
+import export
+import backfill
+import task_results
+import response_cache
+from task_stats import get_task_stats
+from task_control import request_cancel, is_cancel_requested
+from entities import normalize_name, ROLE_INVESTOR
+from analytics import snapshot
+import metrics
 
 load_dotenv()
 
@@ -18,16 +33,28 @@ load_dotenv()
 # Crea le tabelle automaticamente se non esistono.
 Base.metadata.create_all(bind=engine)
 
+# create_all non altera tabelle già esistenti: colonne aggiunte in seguito
+with engine.begin() as conn:
+    conn.execute(text("ALTER TABLE deals ADD COLUMN IF NOT EXISTS updated_at TIMESTAMPTZ DEFAULT now()"))
+    conn.execute(text("CREATE INDEX IF NOT EXISTS ix_deals_updated_at ON deals (updated_at)"))
+    conn.execute(text("ALTER TABLE deals ADD COLUMN IF NOT EXISTS matched_targets VARCHAR[]"))
+    conn.execute(text("CREATE INDEX IF NOT EXISTS ix_deals_matched_targets ON deals USING gin (matched_targets)"))
+
 # --- 1. FILTRO LOG ---
 class EndpointFilter(logging.Filter):
     def filter(self, record: logging.LogRecord) -> bool:
         message = record.getMessage()
-        return "/api/tasks" not in message and "/api/results" not in message
+        return "/api/tasks" not in message and "/api/results" not in message and "/metrics" not in message
 
 logging.getLogger("uvicorn.access").addFilter(EndpointFilter())
 
 app = FastAPI()
 
+@app.on_event("shutdown")
+async def shutdown_db():
+    # Chiude le connessioni del pool asincrono
+    await async_engine.dispose()
+
 # --- 2. CONFIGURAZIONE CORS ---
 app.add_middleware(
     CORSMiddleware,
@@ -37,6 +64,26 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# --- METRICHE ---
+@app.middleware("http")
+async def observe_request_latency(request: Request, call_next):
+    start = time.perf_counter()
+    response = await call_next(request)
+    route = request.scope.get("route")
+    metrics.API_REQUEST_SECONDS.labels(
+        method=request.method,
+        route=route.path if route else "unmatched",
+        status=response.status_code,
+    ).observe(time.perf_counter() - start)
+    return response
+
+@app.get("/metrics")
+def get_metrics():
+    """Metriche Prometheus dell'API (latenze, profondità coda)."""
+    metrics.update_queue_depth(CELERY_BROKER_URL, SCRAPE_QUEUES)
+    body, content_type = metrics.render_latest()
+    return Response(content=body, media_type=content_type)
+
 @app.get("/")
 def read_root():
     return {"status": "SpaceScraper Distributed Backend Ready"}
@@ -51,15 +98,20 @@ async def start_scrape(settings: ScrapeSettings):
         # mode='json' converte gli Enum in stringhe per Celery
         settings_dict = settings.model_dump(mode='json')
         
-        print(f"[Backend] Dispatching task with sources: {settings_dict.get('sources')}")
+        # Routing: i job pesanti vanno nella coda bulk, quelli piccoli restano interattivi
+        job_size = estimate_job_size(settings)
+        queue = route_scrape(settings)
+        print(f"[Backend] Dispatching task with sources: {settings_dict.get('sources')} -> coda '{queue}' (size {job_size})")
 
         # Lanciamo il task asincrono
-        task = execute_scrape_task.delay(settings_dict)
+        task = execute_scrape_task.apply_async(args=[settings_dict], queue=queue)
         
         return {
             "task_id": task.id, 
             "status": "Accepted", 
-            "message": "Task inviato al worker cluster"
+            "message": "Task inviato al worker cluster",
+            "queue": queue,
+            "job_size": job_size,
         }
     except Exception as e:
         print(f"Errore dispatch task: {e}")
@@ -73,7 +125,8 @@ async def get_task_status(task_id: str):
     response = {
         "task_id": task_id,
         "status": task_result.status,
-        "result": None
+        "result": None,
+        "cancel_requested": await is_cancel_requested(task_id),
     }
 
     if task_result.ready():
@@ -86,8 +139,148 @@ async def get_task_status(task_id: str):
     
     return response
 
+# --- RIANALISI DALL'ARCHIVIO (nuovo prompt/modello senza riscaricare, coda bulk) ---
+@app.post("/api/reanalyze")
+async def start_reanalyze(request: ReanalyzeRequest):
+    """
+    Rianalizza gli articoli archiviati che rientrano in target, date e sorgenti di `settings`.
+    Stato, risultati e cancellazione come per gli altri task (/api/tasks/{task_id}...).
+    """
+    task = execute_reanalyze_task.apply_async(
+        args=[request.settings.model_dump(mode='json'), request.limit, request.concurrency], queue=BULK_QUEUE
+    )
+    return {"task_id": task.id, "status": "Accepted", "queue": BULK_QUEUE}
+
+# --- BACKFILL STORICO (chunk mensili con checkpoint, coda bulk) ---
+@app.post("/api/backfills")
+def start_backfill(request: BackfillRequest, db: Session = Depends(get_db)):
+    try:
+        job = backfill.create_job(db, request)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    chunk_ids = backfill.resumable_chunk_ids(db, job.id)
+    dispatch_backfill_chunks(db, chunk_ids)
+    print(f"[Backend] Backfill {job.id}: {len(chunk_ids)} chunk in coda bulk")
+    return backfill.job_progress(db, job.id)
+
+@app.get("/api/backfills/{job_id}")
+def get_backfill(job_id: int, db: Session = Depends(get_db)):
+    progress = backfill.job_progress(db, job_id)
+    if progress is None:
+        raise HTTPException(status_code=404, detail="Backfill non trovato")
+    return progress
+
+@app.post("/api/backfills/{job_id}/resume")
+def resume_backfill(job_id: int, db: Session = Depends(get_db)):
+    """Rimette in coda i chunk non completati (anche quelli falliti) e riattiva un job cancellato."""
+    progress = backfill.job_progress(db, job_id)
+    if progress is None:
+        raise HTTPException(status_code=404, detail="Backfill non trovato")
+    if progress["status"] != "completed":
+        backfill.set_job_status(db, job_id, "running")
+    chunk_ids = backfill.resumable_chunk_ids(db, job_id)
+    dispatch_backfill_chunks(db, chunk_ids)
+    return {**backfill.job_progress(db, job_id), "requeued": len(chunk_ids)}
+
+@app.post("/api/backfills/{job_id}/cancel")
+def cancel_backfill(job_id: int, db: Session = Depends(get_db)):
+    """I chunk in coda non partono più; quelli in esecuzione terminano normalmente."""
+    progress = backfill.job_progress(db, job_id)
+    if progress is None:
+        raise HTTPException(status_code=404, detail="Backfill non trovato")
+    if progress["status"] == "completed":
+        return progress
+    backfill.set_job_status(db, job_id, "cancelled")
+    return backfill.job_progress(db, job_id)
+
+# --- INDAGINE AGENTE (ricerca web + LLM in parallelo sulle aziende) ---
+@app.post("/api/agent/investigations")
+async def start_investigation(request: InvestigationRequest):
+    """Il risultato (un report per azienda) si legge da GET /api/tasks/{task_id}."""
+    queue = route_investigation(request.companies)
+    task = investigate_companies_task.apply_async(
+        args=[request.companies, request.ai_model, request.api_key or ""], queue=queue
+    )
+    return {"task_id": task.id, "status": "Accepted", "queue": queue, "companies": len(request.companies)}
+
+@app.get("/api/queues")
+def get_queue_depths():
+    """Task in attesa per coda (interattiva / bulk)."""
+    depths = metrics.update_queue_depth(CELERY_BROKER_URL, SCRAPE_QUEUES)
+    if not depths:
+        raise HTTPException(status_code=503, detail="Broker non raggiungibile")
+    return {"queues": depths}
+
+@app.post("/api/tasks/{task_id}/cancel")
+async def cancel_task(task_id: str):
+    """
+    Cancellazione ordinata: un task in coda non parte (revoke), un task in esecuzione smette
+    di prendere nuovi articoli e termina restituendo i risultati parziali.
+    """
+    task_result = AsyncResult(task_id)
+    if task_result.ready():
+        return {"task_id": task_id, "status": task_result.status, "message": "Task già terminato"}
+
+    await request_cancel(task_id)
+    # Niente terminate=True: il worker deve poter salvare il lavoro già fatto
+    celery_app.control.revoke(task_id)
+    return {"task_id": task_id, "status": "CANCEL_REQUESTED", "message": "Cancellazione richiesta"}
+
+@app.get("/api/tasks/{task_id}/stats")
+async def get_task_run_stats(task_id: str):
+    """Statistiche del run: chiamate LLM per modello, routing cascade, articoli scartati dal triage."""
+    stats = await get_task_stats(task_id)
+    if stats is None:
+        raise HTTPException(status_code=404, detail="Statistiche non disponibili per questo task")
+    return {"task_id": task_id, "stats": stats}
+
+@app.get("/api/tasks/{task_id}/results")
+async def get_task_results(task_id: str, after: int = 0, limit: int = Query(500, le=5000),
+                           db: AsyncSession = Depends(get_async_db)):
+    """
+    Risultati parziali di un task in corso: solo i deal prodotti dopo il cursore `after`.
+    Il client ripassa `next_cursor` alla chiamata successiva.
+    """
+    rows = (await db.execute(task_results.build_results_query(task_id, after, limit))).all()
+    return task_results.results_page(task_id, rows, after)
+
+@app.get("/api/tasks/{task_id}/profile")
+async def get_task_profile(task_id: str, format: str = "json", db: AsyncSession = Depends(get_async_db)):
+    """
+    Scarica il profilo di un task avviato con profile=true.
+    format: 'folded' (flamegraph), 'trace' (timeline Chrome/Perfetto) o 'json' (entrambi).
+    """
+    profile = await db.get(TaskProfileModel, task_id)
+    if profile is None:
+        raise HTTPException(status_code=404, detail="Nessun profilo per questo task")
+
+    if format == "folded":
+        return PlainTextResponse(
+            profile.folded_stacks,
+            headers={"Content-Disposition": f'attachment; filename="{task_id}.folded"'}
+        )
+    if format == "trace":
+        return JSONResponse(
+            profile.spans,
+            headers={"Content-Disposition": f'attachment; filename="{task_id}.trace.json"'}
+        )
+    return {
+        "task_id": profile.task_id,
+        "samples": profile.samples,
+        "duration_seconds": profile.duration_seconds,
+        "created_at": profile.created_at,
+        "folded_stacks": profile.folded_stacks,
+        "spans": profile.spans,
+    }
+
 @app.get("/api/dashboard/heatmap")
-def get_heatmap_data(db: Session = Depends(get_db)):
+async def get_heatmap_data(request: Request, db: AsyncSession = Depends(get_async_db)):
+    """Heatmap servita dalla cache di risposta finché non cambiano i dati."""
+    return await response_cache.cached_json_response(
+        request, "heatmap", {}, lambda: _compute_heatmap(db)
+    )
+
+async def _compute_heatmap(db: AsyncSession):
     """
     Genera i dati per la Heatmap.
     Target FISSI definiti a mano. Usa il 'Tagging alla Sorgente' (search_target)
@@ -97,42 +290,46 @@ def get_heatmap_data(db: Session = Depends(get_db)):
     user_targets = ["ICEYE", "CONSTELLR"]
 
     # 2. FACCIAMO LAVORARE IL DATABASE
-    # Usiamo .in_() per dire a SQL: WHERE search_target IN ('ICEYE', 'CONSTELLR')
-    valid_deals = db.query(DealModel).filter(
+    # Usiamo .in_() per dire a SQL: WHERE search_target IN ('ICEYE', 'CONSTELLR'),
+    # più i deal delle watchlist che li citano (matched_targets && ARRAY[...], indice GIN)
+    stmt = select(DealModel).filter(
         DealModel.is_relevant == True,
-        DealModel.search_target.in_(user_targets)
-    ).order_by(DealModel.published_date.desc()).all()
+        or_(DealModel.search_target.in_(user_targets), DealModel.matched_targets.overlap(user_targets))
+    ).order_by(DealModel.published_date.desc().nullslast())
+    valid_deals = (await db.execute(stmt)).scalars().all()
 
     company_stats = {}
 
     # 3. RAGGRUPPIAMO E CALCOLIAMO I PUNTEGGI
     for deal in valid_deals:
-        # Il nome lo prendiamo direttamente dall'etichetta esatta
-        name = deal.search_target 
         payload = deal.analysis_payload if deal.analysis_payload else {}
-
-        if name not in company_stats:
-            company_stats[name] = {
-                "score": 0.0,
-                "count": 0,
-                "latest_news": deal.title,
-                "latest_date": deal.published_date
-            }
+        # Il nome lo prendiamo direttamente dall'etichetta esatta; un deal di una watchlist
+        # conta per ogni target fisso che cita
+        names = dict.fromkeys([deal.search_target, *(deal.matched_targets or [])])
+        for name in [n for n in names if n in user_targets]:
+            if name not in company_stats:
+                company_stats[name] = {
+                    "score": 0.0,
+                    "count": 0,
+                    "latest_news": deal.title,
+                    "latest_date": deal.published_date
+                }
         
-        relevance = float(payload.get("relevance_score", 0.5))
-        amount = float(payload.get("amount", 0))
+            relevance = float(payload.get("relevance_score", 0.5))
+            amount = float(payload.get("amount", 0))
         
-        deal_points = relevance * 3.0 
-        if amount > 1_000_000:
-            deal_points += 2.0 
+            deal_points = relevance * 3.0 
+            if amount > 1_000_000:
+                deal_points += 2.0 
         
-        company_stats[name]["score"] += deal_points
-        company_stats[name]["count"] += 1
+            company_stats[name]["score"] += deal_points
+            company_stats[name]["count"] += 1
         
-        # Mantiene in memoria la notizia più recente
-        if deal.published_date and deal.published_date > company_stats[name]["latest_date"]:
-            company_stats[name]["latest_news"] = deal.title
-            company_stats[name]["latest_date"] = deal.published_date
+            # Mantiene in memoria la notizia più recente (i deal storici possono non avere data)
+            latest = company_stats[name]["latest_date"]
+            if deal.published_date and (latest is None or deal.published_date > latest):
+                company_stats[name]["latest_news"] = deal.title
+                company_stats[name]["latest_date"] = deal.published_date
 
     # 4. FORMATTAZIONE PER ANGULAR
     results = []
@@ -148,14 +345,21 @@ def get_heatmap_data(db: Session = Depends(get_db)):
     return results[:25]
 
 @app.get("/api/deals")
-def get_historical_deals(limit: int = 100, db: Session = Depends(get_db)):
+async def get_historical_deals(request: Request, limit: int = 100, db: AsyncSession = Depends(get_async_db)):
+    """Storico deal servito dalla cache di risposta finché non cambiano i dati."""
+    return await response_cache.cached_json_response(
+        request, "deals", {"limit": limit}, lambda: _compute_historical_deals(db, limit)
+    )
+
+async def _compute_historical_deals(db: AsyncSession, limit: int):
     """
     Restituisce gli ultimi N deal salvati nel DB per popolare la tabella.
     Mappa correttamente i campi del FINANCIAL_SCHEMA_DEF.
     """
-    deals = db.query(DealModel).filter(
+    stmt = select(DealModel).filter(
         DealModel.is_relevant == True
-    ).order_by(DealModel.published_date.desc()).limit(limit).all()
+    ).order_by(DealModel.published_date.desc().nullslast()).limit(limit)
+    deals = (await db.execute(stmt)).scalars().all()
 
     print(f"[BACKEND] Caricamento storico: trovati {len(deals)} deal.")
     
@@ -184,4 +388,135 @@ def get_historical_deals(limit: int = 100, db: Session = Depends(get_db)):
         }
         results.append(item)
         
-    return results
\ No newline at end of file
+    return results
+
+@app.get("/api/export/deals")
+async def export_deals(
+    format: str = Query("parquet", pattern="^(parquet|arrow|csv)$"),
+    date_from: Optional[date] = Query(None, description="Primo giorno incluso"),
+    date_to: Optional[date] = Query(None, description="Ultimo giorno incluso"),
+    target: Optional[str] = None,
+    deal_type: Optional[str] = None,
+    relevant_only: bool = True,
+    chunk_size: int = Query(export.DEFAULT_CHUNK_SIZE, le=50000),
+):
+    """
+    Export bulk dei deal in Parquet/Arrow/CSV, in streaming e a memoria costante.
+    I campi di DealData (investors inclusi) sono appiattiti in colonne.
+    date_from / date_to sono inclusivi (stessa finestra di scrape e backfill).
+    """
+    try:
+        encoder = export.ExportEncoder(format)
+    except RuntimeError as e:
+        raise HTTPException(status_code=501, detail=str(e))
+    stmt = export.build_export_query(date_from, date_to, target, deal_type, relevant_only)
+
+    async def body():
+        # Sessione propria: lo stream continua dopo la chiusura delle dependency
+        async with AsyncSessionLocal() as db:
+            result = await db.stream(stmt.execution_options(yield_per=chunk_size))
+            async for rows in result.partitions(chunk_size):
+                data = encoder.encode([export.flatten_deal(r) for r in rows])
+                if data:
+                    yield data
+        yield encoder.finish()
+
+    media_type, extension = export.EXPORT_FORMATS[format]
+    return StreamingResponse(
+        body(),
+        media_type=media_type,
+        headers={"Content-Disposition": f'attachment; filename="deals.{extension}"'}
+    )
+
+# --- ANALYTICS (snapshot colonnare in memoria) ---
+def _parse_targets(targets: Optional[str]) -> Optional[List[str]]:
+    return [t.strip().upper() for t in targets.split(",") if t.strip()] if targets else None
+
+@app.get("/api/analytics/volume")
+async def get_deal_volume(freq: str = Query("month", pattern="^(day|week|month|year)$"),
+                          targets: Optional[str] = None, relevant_only: bool = True,
+                          db: AsyncSession = Depends(get_async_db)):
+    """Numero di deal e importo totale nel tempo, per target."""
+    await snapshot.refresh(db)
+    target_list = _parse_targets(targets)
+    key = ("volume", freq, tuple(target_list or ()), relevant_only)
+    return snapshot.cached(key, lambda: snapshot.volume_over_time(freq, target_list, relevant_only))
+
+@app.get("/api/analytics/deal-types")
+async def get_deal_type_mix(targets: Optional[str] = None, relevant_only: bool = True,
+                            db: AsyncSession = Depends(get_async_db)):
+    """Distribuzione dei deal_type."""
+    await snapshot.refresh(db)
+    target_list = _parse_targets(targets)
+    key = ("deal_types", tuple(target_list or ()), relevant_only)
+    return snapshot.cached(key, lambda: snapshot.deal_type_mix(target_list, relevant_only))
+
+@app.get("/api/analytics/scores")
+async def get_moving_scores(window: int = Query(90, ge=1, le=730), days: int = Query(365, ge=1, le=3650),
+                            targets: Optional[str] = None, db: AsyncSession = Depends(get_async_db)):
+    """Punteggio su finestra mobile per target (stessa formula della heatmap)."""
+    await snapshot.refresh(db)
+    target_list = _parse_targets(targets)
+    key = ("scores", window, days, tuple(target_list or ()), date.today())
+    return snapshot.cached(key, lambda: snapshot.moving_scores(window, target_list, days))
+
+# --- ENTITÀ (investitori / aziende normalizzati) ---
+async def _get_entity(db: AsyncSession, name: str) -> EntityModel:
+    entity = (await db.execute(
+        select(EntityModel).filter(EntityModel.normalized_name == normalize_name(name))
+    )).scalar_one_or_none()
+    if entity is None:
+        raise HTTPException(status_code=404, detail=f"Entità non trovata: {name}")
+    return entity
+
+@app.get("/api/entities")
+async def search_entities(q: str = "", limit: int = Query(20, le=200), db: AsyncSession = Depends(get_async_db)):
+    """Ricerca per prefisso sul nome normalizzato, con numero di deal collegati."""
+    stmt = select(
+        EntityModel.id, EntityModel.name, func.count(func.distinct(DealEntityModel.deal_id)).label("deals")
+    ).join(DealEntityModel, DealEntityModel.entity_id == EntityModel.id).filter(
+        EntityModel.normalized_name.startswith(normalize_name(q))
+    ).group_by(EntityModel.id).order_by(func.count(func.distinct(DealEntityModel.deal_id)).desc()).limit(limit)
+    rows = (await db.execute(stmt)).all()
+    return [{"id": r.id, "name": r.name, "deals": r.deals} for r in rows]
+
+@app.get("/api/entities/deals")
+async def get_entity_deals(name: str, role: Optional[str] = None, relevant_only: bool = True,
+                           limit: int = Query(100, le=1000), db: AsyncSession = Depends(get_async_db)):
+    """Tutti i deal che coinvolgono un'entità (es. 'NewSpace Capital'), opzionalmente per ruolo."""
+    entity = await _get_entity(db, name)
+    stmt = select(DealModel, DealEntityModel.role).join(
+        DealEntityModel, DealEntityModel.deal_id == DealModel.id
+    ).filter(DealEntityModel.entity_id == entity.id)
+    if role:
+        stmt = stmt.filter(DealEntityModel.role == role)
+    if relevant_only:
+        stmt = stmt.filter(DealModel.is_relevant == True)
+    stmt = stmt.order_by(DealModel.published_date.desc().nullslast()).limit(limit)
+    rows = (await db.execute(stmt)).all()
+    return {
+        "entity": {"id": entity.id, "name": entity.name},
+        "deals": [
+            {"id": d.id, "url": d.url, "title": d.title, "published_date": d.published_date,
+             "role": r, "deal_type": (d.analysis_payload or {}).get("deal_type")}
+            for d, r in rows
+        ],
+    }
+
+@app.get("/api/entities/co-investors")
+async def get_co_investors(name: str, limit: int = Query(50, le=500), db: AsyncSession = Depends(get_async_db)):
+    """Investitori che compaiono negli stessi deal dell'entità indicata, con numero di deal in comune."""
+    entity = await _get_entity(db, name)
+    mine = aliased(DealEntityModel)
+    other = aliased(DealEntityModel)
+    shared = func.count(func.distinct(other.deal_id))
+    stmt = select(EntityModel.id, EntityModel.name, shared.label("shared_deals")).select_from(mine).join(
+        other, (other.deal_id == mine.deal_id) & (other.entity_id != mine.entity_id)
+    ).join(EntityModel, EntityModel.id == other.entity_id).filter(
+        mine.entity_id == entity.id, mine.role == ROLE_INVESTOR, other.role == ROLE_INVESTOR
+    ).group_by(EntityModel.id).order_by(shared.desc()).limit(limit)
+    rows = (await db.execute(stmt)).all()
+    return {
+        "entity": {"id": entity.id, "name": entity.name},
+        "co_investors": [{"id": r.id, "name": r.name, "shared_deals": r.shared_deals} for r in rows],
+    }
@@ -0,0 +1,197 @@
+"""
+Metriche Prometheus condivise da API e worker.
+
+- API: esposte su GET /metrics (main.py).
+- Worker Celery: server HTTP dedicato (METRICS_PORT, default 9100) avviato al boot.
+  Con il pool prefork impostare PROMETHEUS_MULTIPROC_DIR così che le metriche
+  dei processi figli vengano aggregate.
+"""
+import os
+import time
+from contextlib import contextmanager
+
+# La cartella multiprocess deve esistere prima che vengano create le metriche
+MULTIPROC_DIR = os.getenv("PROMETHEUS_MULTIPROC_DIR")
+if MULTIPROC_DIR:
+    os.makedirs(MULTIPROC_DIR, exist_ok=True)
+
+from prometheus_client import (
+    CollectorRegistry, Counter, Gauge, Histogram,
+    CONTENT_TYPE_LATEST, REGISTRY, generate_latest, multiprocess, start_http_server,
+)
+
+# ==========================================
+# 1. PIPELINE DI SCRAPING
+# ==========================================
+STAGE_BUCKETS = (0.005, 0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+
+STAGE_SECONDS = Histogram(
+    "spacescraper_stage_seconds",
+    "Durata di ogni stage della pipeline (fetch, parse, llm, db, ...)",
+    ["source", "stage"],
+    buckets=STAGE_BUCKETS,
+)
+
+LLM_CALLS = Counter(
+    "spacescraper_llm_calls_total",
+    "Chiamate LLM per modello ed esito",
+    ["model", "outcome"],
+)
+
+LLM_TOKENS = Counter(
+    "spacescraper_llm_tokens_total",
+    "Token LLM consumati per modello e tipo (prompt/completion/cached)",
+    ["model", "kind"],
+)
+
+LLM_CALL_SECONDS = Histogram(
+    "spacescraper_llm_call_seconds",
+    "Latenza della singola chiamata LLM riuscita per modello (include il riuso del prefisso in cache)",
+    ["model"],
+    buckets=STAGE_BUCKETS,
+)
+
+RETRIES = Counter(
+    "spacescraper_retries_total",
+    "Retry eseguiti per componente (fetch/llm) e motivo (429, status, error)",
+    ["component", "reason"],
+)
+
+SLEEP_SECONDS = Counter(
+    "spacescraper_sleep_seconds_total",
+    "Tempo passato in sleep (backoff, throttling) per componente",
+    ["component"],
+)
+
+BREAKER_TRIPS = Counter(
+    "spacescraper_breaker_trips_total",
+    "Aperture del circuit breaker per componente (fetch/llm) e host/provider",
+    ["component", "key"],
+)
+
+BREAKER_REJECTIONS = Counter(
+    "spacescraper_breaker_rejections_total",
+    "Chiamate rifiutate subito perché il circuit breaker era aperto",
+    ["component", "key"],
+)
+
+CASCADE_DECISIONS = Counter(
+    "spacescraper_cascade_decisions_total",
+    "Esito del primo passaggio del modello piccolo in modalità cascade",
+    ["decision"],
+)
+
+ARTICLES = Counter(
+    "spacescraper_articles_total",
+    "Articoli attraversati dalla pipeline per sorgente ed esito",
+    ["source", "outcome"],
+)
+
+# ==========================================
+# 2. API E CODE
+# ==========================================
+API_REQUEST_SECONDS = Histogram(
+    "spacescraper_api_request_seconds",
+    "Latenza delle richieste HTTP all'API",
+    ["method", "route", "status"],
+)
+
+QUEUE_DEPTH = Gauge(
+    "spacescraper_queue_depth",
+    "Task in attesa nella coda Celery",
+    ["queue"],
+    multiprocess_mode="livemax",
+)
+
+
+@contextmanager
+def stage_timer(source: str, stage: str):
+    """Misura la durata del blocco nell'istogramma per (source, stage)."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        STAGE_SECONDS.labels(source=source or "unknown", stage=stage).observe(time.perf_counter() - start)
+
+
+def sleep(component: str, seconds: float):
+    """time.sleep che registra il tempo speso in attesa."""
+    if seconds <= 0:
+        return
+    SLEEP_SECONDS.labels(component=component).inc(seconds)
+    time.sleep(seconds)
+
+
+def _field(obj, key):
+    if obj is None:
+        return None
+    return obj.get(key) if isinstance(obj, dict) else getattr(obj, key, None)
+
+
+def record_llm_usage(model: str, usage, seconds: float = None) -> dict:
+    """
+    Registra i token dalla `usage` di una risposta OpenAI-compatibile (oggetto o dict)
+    e restituisce {"prompt", "completion", "cached"} per la contabilità del singolo run.
+    I token in cache arrivano in forme diverse a seconda del provider:
+    prompt_tokens_details.cached_tokens (OpenAI/Mistral/Groq), prompt_cache_hit_tokens,
+    cache_read_input_tokens.
+    """
+    if seconds is not None:
+        LLM_CALL_SECONDS.labels(model=model).observe(seconds)
+    if usage is None:
+        return {}
+    cached = (
+        _field(_field(usage, "prompt_tokens_details"), "cached_tokens")
+        or _field(usage, "prompt_cache_hit_tokens")
+        or _field(usage, "cache_read_input_tokens")
+        or 0
+    )
+    tokens = {
+        "prompt": _field(usage, "prompt_tokens") or 0,
+        "completion": _field(usage, "completion_tokens") or 0,
+        "cached": cached,
+    }
+    for kind, value in tokens.items():
+        LLM_TOKENS.labels(model=model, kind=kind).inc(value)
+    return tokens
+
+
+def update_queue_depth(broker_url: str, queues=("celery",)) -> dict:
+    """Legge la lunghezza delle code Redis del broker Celery ({coda: task in attesa}, vuoto se Redis non risponde)."""
+    import redis
+    depths = {}
+    try:
+        client = redis.Redis.from_url(broker_url, socket_timeout=1)
+        for q in queues:
+            depths[q] = client.llen(q)
+            QUEUE_DEPTH.labels(queue=q).set(depths[q])
+    except Exception as e:
+        print(f"[Metrics] Impossibile leggere la coda: {e}")
+    return depths
+
+
+def render_latest():
+    """Restituisce (body, content_type) in formato Prometheus."""
+    if MULTIPROC_DIR:
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = REGISTRY
+    return generate_latest(registry), CONTENT_TYPE_LATEST
+
+
+def start_worker_metrics_server(port: int = None) -> None:
+    """Avvia l'endpoint /metrics del worker (una sola volta, nel processo principale)."""
+    port = port or int(os.getenv("METRICS_PORT", "9100"))
+    if MULTIPROC_DIR:
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        start_http_server(port, registry=registry)
+    else:
+        start_http_server(port)
+    print(f"[Metrics] Endpoint worker in ascolto su :{port}")
+
+
+def mark_process_dead(pid: int) -> None:
+    if MULTIPROC_DIR:
+        multiprocess.mark_process_dead(pid)
@@ -1,11 +1,11 @@
-from typing import List, Optional, Any, Union
-from datetime import datetime
+from typing import List, Optional, Any, Union, Dict, Tuple
+from datetime import date, datetime
 from enum import Enum
 from pydantic import BaseModel, Field
 
 # --- IMPORTS PER DATABASE (SQLAlchemy) ---
-from sqlalchemy import Column, Integer, String, DateTime, Boolean
-from sqlalchemy.dialects.postgresql import JSONB
+from sqlalchemy import Column, Integer, String, Date, DateTime, Boolean, Float, Text, ForeignKey, Index, UniqueConstraint, LargeBinary
+from sqlalchemy.dialects.postgresql import ARRAY, JSONB
 from sqlalchemy.sql import func
 from database import Base
 
@@ -35,6 +35,9 @@ class DealModel(Base):
     Questa classe definisce la tabella 'deals' nel database PostgreSQL.
     """
     __tablename__ = "deals"
+    __table_args__ = (
+        Index("ix_deals_matched_targets", "matched_targets", postgresql_using="gin"),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     
@@ -48,17 +51,153 @@ class DealModel(Base):
     title = Column(String)
     published_date = Column(DateTime(timezone=True), nullable=True)
     created_at = Column(DateTime(timezone=True), server_default=func.now())
+    # Ultima scrittura: watermark per gli aggiornamenti incrementali (analytics)
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now(), index=True)
     
     # Flag di stato rapido
     is_relevant = Column(Boolean, default=False)
 
     # input esatto dell'utente (es. "ICEYE")
     search_target = Column(String, index=True, nullable=True)
+    # Tutti i target della watchlist trovati nell'articolo (es. ["ICEYE", "PLANET"])
+    matched_targets = Column(ARRAY(String), nullable=True)
     
     # --- IL CUORE IBRIDO: JSONB ---
     analysis_payload = Column(JSONB, nullable=False)
 
 
+class EntityModel(Base):
+    """
+    Aziende / investitori normalizzati (vedi entities.normalize_name).
+    """
+    __tablename__ = "entities"
+
+    id = Column(Integer, primary_key=True)
+    name = Column(String, nullable=False)
+    normalized_name = Column(String, unique=True, index=True, nullable=False)
+
+
+class DealEntityModel(Base):
+    """
+    Link deal <-> entità con il ruolo (investor, acquirer, target, mentioned).
+    """
+    __tablename__ = "deal_entities"
+
+    deal_id = Column(Integer, ForeignKey("deals.id", ondelete="CASCADE"), primary_key=True)
+    entity_id = Column(Integer, ForeignKey("entities.id", ondelete="CASCADE"), primary_key=True)
+    role = Column(String, primary_key=True)
+
+    __table_args__ = (
+        Index("ix_deal_entities_entity_role", "entity_id", "role"),
+    )
+
+
+class TaskResultModel(Base):
+    """
+    Deal prodotti da un task, in ordine di scrittura.
+    L'id crescente fa da cursore per /api/tasks/{task_id}/results?after=<cursor>.
+    """
+    __tablename__ = "task_results"
+
+    id = Column(Integer, primary_key=True)
+    task_id = Column(String, index=True, nullable=False)
+    deal_id = Column(Integer, ForeignKey("deals.id", ondelete="CASCADE"), nullable=False)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+
+
+class RawContentModel(Base):
+    """
+    Contenuto grezzo degli articoli, indirizzato per contenuto (sha256 dell'HTML):
+    lo stesso testo trovato da più sorgenti o riscaricato invariato viene salvato una volta.
+    """
+    __tablename__ = "raw_contents"
+
+    content_hash = Column(String(64), primary_key=True)
+    # HTML in UTF-8 compresso zlib (lo stesso blob di articles.Article)
+    data = Column(LargeBinary, nullable=False)
+    size = Column(Integer, nullable=False)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+
+
+class ArchivedArticleModel(Base):
+    """
+    Articolo scaricato (metadati + riferimento al contenuto), scritto al momento del fetch.
+    Permette di rianalizzare senza riscaricare dalle sorgenti (archive.py).
+    """
+    __tablename__ = "archived_articles"
+    __table_args__ = (
+        Index("ix_archived_articles_matched_targets", "matched_targets", postgresql_using="gin"),
+    )
+
+    id = Column(Integer, primary_key=True)
+    url = Column(String, unique=True, index=True, nullable=False)
+    source = Column(String, index=True, nullable=False)
+    source_labels = Column(ARRAY(String), nullable=True)
+    title = Column(String)
+    # Data come arriva dalla sorgente (RSS/ISO) e interpretata, per i filtri
+    date_raw = Column(String, nullable=True)
+    published_date = Column(DateTime(timezone=True), index=True, nullable=True)
+    matched_targets = Column(ARRAY(String), nullable=True)
+    content_hash = Column(String(64), ForeignKey("raw_contents.content_hash"), nullable=False)
+    fetched_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
+
+
+class TaskProfileModel(Base):
+    """
+    Artefatto di profilazione di un task (stack "folded" + timeline degli span).
+    """
+    __tablename__ = "task_profiles"
+
+    task_id = Column(String, primary_key=True)
+    folded_stacks = Column(Text, nullable=False, default="")
+    spans = Column(JSONB, nullable=False)
+    samples = Column(Integer, default=0)
+    duration_seconds = Column(Float, nullable=True)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+
+
+class BackfillJobModel(Base):
+    """
+    Backfill storico: intervallo di date x target x sorgenti, diviso in chunk mensili.
+    `settings` sono le ScrapeSettings di base (modello, prompt, chiave, ...).
+    """
+    __tablename__ = "backfill_jobs"
+
+    id = Column(Integer, primary_key=True)
+    status = Column(String, nullable=False, default="running")  # running | completed | cancelled
+    settings = Column(JSONB, nullable=False)
+    date_from = Column(Date, nullable=False)
+    date_to = Column(Date, nullable=False)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
+
+
+class BackfillChunkModel(Base):
+    """
+    Checkpoint di un backfill: un (target, sorgente, periodo). `done` non viene mai rieseguito;
+    gli altri stati vengono ripresi da resume (dopo crash o riavvio).
+    """
+    __tablename__ = "backfill_chunks"
+
+    id = Column(Integer, primary_key=True)
+    job_id = Column(Integer, ForeignKey("backfill_jobs.id", ondelete="CASCADE"), nullable=False, index=True)
+    target = Column(String, nullable=False)
+    source = Column(String, nullable=False)
+    period_start = Column(Date, nullable=False)
+    period_end = Column(Date, nullable=False)
+    # pending | queued | running | done | failed
+    status = Column(String, nullable=False, default="pending", index=True)
+    attempts = Column(Integer, nullable=False, default=0)
+    task_id = Column(String, nullable=True)
+    results_count = Column(Integer, nullable=True)
+    error = Column(Text, nullable=True)
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
+
+    __table_args__ = (
+        UniqueConstraint("job_id", "target", "source", "period_start", name="uq_backfill_chunk"),
+    )
+
+
 # ==========================================
 # 2. MODELLI DATI (Pydantic - Validazione)
 # ==========================================
@@ -79,7 +218,8 @@ class DealData(BaseModel):
     deal_status: Optional[str] = "unknown"
     acquirer: Optional[Any] = None
     target: Optional[Any] = None
-    investors: Optional[List[str]] = []
+    # Stringhe o oggetti {name, type, role}, come restituiti dall'LLM
+    investors: Optional[List[Union[str, Dict[str, Any]]]] = []
     amount: Optional[Union[str, int, float]] = None
     currency: Optional[str] = "USD"
     valuation: Optional[Union[str, int, float]] = None
@@ -104,20 +244,74 @@ class DealData(BaseModel):
 
 # --- CONFIGURAZIONE SCRAPER (Input Utente) ---
 class ScrapeSettings(BaseModel):
+    # Una o più aziende separate da virgola
     target_companies: str
+
+    # Watchlist: ogni feed/pagina viene scaricato una volta sola e confrontato con tutti i target.
+    # Attiva automaticamente quando i target sono più di uno.
+    watchlist: bool = False
     
     # Supporto a multiple sorgenti
     sources: List[SourceType] = [SourceType.SPACENEWS] 
     
     ai_model: str = "mistral-large-latest"
+
+    # Cascade: modello piccolo/locale (es. "ollama/llama3", "mistral-small-latest") per il primo passaggio.
+    # Si sale ad ai_model solo se l'articolo è rilevante o relevance_score >= soglia.
+    cascade_model: Optional[str] = None
+    cascade_escalation_threshold: float = 0.3
     api_key: Optional[str] = "" 
     system_prompt: Optional[str] = ""
     min_year: int = 2024
+    # Finestra di pubblicazione (inclusiva), applicata solo se impostata (backfill, rianalisi, UI):
+    # le sorgenti che lo supportano filtrano già nella query, le altre lato client.
+    # min_year non restringe la finestra dei run normali (come prima dei backfill).
+    date_from: Optional[date] = None
+    date_to: Optional[date] = None
     max_pages: int = 1
     
     # Opzionale: per forzare la riscrittura se l'URL esiste già nel DB
     force_rescan: bool = False
 
+    # Triage locale prima dell'LLM (attivo solo se il modello è stato addestrato)
+    use_triage: bool = True
+
+    # Opzionale: esegue il task sotto profiler (artefatto su /api/tasks/{task_id}/profile)
+    profile: bool = False
+
+    # Opzionale: tempo massimo del run in secondi. Allo scadere la pipeline smette di prendere
+    # nuovi articoli e restituisce i risultati parziali (il worker lo limita comunque al soft time limit)
+    deadline_seconds: Optional[int] = Field(default=None, gt=0)
+
+    def target_list(self) -> List[str]:
+        """Target separati (vuoti esclusi, ordine e duplicati come da input)."""
+        return [t.strip() for t in self.target_companies.split(",") if t.strip()]
+
+    def is_watchlist(self) -> bool:
+        return self.watchlist or len(self.target_list()) > 1
+
+    def date_window(self) -> Tuple[Optional[date], Optional[date]]:
+        """Finestra di pubblicazione richiesta (inclusiva); (None, None) se non impostata."""
+        return self.date_from, self.date_to
+
+# --- BACKFILL STORICO ---
+class BackfillRequest(BaseModel):
+    settings: ScrapeSettings
+    date_from: date
+    date_to: date
+
+# Rianalisi dall'archivio degli articoli (archive.py): filtri = target, date e sorgenti di settings
+class ReanalyzeRequest(BaseModel):
+    settings: ScrapeSettings
+    limit: Optional[int] = Field(default=None, gt=0)
+    concurrency: Optional[int] = Field(default=None, ge=1, le=16)
+
+# Indagine web + LLM su una watchlist di aziende (agent_service.py)
+class InvestigationRequest(BaseModel):
+    companies: List[str] = Field(min_length=1, max_length=50)
+    ai_model: str = "mistral-large-latest"
+    api_key: Optional[str] = ""
+
 # --- LOGGING E STATO ---
 class LogEntry(BaseModel):
     timestamp: str
@@ -0,0 +1,122 @@
+"""
+Profilazione on-demand dei task di scraping (ScrapeSettings.profile=True).
+
+- SamplingProfiler: thread che campiona periodicamente gli stack di tutti i thread
+  e produce l'output "folded" (compatibile con flamegraph.pl / speedscope).
+- SpanRecorder: timeline degli span per articolo/stage, esportata nel formato
+  Chrome Trace Event (apribile con Perfetto o chrome://tracing).
+
+L'artefatto viene salvato nella tabella `task_profiles` e scaricato
+tramite GET /api/tasks/{task_id}/profile.
+"""
+import os
+import sys
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+from typing import Dict, List
+
+from database import SessionLocal
+from models import TaskProfileModel
+
+SAMPLE_INTERVAL = float(os.getenv("PROFILE_SAMPLE_INTERVAL", "0.005"))
+
+
+class SamplingProfiler:
+    def __init__(self, interval: float = SAMPLE_INTERVAL):
+        self.interval = interval
+        self.stacks: Counter = Counter()
+        self.samples = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="sampling-profiler", daemon=True)
+
+    def _run(self):
+        own_id = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            names = {t.ident: t.name for t in threading.enumerate()}
+            for tid, frame in sys._current_frames().items():
+                if tid == own_id:
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f"{os.path.basename(code.co_filename)}:{code.co_name}")
+                    frame = frame.f_back
+                stack.append(names.get(tid, str(tid)))
+                self.stacks[";".join(reversed(stack))] += 1
+            self.samples += 1
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def folded(self) -> str:
+        return "\n".join(f"{stack} {count}" for stack, count in self.stacks.most_common())
+
+
+class SpanRecorder:
+    def __init__(self):
+        self.origin = time.perf_counter()
+        self.events: List[Dict] = []
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def span(self, name: str, **attrs):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            end = time.perf_counter()
+            event = {
+                "name": name,
+                "ph": "X",
+                "ts": round((start - self.origin) * 1e6),
+                "dur": round((end - start) * 1e6),
+                "pid": os.getpid(),
+                "tid": threading.get_ident(),
+                "args": {k: str(v) for k, v in attrs.items()},
+            }
+            with self._lock:
+                self.events.append(event)
+
+    def trace(self) -> Dict:
+        with self._lock:
+            return {"traceEvents": sorted(self.events, key=lambda e: e["ts"]), "displayTimeUnit": "ms"}
+
+
+@contextmanager
+def capture(task_id: str):
+    """Esegue il blocco sotto profiler e salva l'artefatto (anche in caso di errore)."""
+    profiler = SamplingProfiler()
+    recorder = SpanRecorder()
+    started = time.perf_counter()
+    profiler.start()
+    try:
+        yield recorder
+    finally:
+        profiler.stop()
+        duration = time.perf_counter() - started
+        print(f"[Profiler] Task {task_id}: {profiler.samples} campioni in {duration:.1f}s")
+        _store(task_id, profiler, recorder, duration)
+
+
+def _store(task_id: str, profiler: SamplingProfiler, recorder: SpanRecorder, duration: float):
+    db = SessionLocal()
+    try:
+        db.merge(TaskProfileModel(
+            task_id=task_id,
+            folded_stacks=profiler.folded(),
+            spans=recorder.trace(),
+            samples=profiler.samples,
+            duration_seconds=duration,
+        ))
+        db.commit()
+    except Exception as e:
+        print(f"[Profiler] Errore salvataggio profilo {task_id}: {e}")
+        db.rollback()
+    finally:
+        db.close()
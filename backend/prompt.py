@@ -1,8 +1,10 @@
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Tuple
 import json
 import random
 
-SYSTEM_INSTRUCTIONS = """
+# Parte statica: identica byte per byte tra task diversi (prefisso riusabile dalla
+# prompt cache del provider). Tutto ciò che varia per task va in KEYWORDS_INSTRUCTIONS.
+STATIC_INSTRUCTIONS = """
 # Role
 You are a market intelligence expert, specialized in the space sector and Earth Observation. You identify relevant key details in available news articles and provide a structurized output useful for data analysis.
 
@@ -83,11 +85,15 @@ Meaning of some values:
 # Examples
 {EXAMPLES}
 
-# Relevant keywords:
+"""
+
+KEYWORDS_INSTRUCTIONS = """# Relevant keywords:
 - Companies: {COMPANIES}
 - Event types: {EVENT_TYPES}
 """
 
+SYSTEM_INSTRUCTIONS = STATIC_INSTRUCTIONS + KEYWORDS_INSTRUCTIONS
+
 
 DEFAULT_COMPANIES = ["Iceye", "Rheinmetall"]
 DEFAULT_EVENT_TYPES = ["Partnership", "contract"]
@@ -97,6 +103,24 @@ DEFAULT_SCHEMA = {
     "amount": {"type": "float", "description": "amount involved in the event", "min_value": 0},
 }
 
+# Schema ed eventi usati dalla pipeline (scraper_service): campi di models.DealData
+DEAL_EVENT_TYPES = ["M&A", "Investment", "Contract", "Partnership", "IPO"]
+DEAL_SCHEMA = {
+    "relevance_score": {"type": "float", "description": "final score from 0.0 to 1.0 combining the three relevancy probabilities above"},
+    "is_relevant": {"type": "boolean", "description": "true only if the article reports an event of the requested types involving the requested companies"},
+    "deal_type": {"type": "string", "description": "one of the event types in the relevant keywords, or \"none\""},
+    "deal_status": {"type": "string", "description": "signed, announced, completed, rumored or unknown"},
+    "acquirer": {"type": "string", "description": "acquirer, investor or customer side of the deal"},
+    "target": {"type": "string", "description": "acquired, funded or contracted company"},
+    "investors": {"type": "array", "description": "lead and participating investors, as a list of names"},
+    "amount": {"type": "float", "description": "full numeric value of the deal (9.38 million -> 9380000.0)", "min_value": 0},
+    "currency": {"type": "string", "description": "currency code (USD, EUR, GBP, ...)"},
+    "valuation": {"type": "float", "description": "company valuation, if stated", "min_value": 0},
+    "stake_percent": {"type": "float", "description": "percentage of stake acquired, if stated"},
+    "summary": {"type": "string", "description": "two sentences summary of the event"},
+    "why_it_matters": {"type": "string", "description": "why the event matters for the requested companies"},
+}
+
 class SystemPrompt():
 
     def __init__(self):
@@ -121,14 +145,47 @@ class SystemPrompt():
             COMPANIES=self.format_as_list(companies),
             EVENT_TYPES=self.format_as_list(event_types),
         )
+
+    def configure_split(
+            self,
+            /,
+            schema: Dict[str, Dict[str, Any]] = DEFAULT_SCHEMA,
+            examples: str = DEFAULT_EXAMPLES,
+            companies : List[str] = DEFAULT_COMPANIES,
+            event_types: List[str] = DEFAULT_EVENT_TYPES,
+            divider: str = DEFAULT_DIVIDER,
+        ) -> Tuple[str, str]:
+        """
+        Come configure(), ma restituisce (prefisso statico, contesto variabile).
+        Il prefisso va nel messaggio di sistema, il contesto dopo (nel messaggio utente),
+        così il prefisso resta identico tra task con aziende/eventi diversi.
+        """
+        static = STATIC_INSTRUCTIONS.format(
+            SCHEMA=self.format_as_json_schema(schema),
+            SCHEMA_EXAMPLE=self.format_as_json_example(schema),
+            EXAMPLES=examples,
+            DIVIDER=divider,
+        )
+        return static, self.configure_keywords(companies, event_types)
+
+    def configure_keywords(
+            self,
+            companies: List[str] = DEFAULT_COMPANIES,
+            event_types: List[str] = DEFAULT_EVENT_TYPES,
+        ) -> str:
+        """Solo la parte variabile per task (aziende ed eventi), da mettere dopo il prefisso statico."""
+        return KEYWORDS_INSTRUCTIONS.format(
+            COMPANIES=self.format_as_list(companies),
+            EVENT_TYPES=self.format_as_list(event_types),
+        )
     
     @staticmethod
     def format_as_json_schema(schema: Dict[str, Dict[str, Any]]) -> str:
         lines: List[str] = []
         for key, props in schema.items():
-            lines.append(f"{4 * " "}\"{key}\": {{")
+            lines.append(f"{4 * ' '}\"{key}\": {{")
             for subkey, subval in props.items():
-                lines.append(f"{8 * " "}\"{subkey}\": {subval},")
+                lines.append(f"{8 * ' '}\"{subkey}\": {json.dumps(subval)},")
             lines.append("    },")
         
         lines[-1].strip(",")
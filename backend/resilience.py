@@ -0,0 +1,263 @@
+"""
+Retry, backoff e circuit breaker condivisi da fetch HTTP e chiamate LLM.
+
+- Backoff esponenziale con jitter ("full jitter"), rispettando Retry-After quando presente.
+- RetryBudget: tetto ai retry di un singolo task, così un run non brucia minuti in sleep.
+- CircuitBreaker per host (fetch) o provider (LLM): dopo N fallimenti consecutivi le
+  chiamate falliscono subito per `reset_timeout` secondi, poi una chiamata di prova
+  (half-open) decide se richiudere.
+
+Ogni retry incrementa spacescraper_retries_total, ogni apertura del breaker
+spacescraper_breaker_trips_total (metrics.py).
+"""
+import os
+import random
+import threading
+import time
+from email.utils import parsedate_to_datetime
+from typing import Callable, Dict, Optional, Tuple
+from urllib.parse import urlparse
+
+import requests
+
+import metrics
+
+# Configurazione (override da env)
+MAX_ATTEMPTS = int(os.getenv("RETRY_MAX_ATTEMPTS", "3"))
+BACKOFF_BASE = float(os.getenv("RETRY_BACKOFF_BASE", "1.0"))
+BACKOFF_CAP = float(os.getenv("RETRY_BACKOFF_CAP", "30"))
+# Oltre questa attesa (es. Retry-After di 10 minuti) non si aspetta: si fallisce subito
+MAX_RETRY_WAIT = float(os.getenv("RETRY_MAX_WAIT", "60"))
+TASK_RETRY_BUDGET = int(os.getenv("TASK_RETRY_BUDGET", "30"))
+BREAKER_FAILURES = int(os.getenv("BREAKER_FAILURE_THRESHOLD", "5"))
+BREAKER_RESET_SECONDS = float(os.getenv("BREAKER_RESET_SECONDS", "60"))
+
+RETRYABLE_STATUS = {408, 425, 429, 500, 502, 503, 504}
+
+
+class CircuitOpenError(Exception):
+    """Il breaker dell'host/provider è aperto: la chiamata non viene nemmeno tentata."""
+
+
+class RetryableError(Exception):
+    """Errore transitorio (429, 5xx, timeout). `retry_after` in secondi se noto."""
+
+    def __init__(self, message: str, reason: str = "error", retry_after: Optional[float] = None):
+        super().__init__(message)
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+# ==========================================
+# 1. BACKOFF E RETRY-AFTER
+# ==========================================
+def backoff_delay(attempt: int, base: float = BACKOFF_BASE, cap: float = BACKOFF_CAP) -> float:
+    """Full jitter: uniforme in [0, min(cap, base * 2^attempt)]."""
+    return random.uniform(0, min(cap, base * (2 ** attempt)))
+
+
+def parse_retry_after(value) -> Optional[float]:
+    """Header Retry-After (secondi o HTTP-date) -> secondi di attesa, None se assente/illeggibile."""
+    if value is None or value == "":
+        return None
+    try:
+        return max(0.0, float(value))
+    except (TypeError, ValueError):
+        pass
+    try:
+        when = parsedate_to_datetime(str(value))
+    except (TypeError, ValueError):
+        return None
+    if when is None:
+        return None
+    return max(0.0, when.timestamp() - time.time())
+
+
+# ==========================================
+# 2. BUDGET DI RETRY PER TASK
+# ==========================================
+class RetryBudget:
+    """Numero massimo di retry per task, condiviso da tutti i componenti (thread-safe)."""
+
+    def __init__(self, max_retries: int = TASK_RETRY_BUDGET):
+        self.max_retries = max_retries
+        self.spent = 0
+        self._lock = threading.Lock()
+
+    def try_spend(self) -> bool:
+        with self._lock:
+            if self.spent >= self.max_retries:
+                return False
+            self.spent += 1
+            return True
+
+    @property
+    def exhausted(self) -> bool:
+        with self._lock:
+            return self.spent >= self.max_retries
+
+
+# ==========================================
+# 3. CIRCUIT BREAKER
+# ==========================================
+class CircuitBreaker:
+    CLOSED, OPEN, HALF_OPEN = "closed", "open", "half_open"
+
+    def __init__(self, component: str, key: str,
+                 failure_threshold: int = BREAKER_FAILURES, reset_timeout: float = BREAKER_RESET_SECONDS):
+        self.component = component
+        self.key = key
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self._lock = threading.Lock()
+
+    def allow(self) -> bool:
+        with self._lock:
+            if self.state == self.CLOSED:
+                return True
+            if self.state == self.OPEN and time.monotonic() - self.opened_at >= self.reset_timeout:
+                # Una sola chiamata di prova
+                self.state = self.HALF_OPEN
+                return True
+            return False
+
+    def record_success(self) -> None:
+        with self._lock:
+            self.state = self.CLOSED
+            self.failures = 0
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self.failures += 1
+            if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+                if self.state != self.OPEN:
+                    metrics.BREAKER_TRIPS.labels(component=self.component, key=self.key).inc()
+                    print(f"[Resilience] Circuit breaker APERTO per {self.component}:{self.key} "
+                          f"({self.failures} errori consecutivi)")
+                self.state = self.OPEN
+                self.opened_at = time.monotonic()
+
+    def release_probe(self) -> None:
+        """Prova half-open interrotta senza esito (es. task cancellato): torna aperto, la prossima chiamata riprova."""
+        with self._lock:
+            if self.state == self.HALF_OPEN:
+                self.state = self.OPEN
+
+
+_breakers: Dict[Tuple[str, str], CircuitBreaker] = {}
+_breakers_lock = threading.Lock()
+
+
+def get_breaker(component: str, key: str) -> CircuitBreaker:
+    """Breaker per processo, uno per (componente, host/provider)."""
+    with _breakers_lock:
+        breaker = _breakers.get((component, key))
+        if breaker is None:
+            breaker = _breakers[(component, key)] = CircuitBreaker(component, key)
+        return breaker
+
+
+# ==========================================
+# 4. ESECUZIONE CON RETRY
+# ==========================================
+def call_with_retry(fn: Callable, *, component: str, key: str,
+                    budget: Optional[RetryBudget] = None, attempts: int = MAX_ATTEMPTS):
+    """
+    Esegue fn() con breaker e backoff. fn solleva RetryableError per gli errori transitori;
+    qualsiasi altra eccezione viene propagata subito (non si ritenta) e per il breaker conta
+    come risposta del remoto (es. 4xx, validazione), quindi chiude anche una prova half-open.
+    Solleva CircuitOpenError se il breaker è aperto, altrimenti l'ultimo RetryableError.
+    """
+    breaker = get_breaker(component, key)
+    for attempt in range(attempts):
+        if not breaker.allow():
+            metrics.BREAKER_REJECTIONS.labels(component=component, key=key).inc()
+            raise CircuitOpenError(f"{component}:{key} non disponibile (circuit breaker aperto)")
+        try:
+            result = fn()
+        except RetryableError as e:
+            breaker.record_failure()
+            last_attempt = attempt == attempts - 1
+            wait = e.retry_after if e.retry_after is not None else backoff_delay(attempt)
+            if last_attempt or wait > MAX_RETRY_WAIT:
+                raise
+            if budget is not None and not budget.try_spend():
+                metrics.RETRIES.labels(component=component, reason="budget_exhausted").inc()
+                raise
+            metrics.RETRIES.labels(component=component, reason=e.reason).inc()
+            metrics.sleep(component, wait)
+            continue
+        except Exception:
+            breaker.record_success()
+            raise
+        except BaseException:
+            # Interruzione (cancellazione, shutdown): la prova half-open non resta appesa
+            breaker.release_probe()
+            raise
+        breaker.record_success()
+        return result
+
+
+# ==========================================
+# 5. HTTP
+# ==========================================
+def http_request(method: str, url: str, *, session=None, budget: Optional[RetryBudget] = None,
+                 component: str = "fetch", key: Optional[str] = None, **kwargs) -> requests.Response:
+    """
+    Richiesta HTTP con retry sugli errori transitori (connessione, timeout, 429, 5xx).
+    Breaker per host, salvo `key` esplicita (es. il provider LLM).
+    """
+    client = session if session is not None else requests
+    kwargs.setdefault("timeout", 15)
+
+    def attempt():
+        try:
+            r = client.request(method, url, **kwargs)
+        except (requests.ConnectionError, requests.Timeout) as e:
+            raise RetryableError(str(e), reason="error")
+        if r.status_code in RETRYABLE_STATUS:
+            reason = "429" if r.status_code == 429 else "status"
+            raise RetryableError(f"HTTP {r.status_code} da {url}", reason=reason,
+                                 retry_after=parse_retry_after(r.headers.get("Retry-After")))
+        return r
+
+    return call_with_retry(attempt, component=component, key=key or urlparse(url).netloc, budget=budget)
+
+
+def http_get(url: str, **kwargs) -> requests.Response:
+    return http_request("GET", url, **kwargs)
+
+
+# ==========================================
+# 6. LLM
+# ==========================================
+def llm_provider(model_name: str) -> str:
+    """Chiave del breaker LLM: il provider, non il singolo modello."""
+    model_name = model_name.lower()
+    for provider in ("ollama", "groq"):
+        if provider in model_name:
+            return provider
+    return "mistral"
+
+
+def as_retryable_llm_error(e: Exception) -> Optional[RetryableError]:
+    """
+    Classifica un'eccezione del client LLM (litellm/instructor/openai).
+    Restituisce un RetryableError per 429/5xx/timeout, None per errori definitivi
+    (chiave errata, context length, validazione).
+    """
+    status = getattr(e, "status_code", None)
+    response = getattr(e, "response", None)
+    headers = getattr(response, "headers", None) or {}
+    retry_after = parse_retry_after(headers.get("retry-after") or headers.get("Retry-After")) if headers else None
+    text = str(e).lower()
+
+    if status == 429 or "429" in text or "rate limit" in text:
+        return RetryableError(str(e), reason="429", retry_after=retry_after)
+    if (isinstance(status, int) and status >= 500) or "timeout" in text or "timed out" in text \
+            or "connection" in text or "service unavailable" in text:
+        return RetryableError(str(e), reason="status" if status else "error", retry_after=retry_after)
+    return None
@@ -0,0 +1,170 @@
+"""
+Cache delle risposte per gli endpoint di lettura.
+
+- Un contatore di versione dei dati (Redis) viene incrementato dal worker ad ogni
+  scrittura di un deal: le chiavi di cache includono la versione, quindi
+  nessuna invalidazione esplicita è necessaria.
+- Cache a due livelli: LRU in-process + Redis (condivisa tra i processi API).
+- ETag forte (hash del body, con suffisso per codifica: "<sha1>-br") e risposta 304 su If-None-Match.
+- Serializzazione con orjson e compressione gzip/brotli secondo Accept-Encoding.
+"""
+import gzip
+import hashlib
+import os
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+import orjson
+import redis
+import redis.asyncio as aioredis
+from fastapi import Request, Response
+
+try:
+    import brotli
+except ImportError:  # brotli è opzionale: si ripiega su gzip
+    brotli = None
+
+REDIS_URL = os.getenv("REDIS_URL", os.getenv("CELERY_BROKER_URL", "redis://redis:6379/0"))
+VERSION_KEY = "spacescraper:data_version"
+CACHE_PREFIX = "spacescraper:response"
+LOCAL_MAX_ENTRIES = int(os.getenv("RESPONSE_CACHE_LOCAL_ENTRIES", "256"))
+REDIS_TTL_SECONDS = int(os.getenv("RESPONSE_CACHE_TTL", "3600"))
+MIN_COMPRESS_SIZE = 1024
+
+_sync_client: Optional[redis.Redis] = None
+_async_client: Optional[aioredis.Redis] = None
+
+
+# ==========================================
+# 1. VERSIONE DEI DATI
+# ==========================================
+def bump_data_version() -> None:
+    """Chiamata dal worker dopo ogni commit di deal."""
+    global _sync_client
+    try:
+        if _sync_client is None:
+            _sync_client = redis.Redis.from_url(REDIS_URL, socket_timeout=1)
+        _sync_client.incr(VERSION_KEY)
+    except Exception as e:
+        print(f"[Cache] Impossibile aggiornare la versione dei dati: {e}")
+
+
+async def get_data_version() -> Optional[int]:
+    global _async_client
+    try:
+        if _async_client is None:
+            _async_client = aioredis.Redis.from_url(REDIS_URL, socket_timeout=1)
+        return int(await _async_client.get(VERSION_KEY) or 0)
+    except Exception as e:
+        print(f"[Cache] Versione dei dati non disponibile, cache disattivata: {e}")
+        return None
+
+
+# ==========================================
+# 2. VOCI DI CACHE
+# ==========================================
+class CachedBody:
+    def __init__(self, body: bytes):
+        self.body = body
+        self.digest = hashlib.sha1(body).hexdigest()
+        self._encoded: Dict[str, bytes] = {"identity": body}
+
+    def etag(self, encoding: str) -> str:
+        # Un validatore forte distingue le codifiche: body identity, gzip e br sono diversi
+        return f'"{self.digest}"' if encoding == "identity" else f'"{self.digest}-{encoding}"'
+
+    def encoded(self, encoding: str) -> bytes:
+        if encoding not in self._encoded:
+            if encoding == "br":
+                self._encoded[encoding] = brotli.compress(self.body, quality=5)
+            else:
+                self._encoded[encoding] = gzip.compress(self.body, compresslevel=6)
+        return self._encoded[encoding]
+
+
+_local: "OrderedDict[str, CachedBody]" = OrderedDict()
+
+
+def _local_get(key: str) -> Optional[CachedBody]:
+    entry = _local.get(key)
+    if entry is not None:
+        _local.move_to_end(key)
+    return entry
+
+
+def _local_put(key: str, entry: CachedBody) -> None:
+    _local[key] = entry
+    _local.move_to_end(key)
+    while len(_local) > LOCAL_MAX_ENTRIES:
+        _local.popitem(last=False)
+
+
+def _cache_key(endpoint: str, params: Dict[str, Any], version: int) -> str:
+    params_str = "&".join(f"{k}={params[k]}" for k in sorted(params))
+    return f"{CACHE_PREFIX}:{endpoint}:{hashlib.sha1(params_str.encode()).hexdigest()}:{version}"
+
+
+def _pick_encoding(request: Request, size: int) -> str:
+    if size < MIN_COMPRESS_SIZE:
+        return "identity"
+    accepted = request.headers.get("accept-encoding", "")
+    if brotli is not None and "br" in accepted:
+        return "br"
+    if "gzip" in accepted:
+        return "gzip"
+    return "identity"
+
+
+def _etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """If-None-Match: lista separata da virgole o '*', confronto debole (W/ ignorato)."""
+    if not if_none_match:
+        return False
+    for candidate in if_none_match.split(","):
+        candidate = candidate.strip()
+        if candidate == "*":
+            return True
+        if candidate.startswith("W/"):
+            candidate = candidate[2:]
+        if candidate == etag:
+            return True
+    return False
+
+
+# ==========================================
+# 3. RISPOSTA
+# ==========================================
+async def cached_json_response(request: Request, endpoint: str, params: Dict[str, Any],
+                               compute: Callable[[], Awaitable[Any]]) -> Response:
+    """Serve `compute()` da cache se la versione dei dati non è cambiata."""
+    version = await get_data_version()
+    entry = None
+    key = _cache_key(endpoint, params, version) if version is not None else None
+
+    if key:
+        entry = _local_get(key)
+        if entry is None:
+            try:
+                body = await _async_client.get(key)
+            except Exception:
+                body = None
+            if body is not None:
+                entry = CachedBody(body)
+                _local_put(key, entry)
+
+    if entry is None:
+        entry = CachedBody(orjson.dumps(await compute(), option=orjson.OPT_NON_STR_KEYS))
+        if key:
+            _local_put(key, entry)
+            try:
+                await _async_client.set(key, entry.body, ex=REDIS_TTL_SECONDS)
+            except Exception:
+                pass
+
+    encoding = _pick_encoding(request, len(entry.body))
+    headers = {"ETag": entry.etag(encoding), "Cache-Control": "no-cache", "Vary": "Accept-Encoding"}
+    if _etag_matches(request.headers.get("if-none-match"), headers["ETag"]):
+        return Response(status_code=304, headers=headers)
+
+    if encoding != "identity":
+        headers["Content-Encoding"] = encoding
+    return Response(content=entry.encoded(encoding), media_type="application/json", headers=headers)
@@ -2,27 +2,124 @@ import time
 import requests
 import feedparser
 import os
-import random
+import re
+import threading
 import dateutil.parser
 from abc import ABC, abstractmethod
-from typing import List, Dict, Set
-from bs4 import BeautifulSoup
+from typing import Callable, List, Dict, Optional, Tuple
+from collections import Counter, deque
 from fake_useragent import UserAgent
 from sqlalchemy.orm import Session
 from litellm import completion
 import instructor
-from concurrent.futures import ThreadPoolExecutor, as_completed
-from datetime import datetime
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, as_completed, wait
+from contextlib import nullcontext
+from datetime import date, datetime
+from articles import Article, intern_labels
 from database import SessionLocal
-from models import ScrapeSettings, DealModel, DealData, SourceType
+from models import ScrapeSettings, DealModel, DealData, SourceType, TaskResultModel
+import archive
+import metrics
+import resilience
+from resilience import CircuitOpenError, RetryableError, RetryBudget
+from entities import index_deal_entities
+from llm import llm_route
+from response_cache import bump_data_version
+from triage import is_llm_failure, load_default_model
+from prompt import DEAL_EVENT_TYPES, DEAL_SCHEMA, SystemPrompt
 
+# Endpoint delle sorgenti (sovrascrivibili, es. per i benchmark offline; quelli LLM in llm.py)
+SPACENEWS_BASE_URL = os.getenv("SPACENEWS_BASE_URL", "https://spacenews.com")
+SNAPI_BASE_URL = os.getenv("SNAPI_BASE_URL", "https://api.spaceflightnewsapi.net/v4")
+VIA_SATELLITE_FEED_URL = os.getenv("VIA_SATELLITE_FEED_URL", "https://www.satellitetoday.com/feed/")
+NASA_TECHPORT_BASE_URL = os.getenv("NASA_TECHPORT_BASE_URL", "https://techport.nasa.gov")
+
+# Prefisso statico del prompt (schema DealData), calcolato una volta per processo
+_prompt = SystemPrompt()
+STATIC_SYSTEM_PROMPT, _ = _prompt.configure_split(schema=DEAL_SCHEMA, event_types=DEAL_EVENT_TYPES)
+
+def _score(value) -> Optional[float]:
+    """relevance_score dell'LLM (numero o stringa) -> float, None se assente."""
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+def _parse_date(value):
+    """Data dell'articolo (RSS/ISO) -> datetime, None se non interpretabile."""
+    if not value:
+        return None
+    try:
+        return dateutil.parser.parse(value)
+    except (ValueError, OverflowError, TypeError):
+        return None
+
+class TargetMatcher:
+    """Trova in un solo passaggio (una regex) quali target della watchlist compaiono in un testo."""
+
+    def __init__(self, targets: List[str]):
+        # chiave minuscola -> etichetta (maiuscola, come search_target)
+        self._labels = {t.lower(): t.upper() for t in targets}
+        alternatives = "|".join(re.escape(t) for t in sorted(self._labels, key=len, reverse=True))
+        self._regex = re.compile(rf"(?<!\w)(?:{alternatives})(?!\w)", re.IGNORECASE) if alternatives else None
+
+    def match(self, *texts) -> List[str]:
+        if self._regex is None:
+            return []
+        found = {}
+        for text in texts:
+            for m in self._regex.finditer(text or ""):
+                found[self._labels[m.group(0).lower()]] = None
+        return list(found)
+
+class RequestCoalescer:
+    """
+    Single-flight per il run: richieste identiche (stessa chiave) vengono eseguite una volta
+    e il risultato è condiviso da tutti i chiamanti, anche concorrenti.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._results: Dict[tuple, Future] = {}
+        self.coalesced = 0
+
+    def get(self, key: tuple, fn: Callable):
+        with self._lock:
+            future = self._results.get(key)
+            owner = future is None
+            if owner:
+                future = self._results[key] = Future()
+            else:
+                self.coalesced += 1
+        if owner:
+            try:
+                future.set_result(fn())
+            except BaseException as e:
+                future.set_exception(e)
+        return future.result()
+
+    def clear(self) -> None:
+        """Fine della fase di download: i feed/risposte condivisi non servono più, si liberano."""
+        with self._lock:
+            self._results.clear()
 
 # ==========================================
 # 1. CLASSE BASE ADAPTER
 # ==========================================
 class BaseAdapter(ABC):
-    def __init__(self, settings: ScrapeSettings):
+    # Etichetta usata nelle metriche
+    source_label = "unknown"
+
+    def __init__(self, settings: ScrapeSettings, retry_budget: Optional[RetryBudget] = None,
+                 coalescer: Optional[RequestCoalescer] = None):
         self.settings = settings
+        # Budget di retry condiviso con il resto del task (None = solo tentativi per chiamata)
+        self.retry_budget = retry_budget
+        # Richieste e feed condivisi tra gli adapter dello stesso run (None = nessuna condivisione)
+        self.coalescer = coalescer
+        self.targets = settings.target_list()
+        self.watchlist = settings.is_watchlist()
+        self.matcher = TargetMatcher(self.targets)
         self.ua = UserAgent()
         try:
             self.headers = {"User-Agent": self.ua.random}
@@ -30,114 +127,213 @@ class BaseAdapter(ABC):
              self.headers = {"User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64)"}
         
     def _make_request(self, url, params=None, is_json=True):
-        for attempt in range(3):
-            try:
-                r = requests.get(url, params=params, headers=self.headers, timeout=15)
-                if r.status_code == 200:
-                    return r.json() if is_json else r.text
-                elif r.status_code == 429:
-                    time.sleep(5)
-                else:
-                    pass
-            except Exception:
-                pass
-            time.sleep(1)
-        return None
+        """GET con retry/backoff/breaker (resilience.py). None se la sorgente non risponde."""
+        if self.coalescer is None:
+            return self._request(url, params, is_json)
+        key = ("GET", url, tuple(sorted((params or {}).items())), is_json)
+        return self.coalescer.get(key, lambda: self._request(url, params, is_json))
+
+    def _request(self, url, params, is_json):
+        try:
+            with metrics.stage_timer(self.source_label, "fetch"):
+                r = resilience.http_get(url, params=params, headers=self.headers, budget=self.retry_budget)
+        except (RetryableError, CircuitOpenError) as e:
+            print(f"[{self.source_label}] Fetch fallito: {e}")
+            return None
+        except requests.RequestException as e:
+            print(f"[{self.source_label}] Errore richiesta: {e}")
+            return None
+        if r.status_code != 200:
+            return None
+        try:
+            return r.json() if is_json else r.text
+        except ValueError:
+            return None
+
+    def _date_window(self) -> Tuple[Optional[date], Optional[date]]:
+        return self.settings.date_window()
+
+    def _in_window(self, value) -> bool:
+        """Filtro lato client (sorgenti senza filtro per data nella query). Date illeggibili: l'articolo resta."""
+        parsed = _parse_date(value)
+        if parsed is None:
+            return True
+        start, end = self._date_window()
+        day = parsed.date()
+        return (start is None or day >= start) and (end is None or day <= end)
+
+    def _article(self, source: str, url: str, title: str, date: str, raw_content: str) -> Article:
+        """
+        Record compatto dell'articolo (articles.py), etichettato con i target citati (titolo + contenuto).
+        In watchlist gli articoli senza target vengono poi scartati; una ricerca per singolo target
+        tiene comunque il suo.
+        """
+        matched = self.matcher.match(title, raw_content)
+        return Article(source, url, title, date, raw_content,
+                       matched_targets=matched or [t.upper() for t in self.targets], target_hit=bool(matched))
+
+    def _keep(self, article: Article) -> bool:
+        return article.target_hit or not self.watchlist
+
+    def _fetch_feed(self, rss_url):
+        """Feed RSS scaricato con _make_request (retry e breaker), poi parsato da feedparser (una volta per run)."""
+        def fetch_and_parse():
+            body = self._make_request(rss_url, is_json=False)
+            return feedparser.parse(body or "")
+        if self.coalescer is None:
+            return fetch_and_parse()
+        return self.coalescer.get(("FEED", rss_url), fetch_and_parse)
 
     @abstractmethod
-    def fetch_articles(self) -> List[Dict]:
+    def fetch_articles(self) -> List[Article]:
         pass
 
 # ==========================================
 # 2. ADAPTERS
 # ==========================================
 class SpaceNewsAdapter(BaseAdapter):
-    def fetch_articles(self) -> List[Dict]:
+    source_label = SourceType.SPACENEWS.value
+
+    def fetch_articles(self) -> List[Article]:
         print(f"[SpaceNews] Start Fetching (RSS)...")
         articles = []
-        search_query = self.settings.target_companies.split(",")[0].strip().replace(" ", "+")
+        # Watchlist: feed generale (una sola volta per pagina, per tutti i target);
+        # altrimenti la ricerca WordPress sull'unico target
+        if self.watchlist:
+            query = "feed=rss2"
+        else:
+            search_query = self.targets[0].replace(" ", "+") if self.targets else ""
+            query = f"s={search_query}&feed=rss2"
+
+        # Filtro data nella query WordPress (m=YYYYMM o m=YYYY) quando la finestra sta in un mese/anno
+        start, end = self._date_window()
+        date_filter = ""
+        if start and end and (start.year, start.month) == (end.year, end.month):
+            date_filter = f"&m={start:%Y%m}"
+        elif start and end and start.year == end.year:
+            date_filter = f"&m={start.year}"
         
         for page in range(1, self.settings.max_pages + 1):
-            rss_url = f"https://spacenews.com/?s={search_query}&feed=rss2&paged={page}"
+            rss_url = f"{SPACENEWS_BASE_URL}/?{query}&paged={page}{date_filter}"
             try:
-                feed = feedparser.parse(rss_url)
+                feed = self._fetch_feed(rss_url)
                 if not feed.entries: break
-                for entry in feed.entries:
-                    articles.append({
-                        "source": SourceType.SPACENEWS.value,
-                        "url": entry.link,
-                        "title": entry.title,
-                        "date": getattr(entry, 'published', ''),
-                        "raw_content": getattr(entry, 'content', [{'value': entry.summary}])[0]['value'] if hasattr(entry, 'content') else entry.summary
-                    })
-                time.sleep(1)
+                in_window = [e for e in feed.entries if self._in_window(getattr(e, 'published', ''))]
+                for entry in in_window:
+                    article = self._article(
+                        source=SourceType.SPACENEWS.value,
+                        url=entry.link,
+                        title=entry.title,
+                        date=getattr(entry, 'published', ''),
+                        raw_content=getattr(entry, 'content', [{'value': entry.summary}])[0]['value'] if hasattr(entry, 'content') else entry.summary
+                    )
+                    if self._keep(article):
+                        articles.append(article)
+                # Risultati in ordine di data decrescente: pagina tutta fuori finestra -> inutile proseguire
+                if not in_window and start and all(
+                    (_parse_date(getattr(e, 'published', '')) or datetime.max).date() < start for e in feed.entries
+                ):
+                    break
+                metrics.sleep("fetch", 1)
             except Exception:
                 break
         return articles
 
 class SnapiAdapter(BaseAdapter):
-    def fetch_articles(self) -> List[Dict]:
+    source_label = SourceType.SNAPI.value
+
+    def fetch_articles(self) -> List[Article]:
         print(f"[SNAPI] Start Fetching (API v4)...")
         articles = []
-        base_url = "https://api.spaceflightnewsapi.net/v4/articles"
+        base_url = f"{SNAPI_BASE_URL}/articles"
         limit = 10
         total_items = self.settings.max_pages * limit
+        start, end = self._date_window()
         
         for offset in range(0, total_items, limit):
-            params = {"search": self.settings.target_companies, "limit": limit, "offset": offset}
+            # Watchlist: ultimi articoli senza ricerca, confrontati localmente con tutti i target
+            params = {"limit": limit, "offset": offset}
+            if not self.watchlist:
+                params["search"] = self.settings.target_companies
+            # SNAPI filtra per data lato server
+            if start:
+                params["published_at_gte"] = f"{start.isoformat()}T00:00:00Z"
+            if end:
+                params["published_at_lte"] = f"{end.isoformat()}T23:59:59Z"
             data = self._make_request(base_url, params=params)
             if not data or not data.get('results'): break
             
             for post in data['results']:
-                articles.append({
-                    "source": SourceType.SNAPI.value,
-                    "url": post.get('url'),
-                    "title": post.get('title'),
-                    "date": post.get('published_at'),
-                    "raw_content": post.get('summary', '') 
-                })
-            time.sleep(1)
+                if not self._in_window(post.get('published_at')):
+                    continue
+                article = self._article(
+                    source=SourceType.SNAPI.value,
+                    url=post.get('url'),
+                    title=post.get('title'),
+                    date=post.get('published_at'),
+                    raw_content=post.get('summary', '') 
+                )
+                if self._keep(article):
+                    articles.append(article)
+            metrics.sleep("fetch", 1)
         return articles
 
 class ViaSatelliteAdapter(BaseAdapter):
-    def fetch_articles(self) -> List[Dict]:
+    source_label = SourceType.VIA_SATELLITE.value
+
+    def fetch_articles(self) -> List[Article]:
         print(f"[Via Satellite] Start Fetching (RSS)...")
-        rss_url = "https://www.satellitetoday.com/feed/" 
+        rss_url = VIA_SATELLITE_FEED_URL
         try:
-            feed = feedparser.parse(rss_url)
+            feed = self._fetch_feed(rss_url)
             articles = []
-            target = self.settings.target_companies.lower()
             
+            # Feed unico: si tengono gli articoli che citano almeno un target (titolo o sommario)
             for entry in feed.entries:
-                if target in entry.title.lower() or target in entry.summary.lower():
+                if not self._in_window(getattr(entry, 'published', '')):
+                    continue
+                if self.matcher.match(entry.title, entry.summary):
                     content = getattr(entry, 'content', [{'value': entry.summary}])[0]['value'] if hasattr(entry, 'content') else entry.summary
-                    articles.append({
-                        "source": SourceType.VIA_SATELLITE.value,
-                        "url": entry.link,
-                        "title": entry.title,
-                        "date": getattr(entry, 'published', ''),
-                        "raw_content": content
-                    })
+                    articles.append(self._article(
+                        source=SourceType.VIA_SATELLITE.value,
+                        url=entry.link,
+                        title=entry.title,
+                        date=getattr(entry, 'published', ''),
+                        raw_content=content
+                    ))
             return articles
         except Exception:
             return []
 
 class NasaTechPortAdapter(BaseAdapter):
-    def fetch_articles(self) -> List[Dict]:
+    source_label = SourceType.NASA_TECHPORT.value
+
+    def fetch_articles(self) -> List[Article]:
         print(f"[NASA TechPort] Start Fetching (API)...")
-        url = "https://techport.nasa.gov/api/projects/search"
-        params = {"searchQuery": self.settings.target_companies}
-        data = self._make_request(url, params=params) 
+        url = f"{NASA_TECHPORT_BASE_URL}/api/projects/search"
         articles = []
-        if data and 'projects' in data:
-            for proj in data['projects'][:10]:
-                articles.append({
-                    "source": SourceType.NASA_TECHPORT.value,
-                    "url": f"https://techport.nasa.gov/view/{proj.get('id')}",
-                    "title": proj.get('title'),
-                    "date": proj.get('lastUpdated'),
-                    "raw_content": proj.get('description', '') 
-                })
+        seen = set()
+        # TechPort non ha un elenco generale: una ricerca per target (progetti deduplicati per id)
+        for target in self.targets if self.watchlist else [self.settings.target_companies]:
+            data = self._make_request(url, params={"searchQuery": target})
+            if not data or 'projects' not in data:
+                continue
+            # TechPort non filtra per data: si filtra su lastUpdated
+            for proj in [p for p in data['projects'] if self._in_window(p.get('lastUpdated'))][:10]:
+                if proj.get('id') in seen:
+                    continue
+                seen.add(proj.get('id'))
+                article = self._article(
+                    source=SourceType.NASA_TECHPORT.value,
+                    url=f"{NASA_TECHPORT_BASE_URL}/view/{proj.get('id')}",
+                    title=proj.get('title'),
+                    date=proj.get('lastUpdated'),
+                    raw_content=proj.get('description', '') 
+                )
+                if not article.target_hit:
+                    # Risultato della ricerca per `target`: lo si etichetta comunque con quel target
+                    article.matched_targets = intern_labels([target.upper()])
+                articles.append(article)
         return articles
 
 # ==========================================
@@ -145,9 +341,26 @@ class NasaTechPortAdapter(BaseAdapter):
 # ==========================================
 
 class SpaceScraperService:
-    def __init__(self, settings: ScrapeSettings):
+    def __init__(self, settings: ScrapeSettings, span_recorder=None, task_id: str = None):
         self.settings = settings
         self.db: Session = SessionLocal()
+        self.span_recorder = span_recorder
+        # Se presente, ogni deal rilevante viene collegato al task (risultati parziali)
+        self.task_id = task_id
+        self.triage = load_default_model() if settings.use_triage else None
+        # Statistiche del run (routing cascade, chiamate LLM per modello, triage);
+        # dai thread di analisi (reanalyze) si aggiornano con _count
+        self.run_stats: Counter = Counter()
+        self._stats_lock = threading.Lock()
+        # Tetto ai retry dell'intero task (fetch + LLM)
+        self.retry_budget = RetryBudget()
+        # Richieste/feed identici nello stesso run: una sola chiamata
+        self.coalescer = RequestCoalescer()
+        # Stato dello stop ordinato (cancellazione / scadenza), impostato da scrape()
+        self.results: List[Dict] = []
+        self.stop_reason: Optional[str] = None
+        self._deadline: Optional[float] = None
+        self._should_cancel: Optional[Callable[[], bool]] = None
         
         self.adapters_map = {
             SourceType.SPACENEWS: SpaceNewsAdapter,
@@ -164,49 +377,84 @@ class SpaceScraperService:
 
     def _get_adapter(self, source_type: SourceType) -> BaseAdapter:
         adapter_class = self.adapters_map.get(source_type, SpaceNewsAdapter)
-        return adapter_class(self.settings)
+        return adapter_class(self.settings, retry_budget=self.retry_budget, coalescer=self.coalescer)
+
+    def _group_sources(self) -> Dict[type, List[SourceType]]:
+        """Sorgenti richieste raggruppate per adapter: gli alias (es. SpaceWorks -> SpaceNews) girano una volta sola."""
+        groups: Dict[type, List[SourceType]] = {}
+        for source in dict.fromkeys(self.settings.sources):
+            groups.setdefault(self.adapters_map.get(source, SpaceNewsAdapter), []).append(source)
+        return groups
 
-    def _analyze_with_llm(self, text: str, meta: Dict) -> Dict:
-        """ 
-        Analisi AI Robust con RETRY su 429.
+    def _count(self, key: str, value: int = 1) -> None:
+        with self._stats_lock:
+            self.run_stats[key] += value
+
+    def _analyze_with_llm(self, text: str, meta: Article) -> Tuple[Dict, bool]:
+        """
+        Analisi AI, restituisce (risultato, ok) come _call_llm. Con settings.cascade_model un
+        modello piccolo/locale fa il primo passaggio: solo gli articoli rilevanti o incerti
+        salgono al modello principale.
         """
+        cascade_model = self.settings.cascade_model
+        if not cascade_model:
+            return self._call_llm(self.settings.ai_model, text, meta)
+
+        self._count("cascade_first_pass")
+        first, ok = self._call_llm(cascade_model, text, meta)
+        first_score = _score(first.get('relevance_score'))
+        if ok and not self._needs_escalation(first, first_score):
+            self._count("cascade_resolved_small")
+            metrics.CASCADE_DECISIONS.labels(decision="resolved_small").inc()
+            first['cascade'] = {"model": cascade_model, "escalated": False}
+            return first, True
+
+        self._count("cascade_escalated")
+        metrics.CASCADE_DECISIONS.labels(decision="escalated" if ok else "escalated_error").inc()
+        result, ok = self._call_llm(self.settings.ai_model, text, meta)
+        result['cascade'] = {"model": cascade_model, "escalated": True, "first_score": first_score}
+        return result, ok
+
+    def _needs_escalation(self, first: Dict, score: Optional[float]) -> bool:
+        # Rilevante per il modello piccolo, oppure punteggio assente/incerto
+        if first.get('is_relevant'):
+            return True
+        return score is None or score >= self.settings.cascade_escalation_threshold
+
+    def _call_llm(self, model: str, text: str, meta: Article) -> Tuple[Dict, bool]:
+        """
+        Analisi AI con retry/backoff e circuit breaker per provider. Restituisce (risultato, ok).
+        """
+        self._count(f"llm_calls:{model}")
         client = instructor.from_litellm(completion, mode=instructor.Mode.MD_JSON)
-        companies_str = self.settings.target_companies
+        # Watchlist: solo i target effettivamente citati nell'articolo
+        companies = list(meta.matched_targets) or self.settings.target_list()
+        companies_str = ", ".join(companies)
         
-        # 1. Recupero Prompt
-        base_prompt = self.settings.system_prompt
-        # if not base_prompt or len(base_prompt.strip()) < 10:
-        #    base_prompt = "You are a space economy analyst. Extract key data."
-
-        # 2. Iniezione Contesto
-        system_prompt = f"{base_prompt}\n\nCRITICAL CONTEXT: Your analysis MUST focus on the following target companies: '{companies_str}'. If the article does not mention them or is not relevant to their activities, set is_relevant=false."
-
-        # 3. Configurazione Modello
-        model_name = self.settings.ai_model.lower()
-        api_key = self.settings.api_key
-        api_base = None
-        final_model = model_name
-
-        if "ollama" in model_name:
-            api_base = "http://host.docker.internal:11434"
-            api_key = "ollama" 
-        elif "groq" in model_name:
-            api_base = "https://api.groq.com/openai/v1"
-            clean_model = model_name.replace("groq/", "")
-            final_model = f"openai/{clean_model}" 
-        else:
-            final_model = f"openai/{self.settings.ai_model}"
-            api_base = "https://api.mistral.ai/v1"
+        # 1. Prompt
+        # Il messaggio di sistema è il prefisso statico di prompt.py: identico byte per byte tra
+        # task e articoli, così il provider può riusarlo dalla cache. Tutto ciò che varia
+        # (aziende, focus, template scelto nella UI) va nel messaggio utente.
+        keywords = _prompt.configure_keywords(companies, DEAL_EVENT_TYPES)
+        focus_context = f"CRITICAL CONTEXT: Your analysis MUST focus on the following target companies: '{companies_str}'. If the article does not mention them or is not relevant to their activities, set is_relevant=false."
+        task_prompt = (self.settings.system_prompt or "").strip()
+        user_prefix = f"{keywords}\n{focus_context}\n\n"
+        if task_prompt:
+            user_prefix += f"# Task instructions\n{task_prompt}\n\n"
+
+        # 2. Configurazione Modello
+        model_name = model.lower()
+        final_model, api_key, api_base = llm_route(model, self.settings.api_key)
 
         if not api_key and "ollama" not in model_name:
-             return {"is_relevant": False, "summary": "Missing API Key"}
+             return {"is_relevant": False, "summary": "Missing API Key"}, False
 
         kwargs = {
             "model": final_model,
             "api_key": api_key,
             "messages": [
-                {"role": "system", "content": system_prompt},
-                {"role": "user", "content": f"URL: {meta['url']}\n\nCONTENT: {text[:18000]}"}
+                {"role": "system", "content": STATIC_SYSTEM_PROMPT},
+                {"role": "user", "content": f"{user_prefix}URL: {meta.url}\n\nCONTENT: {text[:18000]}"}
             ],
             "response_model": DealData,
             "max_retries": 1 # LiteLLM retries interni
@@ -215,49 +463,206 @@ class SpaceScraperService:
         if api_base:
             kwargs["api_base"] = api_base
 
-        # --- CICLO DI RETRY MANUALE PER 429 ---
-        # Se LiteLLM fallisce con 429, aspettiamo noi manualmente
-        max_retries = 3
-        for attempt in range(max_retries):
+        # --- RETRY CON BACKOFF + BREAKER PER PROVIDER (resilience.py) ---
+        def attempt():
             try:
-                resp = client.chat.completions.create(**kwargs)
-                result = resp.model_dump(exclude_none=True)
-                
-                # Auto-Correction
-                deal_type = result.get('deal_type', 'none').lower()
-                if deal_type == 'none' and result.get('is_relevant') is True:
-                    result['is_relevant'] = False
-                
-                return result
-
+                with metrics.stage_timer(meta.source, "llm"):
+                    started = time.perf_counter()
+                    resp, raw_completion = client.chat.completions.create_with_completion(**kwargs)
+                    return resp, raw_completion, time.perf_counter() - started
             except Exception as e:
-                err_str = str(e).lower()
-                # Check se è un Rate Limit
-                if "429" in err_str or "rate limit" in err_str:
-                    if attempt < max_retries - 1:
-                        # Backoff esponenziale: 10s, 20s, 30s...
-                        wait_time = 10 * (attempt + 1)
-                        print(f" [RATE LIMIT] 429 Rilevato. Pausa di {wait_time}s e riprovo...")
-                        time.sleep(wait_time)
-                        continue # Riprova il ciclo
-                    else:
-                        print(f"[LLM Error] Rate limit persistente su {meta['url']}: {e}")
-                        return {"is_relevant": False, "summary": "Skipped due to API Rate Limits"}
-                else:
-                    # Altri errori (es. Context Length) non si retryano
-                    print(f"[LLM Error] {e}")
-                    return {"is_relevant": False, "summary": str(e)}
+                transient = resilience.as_retryable_llm_error(e)
+                if transient is None:
+                    raise
+                if transient.reason == "429":
+                    metrics.LLM_CALLS.labels(model=model_name, outcome="rate_limited").inc()
+                    print(f" [RATE LIMIT] 429 su {meta.url}")
+                raise transient from e
+
+        try:
+            resp, raw_completion, elapsed = resilience.call_with_retry(
+                attempt, component="llm", key=resilience.llm_provider(model_name), budget=self.retry_budget
+            )
+        except CircuitOpenError as e:
+            metrics.LLM_CALLS.labels(model=model_name, outcome="circuit_open").inc()
+            print(f"[LLM Error] {e}")
+            return {"is_relevant": False, "summary": "Skipped: LLM provider unavailable"}, False
+        except RetryableError as e:
+            print(f"[LLM Error] Errore transitorio persistente su {meta.url}: {e}")
+            summary = "Skipped due to API Rate Limits" if e.reason == "429" else f"Skipped: {e}"
+            return {"is_relevant": False, "summary": summary}, False
+        except Exception as e:
+            # Altri errori (es. Context Length) non si retryano
+            metrics.LLM_CALLS.labels(model=model_name, outcome="error").inc()
+            print(f"[LLM Error] {e}")
+            return {"is_relevant": False, "summary": str(e)}, False
+
+        metrics.LLM_CALLS.labels(model=model_name, outcome="success").inc()
+        usage = metrics.record_llm_usage(model_name, getattr(raw_completion, "usage", None), elapsed)
+        for kind, value in usage.items():
+            self._count(f"tokens_{kind}:{model}", value)
+        result = resp.model_dump(exclude_none=True)
+        if usage:
+            result['llm_usage'] = {**usage, "model": model, "seconds": round(elapsed, 3)}
+
+        # Auto-Correction
+        deal_type = result.get('deal_type', 'none').lower()
+        if deal_type == 'none' and result.get('is_relevant') is True:
+            result['is_relevant'] = False
+
+        return result, True
 
     # --- METODO FETCH SICURO ---
-    def _fetch_source_safe(self, source_enum):
+    def _fetch_source_safe(self, source_enum, labels: Optional[List[str]] = None):
+        """Articoli della sorgente, etichettati con tutte le sorgenti richieste che la usano."""
+        labels = intern_labels(labels or [source_enum.value])
         try:
-            adapter = self._get_adapter(source_enum)
-            return adapter.fetch_articles()
+            with self._span("fetch", source=source_enum.value):
+                adapter = self._get_adapter(source_enum)
+                articles = adapter.fetch_articles()
         except Exception:
             return []
+        for art in articles:
+            art.source_labels = labels
+        return articles
+
+    # --- ANALISI DI UN ARTICOLO (scrape e reanalyze) ---
+    def _analyze_article(self, art: Article, matched: List[str], progress: str = "") -> Tuple[Optional[Dict], bool]:
+        """
+        Pulizia, triage e LLM: (analisi, ok), con ok=False se la chiamata LLM è fallita.
+        Analisi None se il testo è troppo corto. Non tocca il DB (usabile dai thread).
+        """
+        url = art.url
+        with metrics.stage_timer(art.source, "parse"), self._span("parse"):
+            # L'HTML grezzo viene scartato qui: da ora il record tiene solo il testo compresso
+            clean_text = art.clean()
+        if len(clean_text) < 100:
+            metrics.ARTICLES.labels(source=art.source, outcome="too_short").inc()
+            return None, True
 
-    def scrape(self):
-        all_results = []
+        print(f" [{progress}] Analisi: {url}...")
+    
+        # Triage locale: gli articoli sicuramente irrilevanti non passano dall'LLM
+        skip, triage_score = False, None
+        if self.triage is not None:
+            with self._span("triage"):
+                skip, triage_score = self.triage.is_confidently_irrelevant(
+                    art.title, ", ".join(matched)
+                )
+
+        if skip:
+            print(f"   ---> SCARTATO DAL TRIAGE (p={triage_score:.3f})")
+            analysis = {
+                "is_relevant": False,
+                "deal_type": "none",
+                "relevance_score": round(triage_score, 4),
+                "summary": "Scartato dal triage locale (nessuna chiamata LLM)",
+                "triage_skipped": True,
+            }
+            metrics.ARTICLES.labels(source=art.source, outcome="triaged").inc()
+            self._count("triage_skipped")
+            ok = True
+        else:
+            # Qui chiamiamo la funzione che ora ha il retry interno
+            with self._span("llm"):
+                analysis, ok = self._analyze_with_llm(clean_text, art)
+            if not ok:
+                # Segnaposto di errore, non un verdetto (escluso dal training del triage)
+                analysis['llm_failed'] = True
+            if triage_score is not None:
+                analysis['triage_score'] = round(triage_score, 4)
+    
+            if analysis.get('is_relevant'):
+                print(f"   ---> RILEVANTE")
+            metrics.ARTICLES.labels(
+                source=art.source, outcome="relevant" if analysis.get('is_relevant') else "irrelevant"
+            ).inc()
+    
+        analysis['source'] = art.source
+        analysis['source_labels'] = list(art.source_labels)
+        analysis['published_date'] = art.date
+        analysis['title'] = art.title
+        analysis['url'] = url
+        return analysis, ok
+
+    def _save_deal(self, art: Article, analysis: Dict, exists: Optional[DealModel],
+                   matched: List[str], search_target: str) -> DealModel:
+        """Scrive (o aggiorna) il deal dell'articolo: unico commit per articolo, poi ne rilascia il testo."""
+        with metrics.stage_timer(art.source, "db"), self._span("db_write"):
+            if exists:
+                exists.analysis_payload = analysis
+                exists.is_relevant = analysis.get('is_relevant', False)
+                exists.title = art.title
+                exists.published_date = _parse_date(art.date)
+                exists.search_target = search_target
+                exists.matched_targets = list(dict.fromkeys((exists.matched_targets or []) + matched))
+                deal = exists
+            else:
+                deal = DealModel(
+                    url=art.url, source=art.source, title=art.title,
+                    published_date=_parse_date(art.date),
+                    is_relevant=analysis.get('is_relevant', False),
+                    analysis_payload=analysis,
+                    search_target=search_target,
+                    matched_targets=matched,
+                )
+                self.db.add(deal)
+            # flush per ottenere l'id prima del commit (unico commit per articolo)
+            self.db.flush()
+            index_deal_entities(self.db, deal)
+            if analysis.get('is_relevant'):
+                self._record_result(deal)
+            self.db.commit()
+            bump_data_version()
+        # Deal scritto: del record in memoria bastano i metadati
+        art.release()
+        return deal
+
+    # --- RISULTATI PARZIALI ---
+    def _record_result(self, deal: DealModel):
+        """Collega il deal al task corrente; il commit avviene con quello dell'articolo."""
+        if self.task_id and deal.id is not None:
+            self.db.add(TaskResultModel(task_id=self.task_id, deal_id=deal.id))
+
+    # --- SPAN DI PROFILAZIONE (attivi solo con settings.profile) ---
+    def _span(self, name: str, **attrs):
+        if self.span_recorder is None:
+            return nullcontext()
+        return self.span_recorder.span(name, **attrs)
+
+    def _stop_reason(self) -> Optional[str]:
+        """'cancelled' / 'deadline' se la pipeline deve smettere di prendere nuovi articoli."""
+        if self._deadline is not None and time.monotonic() >= self._deadline:
+            return "deadline"
+        if self._should_cancel is not None and self._should_cancel():
+            return "cancelled"
+        return None
+
+    def _start_run(self, should_cancel: Optional[Callable[[], bool]], deadline_seconds: Optional[float]):
+        budgets = [d for d in (deadline_seconds, self.settings.deadline_seconds) if d]
+        self._deadline = time.monotonic() + min(budgets) if budgets else None
+        self._should_cancel = should_cancel
+        self.stop_reason = None
+
+    def _archive(self, articles: List[Article]):
+        """L'archivio è un'ottimizzazione: un errore non deve fermare il run."""
+        try:
+            with metrics.stage_timer("archive", "db"), self._span("archive"):
+                self.run_stats["archived"] = archive.archive_articles(self.db, articles, _parse_date)
+        except Exception as e:
+            self.db.rollback()
+            print(f"[Archive] Archiviazione fallita ({len(articles)} articoli): {e}")
+
+    def scrape(self, should_cancel: Optional[Callable[[], bool]] = None, deadline_seconds: Optional[float] = None):
+        """
+        Esegue il run. `should_cancel` viene interrogata prima di ogni articolo; la scadenza è
+        il minimo tra `deadline_seconds` e settings.deadline_seconds. In entrambi i casi il run
+        termina in modo ordinato: i deal già analizzati restano salvati e vengono restituiti.
+        """
+        self._start_run(should_cancel, deadline_seconds)
+
+        # Attributo d'istanza: il worker recupera i parziali anche se il task viene interrotto
+        all_results = self.results = []
         raw_articles_batch = []
         processed_urls_in_batch = set()
         
@@ -275,8 +680,8 @@ class SpaceScraperService:
         # 1. DOWNLOAD PARALLELO
         with ThreadPoolExecutor(max_workers=5) as executor:
             future_to_source = {
-                executor.submit(self._fetch_source_safe, source): source 
-                for source in self.settings.sources
+                executor.submit(self._fetch_source_safe, sources[0], [s.value for s in sources]): sources[0]
+                for sources in self._group_sources().values()
             }
             for future in as_completed(future_to_source):
                 try:
@@ -286,60 +691,170 @@ class SpaceScraperService:
                     pass
 
         print(f"--- Scaricati {len(raw_articles_batch)} articoli. Inizio Analisi AI...")
+        self.run_stats["articles_fetched"] = len(raw_articles_batch)
+        self.run_stats["fetch_coalesced"] = self.coalescer.coalesced
 
-        # 2. ANALISI SEQUENZIALE
-        for i, art in enumerate(raw_articles_batch):
-            url = art['url']
-            print(f"[{i+1}/{len(raw_articles_batch)}] Processando: {url}")
-            
-            if url in processed_urls_in_batch: 
-                print(f"    >>> SKIP: URL già processato in questo batch (Duplicato)")
-                continue
-            processed_urls_in_batch.add(url)
+        # I feed condivisi (HTML completo) non servono più: restano solo i record compatti
+        self.coalescer.clear()
 
-            exists = self.db.query(DealModel).filter(DealModel.url == url).first()
-            if exists and not self.settings.force_rescan:
-                print(f" [{i+1}/{len(raw_articles_batch)}] SALTATO: Già nel DB -> {url}")
-                if exists.is_relevant:
-                    all_results.append(exists.analysis_payload)
-                continue
+        # Stesso URL da più sorgenti: un solo articolo, con tutte le sorgenti e i target che l'hanno trovato
+        by_url: Dict[str, Article] = {}
+        for art in raw_articles_batch:
+            first = by_url.setdefault(art.url, art)
+            if first is not art:
+                first.merge(art)
+        # Contenuti grezzi in archivio (archive.py): una rianalisi non dovrà riscaricarli
+        if archive.ARCHIVE_ENABLED:
+            self._archive(list(by_url.values()))
+
+        # Coda consumata man mano: ogni articolo elaborato viene rilasciato subito
+        pending = deque(by_url.values())
+        del by_url, raw_articles_batch
+        total = len(pending)
+        self.run_stats["articles_unique"] = total
 
-            soup = BeautifulSoup(art['raw_content'], "html.parser")
-            for s in soup(["script", "style"]): s.decompose()
-            clean_text = soup.get_text(separator=" ", strip=True)
-            if len(clean_text) < 100: continue
+        current_target = self.settings.target_companies.strip().upper()
+        watchlist = self.settings.is_watchlist()
+        tags_changed = False
+        if watchlist:
+            print(f"--- Watchlist: {len(self.settings.target_list())} target, feed scaricati una volta sola")
+
+        # 2. ANALISI SEQUENZIALE
+        for i in range(total):
+            self.stop_reason = self._stop_reason()
+            if self.stop_reason:
+                remaining = total - i
+                print(f"--- STOP ({self.stop_reason}): {remaining} articoli non analizzati, restituisco i risultati parziali")
+                self.run_stats[f"stopped_{self.stop_reason}"] = 1
+                self.run_stats["articles_not_processed"] = remaining
+                break
 
-            print(f" [{i+1}/{len(raw_articles_batch)}] Analisi: {url}...")
+            art = pending.popleft()
+            url = art.url
+            with self._span("article", url=url, source=art.source):
+                print(f"[{i+1}/{total}] Processando: {url}")
             
-            # Qui chiamiamo la funzione che ora ha il retry interno
-            analysis = self._analyze_with_llm(clean_text, art)
+                if url in processed_urls_in_batch: 
+                    print(f"    >>> SKIP: URL già processato in questo batch (Duplicato)")
+                    continue
+                processed_urls_in_batch.add(url)
+
+                with metrics.stage_timer(art.source, "db"), self._span("db_lookup"):
+                    exists = self.db.query(DealModel).filter(DealModel.url == url).first()
+                matched = list(art.matched_targets) or [current_target]
+                # Un segnaposto di errore LLM salvato in passato non è un'analisi: si rianalizza
+                if exists and not self.settings.force_rescan and not is_llm_failure(exists.analysis_payload or {}):
+                    print(f" [{i+1}/{total}] SALTATO: Già nel DB -> {url}")
+                    metrics.ARTICLES.labels(source=art.source, outcome="cached").inc()
+                    # Nuovi target della watchlist su un articolo già analizzato: solo etichette, niente LLM
+                    merged = list(dict.fromkeys((exists.matched_targets or []) + matched))
+                    if merged != (exists.matched_targets or []):
+                        exists.matched_targets = merged
+                        tags_changed = True
+                    if exists.is_relevant:
+                        all_results.append(exists.analysis_payload)
+                        self._record_result(exists)
+                    continue
+
+                analysis, ok = self._analyze_article(art, matched, f"{i+1}/{total}")
+                if analysis is None:
+                    continue
+                if not ok:
+                    # Nessun verdetto (chiave mancante, rate limit, breaker aperto...): niente scrittura,
+                    # così il prossimo run lo rianalizza e un'analisi già salvata resta valida
+                    self.run_stats["llm_failed_not_saved"] += 1
+                else:
+                    if analysis.get('is_relevant'):
+                        all_results.append(analysis)
+                    # Watchlist: search_target è il primo target citato, matched_targets li contiene tutti
+                    search_target = matched[0] if watchlist else current_target
+                    self._save_deal(art, analysis, exists, matched, search_target)
             
+                with self._span("throttle"):
+                    metrics.sleep("throttle", delay_seconds)
+
+        # Commit finale: collegamenti ed etichette dei deal già presenti nel DB (saltati senza analisi)
+        self.db.commit()
+        if tags_changed:
+            bump_data_version()
+        self.run_stats["relevant"] = len(all_results)
+        self.run_stats["retries"] = self.retry_budget.spent
+        return all_results
+
+    def reanalyze(self, should_cancel: Optional[Callable[[], bool]] = None,
+                  deadline_seconds: Optional[float] = None, concurrency: Optional[int] = None,
+                  limit: Optional[int] = None):
+        """
+        Rianalizza gli articoli dell'archivio (archive.py) con prompt e modello di settings, senza
+        scaricare nulla. Date e sorgenti filtrano la lettura, i target vengono cercati nel testo
+        (o tra quelli già noti). Le analisi girano in parallelo, le scritture restano nel thread
+        principale; i deal esistenti vengono sempre aggiornati (come con force_rescan), salvo
+        quando la chiamata LLM fallisce: l'analisi precedente resta com'è.
+        Cancellazione e scadenza come in scrape(): le analisi già partite vengono salvate.
+        """
+        self._start_run(should_cancel, deadline_seconds)
+        all_results = self.results = []
+        concurrency = concurrency or archive.REANALYZE_CONCURRENCY
+        targets = self.settings.target_list()
+        matcher = TargetMatcher(targets)
+        wanted = {t.upper() for t in targets}
+        current_target = self.settings.target_companies.strip().upper()
+        watchlist = self.settings.is_watchlist()
+        in_flight: Dict[Future, Tuple[Article, List[str]]] = {}
+        print(f"RIANALISI DALL'ARCHIVIO - Target: {self.settings.target_companies} - Modello: {self.settings.ai_model} "
+              f"- {concurrency} analisi in parallelo")
+
+        def collect(future: Future):
+            art, matched = in_flight.pop(future)
+            try:
+                analysis, ok = future.result()
+            except Exception as e:
+                print(f"[Reanalyze] Errore su {art.url}: {e}")
+                self._count("reanalyze_errors")
+                return
+            if analysis is None:
+                return
+            if not ok:
+                # Chiave mancante, rate limit, breaker aperto...: non è un verdetto, niente scrittura
+                self._count("llm_failed_not_saved")
+                return
             if analysis.get('is_relevant'):
-                print(f"   ---> RILEVANTE")
                 all_results.append(analysis)
-            
-            analysis['source'] = art['source']
-            analysis['published_date'] = art['date']
-            analysis['title'] = art['title']
-            analysis['url'] = url
-            
-            current_target = self.settings.target_companies.strip().upper()
+            with metrics.stage_timer(art.source, "db"):
+                exists = self.db.query(DealModel).filter(DealModel.url == art.url).first()
+            self._save_deal(art, analysis, exists, matched, matched[0] if watchlist else current_target)
 
-            if exists:
-                exists.analysis_payload = analysis
-                exists.is_relevant = analysis.get('is_relevant', False)
-                exists.title = art['title']
-                exists.search_target = current_target
-            else:
-                new_deal = DealModel(
-                    url=url, source=art['source'], title=art['title'],
-                    is_relevant=analysis.get('is_relevant', False),
-                    analysis_payload=analysis,
-                    search_target=current_target
-                )
-                self.db.add(new_deal)
-            self.db.commit()
-            
-            time.sleep(delay_seconds)
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            for art in archive.iter_archived(self.settings):
+                self.stop_reason = self._stop_reason()
+                if self.stop_reason:
+                    print(f"--- STOP ({self.stop_reason}): completo le {len(in_flight)} analisi in corso")
+                    self.run_stats[f"stopped_{self.stop_reason}"] = 1
+                    break
+                if limit and self.run_stats["articles_fetched"] >= limit:
+                    break
+
+                hits = matcher.match(art.title, art.raw_content)
+                known = [t for t in art.matched_targets if t in wanted]
+                if not hits and not known:
+                    self._count("archive_not_matching")
+                    continue
+                art.matched_targets = intern_labels(hits or known)
+                self._count("articles_fetched")
+                in_flight[executor.submit(self._analyze_article, art, list(art.matched_targets), "archivio")] = \
+                    (art, list(art.matched_targets))
+
+                # Al massimo 2 analisi in attesa per thread: l'archivio viene letto in streaming
+                if len(in_flight) >= 2 * concurrency:
+                    done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        collect(future)
+
+            for future in as_completed(list(in_flight)):
+                collect(future)
 
-        return all_results
\ No newline at end of file
+        self.db.commit()
+        self.run_stats["relevant"] = len(all_results)
+        self.run_stats["retries"] = self.retry_budget.spent
+        print(f"--- Rianalisi completata: {self.run_stats['articles_fetched']} articoli, {len(all_results)} rilevanti")
+        return all_results
@@ -0,0 +1,46 @@
+"""
+Cancellazione cooperativa dei task di scraping.
+
+L'API scrive un flag in Redis (POST /api/tasks/{task_id}/cancel); la pipeline lo
+controlla prima di ogni articolo, smette di prenderne di nuovi e restituisce i
+risultati parziali (già salvati nel DB).
+"""
+import os
+
+import redis
+import redis.asyncio as aioredis
+
+REDIS_URL = os.getenv("REDIS_URL", os.getenv("CELERY_BROKER_URL", "redis://redis:6379/0"))
+CANCEL_PREFIX = "spacescraper:task_cancel"
+CANCEL_TTL_SECONDS = 24 * 3600
+
+
+async def request_cancel(task_id: str) -> None:
+    client = aioredis.Redis.from_url(REDIS_URL, socket_timeout=1)
+    try:
+        await client.set(f"{CANCEL_PREFIX}:{task_id}", "1", ex=CANCEL_TTL_SECONDS)
+    finally:
+        await client.aclose()
+
+
+async def is_cancel_requested(task_id: str) -> bool:
+    client = aioredis.Redis.from_url(REDIS_URL, socket_timeout=1)
+    try:
+        return bool(await client.exists(f"{CANCEL_PREFIX}:{task_id}"))
+    finally:
+        await client.aclose()
+
+
+class CancelFlag:
+    """Controllo sincrono usato dal worker. Se Redis non risponde il task prosegue."""
+
+    def __init__(self, task_id: str):
+        self.task_id = task_id
+        self._client = redis.Redis.from_url(REDIS_URL, socket_timeout=1)
+
+    def __call__(self) -> bool:
+        try:
+            return bool(self._client.exists(f"{CANCEL_PREFIX}:{self.task_id}"))
+        except Exception as e:
+            print(f"[Cancel] Impossibile leggere il flag di {self.task_id}: {e}")
+            return False
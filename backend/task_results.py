@@ -0,0 +1,29 @@
+"""
+Risultati parziali dei task: ogni deal rilevante viene collegato al task appena salvato
+(TaskResultModel, scritto da SpaceScraperService._record_result) e il client li legge a pagine
+con un cursore sull'id del collegamento (GET /api/tasks/{task_id}/results?after=...).
+"""
+from typing import Any, Dict, Sequence
+
+from sqlalchemy import Select, select
+
+from models import DealModel, TaskResultModel
+
+
+def build_results_query(task_id: str, after: int, limit: int) -> Select:
+    """Collegamenti del task con id > after, in ordine di inserimento."""
+    return select(TaskResultModel.id, DealModel.analysis_payload).join(
+        DealModel, DealModel.id == TaskResultModel.deal_id
+    ).filter(
+        TaskResultModel.task_id == task_id,
+        TaskResultModel.id > after
+    ).order_by(TaskResultModel.id).limit(limit)
+
+
+def results_page(task_id: str, rows: Sequence[Any], after: int) -> Dict:
+    """Pagina per il client: `next_cursor` resta `after` se non ci sono risultati nuovi."""
+    return {
+        "task_id": task_id,
+        "items": [payload for _, payload in rows],
+        "next_cursor": rows[-1][0] if rows else after,
+    }
@@ -0,0 +1,33 @@
+"""
+Statistiche per singolo run (routing cascade, chiamate LLM per modello, triage, ...).
+
+Il worker le salva in Redis al termine del task; l'API le espone su
+GET /api/tasks/{task_id}/stats.
+"""
+import json
+import os
+from typing import Dict, Optional
+
+import redis
+import redis.asyncio as aioredis
+
+REDIS_URL = os.getenv("REDIS_URL", os.getenv("CELERY_BROKER_URL", "redis://redis:6379/0"))
+STATS_PREFIX = "spacescraper:task_stats"
+STATS_TTL_SECONDS = int(os.getenv("TASK_STATS_TTL", str(7 * 24 * 3600)))
+
+
+def save_task_stats(task_id: str, stats: Dict) -> None:
+    try:
+        client = redis.Redis.from_url(REDIS_URL, socket_timeout=1)
+        client.set(f"{STATS_PREFIX}:{task_id}", json.dumps(dict(stats)), ex=STATS_TTL_SECONDS)
+    except Exception as e:
+        print(f"[Stats] Impossibile salvare le statistiche del task {task_id}: {e}")
+
+
+async def get_task_stats(task_id: str) -> Optional[Dict]:
+    client = aioredis.Redis.from_url(REDIS_URL, socket_timeout=1)
+    try:
+        raw = await client.get(f"{STATS_PREFIX}:{task_id}")
+    finally:
+        await client.aclose()
+    return json.loads(raw) if raw else None
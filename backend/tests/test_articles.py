@@ -0,0 +1,55 @@
+import zlib
+
+import articles
+from articles import Article, intern_labels
+
+
+def _article(source="SpaceNews", targets=(), target_hit=False, html="<p>ICEYE</p><script>x()</script>"):
+    return Article(source, "https://example.com/a", "Title", "2024-03-01", html,
+                   matched_targets=targets, target_hit=target_hit)
+
+
+def test_clean_keeps_only_compressed_text():
+    article = _article()
+    assert article.raw_content == "<p>ICEYE</p><script>x()</script>"
+    assert article.clean() == "ICEYE"
+    assert article.raw_blob is None
+    assert article.raw_content == ""
+    # Seconda chiamata: niente nuovo parsing
+    assert article.clean(cleaner=lambda html: "diverso") == "ICEYE"
+
+
+def test_release_drops_content_and_keeps_metadata():
+    article = _article(targets=["ICEYE"])
+    article.clean()
+    article.release()
+    assert article.raw_blob is None
+    assert article.clean(cleaner=lambda html: html) == ""
+    assert (article.url, article.matched_targets) == ("https://example.com/a", ("ICEYE",))
+
+
+def test_merge_unions_sources_and_targets_in_order():
+    first = _article(targets=["ICEYE"])
+    second = _article(source="SNAPI", targets=["PLANET", "ICEYE"], target_hit=True)
+    first.merge(second)
+    assert first.source_labels == ("SpaceNews", "SNAPI")
+    assert first.matched_targets == ("ICEYE", "PLANET")
+    assert first.target_hit
+    assert first.matched_targets is intern_labels(["ICEYE", "PLANET"])
+
+
+def test_from_archive_keeps_blob():
+    blob = zlib.compress(b"<p>archived</p>")
+    article = Article.from_archive("SpaceNews", "https://example.com/b", "T", "", blob)
+    assert article.raw_blob is blob
+    assert article.target_hit
+    assert article.clean() == "archived"
+
+
+def test_intern_labels_shares_tuples_and_stays_bounded(monkeypatch):
+    monkeypatch.setattr(articles, "LABELS_CACHE_MAX", 3)
+    monkeypatch.setattr(articles, "_labels_cache", {})
+    assert intern_labels(["A", "B"]) is intern_labels(("A", "B"))
+    for i in range(10):
+        intern_labels([f"T{i}"])
+        assert len(articles._labels_cache) <= 3
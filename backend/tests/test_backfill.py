@@ -0,0 +1,93 @@
+from datetime import date, datetime, timedelta, timezone
+
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.dialects.postgresql import JSONB
+from sqlalchemy.ext.compiler import compiles
+from sqlalchemy.orm import sessionmaker
+
+import backfill
+from models import BackfillChunkModel, BackfillJobModel, ScrapeSettings, SourceType
+
+
+@compiles(JSONB, "sqlite")
+def _jsonb_on_sqlite(element, compiler, **kw):
+    return "JSON"
+
+
+@pytest.fixture
+def db():
+    engine = create_engine("sqlite://")
+    tables = [BackfillJobModel.__table__, BackfillChunkModel.__table__]
+    BackfillJobModel.metadata.create_all(engine, tables=tables)
+    session = sessionmaker(bind=engine)()
+    yield session
+    session.close()
+    engine.dispose()
+
+
+def _chunk(db, status="pending", job_status="running", **values) -> int:
+    job = BackfillJobModel(status=job_status, settings={}, date_from=date(2024, 1, 1), date_to=date(2024, 1, 31))
+    db.add(job)
+    db.flush()
+    chunk = BackfillChunkModel(job_id=job.id, target="ICEYE", source="spacenews", status=status,
+                               period_start=date(2024, 1, 1), period_end=date(2024, 1, 31), **values)
+    db.add(chunk)
+    db.commit()
+    return chunk.id
+
+
+def test_month_periods_are_inclusive_and_clipped():
+    assert backfill.month_periods(date(2024, 1, 15), date(2024, 3, 10)) == [
+        (date(2024, 1, 15), date(2024, 1, 31)),
+        (date(2024, 2, 1), date(2024, 2, 29)),
+        (date(2024, 3, 1), date(2024, 3, 10)),
+    ]
+
+
+def test_plan_chunks_per_source_and_month():
+    settings = ScrapeSettings(target_companies="ICEYE",
+                              sources=[SourceType.SPACENEWS, SourceType.SNAPI, SourceType.SPACENEWS])
+    chunks = backfill.plan_chunks(settings, date(2024, 1, 1), date(2024, 2, 29))
+    assert len(chunks) == 4
+    assert {c["source"] for c in chunks} == {"SpaceNews", "SNAPI"}
+    assert {(c["period_start"], c["period_end"]) for c in chunks} == {
+        (date(2024, 1, 1), date(2024, 1, 31)), (date(2024, 2, 1), date(2024, 2, 29)),
+    }
+
+
+def test_plan_chunks_watchlist_keeps_targets_together():
+    settings = ScrapeSettings(target_companies="ICEYE, Planet", sources=[SourceType.SPACENEWS])
+    chunks = backfill.plan_chunks(settings, date(2024, 1, 1), date(2024, 1, 31))
+    assert [c["target"] for c in chunks] == ["ICEYE, Planet"]
+
+
+def test_claim_chunk_runs_once(db):
+    chunk_id = _chunk(db)
+    claimed = backfill.claim_chunk(db, chunk_id, "task-a")
+    assert claimed.status == "running"
+    assert claimed.task_id == "task-a"
+    assert claimed.attempts == 1
+    # Duplicato in coda: il chunk è già running
+    assert backfill.claim_chunk(db, chunk_id, "task-b") is None
+
+
+@pytest.mark.parametrize("status", ["queued", "failed"])
+def test_claim_chunk_retries_claimable_states(db, status):
+    chunk_id = _chunk(db, status=status, error="timeout")
+    claimed = backfill.claim_chunk(db, chunk_id, "task-a")
+    assert claimed.status == "running"
+    assert claimed.error is None
+
+
+def test_claim_chunk_skips_done_and_stopped_jobs(db):
+    assert backfill.claim_chunk(db, _chunk(db, status="done"), "task-a") is None
+    assert backfill.claim_chunk(db, _chunk(db, job_status="cancelled"), "task-a") is None
+
+
+def test_claim_chunk_takes_over_stale_running(db):
+    stale = datetime.now(timezone.utc) - timedelta(seconds=backfill.STALE_RUNNING_SECONDS + 60)
+    chunk_id = _chunk(db, status="running", task_id="dead-worker", attempts=1, updated_at=stale)
+    claimed = backfill.claim_chunk(db, chunk_id, "task-a")
+    assert claimed.task_id == "task-a"
+    assert claimed.attempts == 2
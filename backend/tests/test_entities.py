@@ -0,0 +1,39 @@
+import pytest
+
+from entities import (
+    ROLE_ACQUIRER, ROLE_INVESTOR, ROLE_MENTIONED, ROLE_TARGET, extract_entities, normalize_name,
+)
+
+
+@pytest.mark.parametrize("raw, expected", [
+    ("ICEYE Oy", "iceye"),
+    ("U.K. Space Agency", "uk space agency"),
+    ("Rheinmetall AG", "rheinmetall"),
+    ("Airbus Defence & Space GmbH", "airbus defence and space"),
+    ("Space Exploration Technologies Corp.", "spacex"),
+    ("ESA", "european space agency"),
+    ("Planète Labs", "planete labs"),
+    ("Group", "group"),
+])
+def test_normalize_name(raw, expected):
+    assert normalize_name(raw) == expected
+
+
+def test_extract_entities_roles_and_dedup():
+    payload = {
+        "investors": ["Seraphim Space", "Seraphim Space Ltd", {"name": "ESA", "role": "lead"}],
+        "acquirer": "Rheinmetall AG",
+        "target": "ICEYE Oy",
+        "entities": ["ICEYE", "n/a", ""],
+    }
+    assert sorted(extract_entities(payload)) == sorted([
+        ("Seraphim Space", "seraphim space", ROLE_INVESTOR),
+        ("ESA", "european space agency", ROLE_INVESTOR),
+        ("Rheinmetall AG", "rheinmetall", ROLE_ACQUIRER),
+        ("ICEYE Oy", "iceye", ROLE_TARGET),
+        ("ICEYE", "iceye", ROLE_MENTIONED),
+    ])
+
+
+def test_extract_entities_ignores_placeholders():
+    assert extract_entities({"acquirer": "None", "target": "unknown", "investors": []}) == []
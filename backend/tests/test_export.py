@@ -0,0 +1,82 @@
+import csv
+import io
+from datetime import date, datetime, timezone
+from types import SimpleNamespace
+
+import pytest
+from sqlalchemy.dialects import postgresql
+
+import export
+
+
+def _row(**overrides):
+    values = dict(
+        id=1, url="https://example.com/a", source="SpaceNews", source_category="news",
+        title="ICEYE raises $50M", published_date=datetime(2024, 3, 1, tzinfo=timezone.utc),
+        created_at=datetime(2024, 3, 2, tzinfo=timezone.utc), search_target="ICEYE",
+        matched_targets=["ICEYE", "PLANET"], is_relevant=True,
+        analysis_payload={
+            "deal_type": "Investment", "amount": "50,000,000", "valuation": True,
+            "investors": ["Seraphim", {"name": "ESA", "role": "lead"}, {"role": "follow"}],
+            "acquirer": {"name": "Seraphim"}, "key_assets": ["SAR", "AIS"],
+        },
+    )
+    values.update(overrides)
+    return SimpleNamespace(**values)
+
+
+def _chunks(fmt, rows):
+    return b"".join(export.encode_chunks(fmt, [rows[:1], rows[1:]]))
+
+
+def test_flatten_deal_normalizes_payload():
+    record = export.flatten_deal(_row())
+    assert record["investors"] == ["Seraphim", "ESA"]
+    assert record["acquirer"] == "Seraphim"
+    assert record["key_assets"] == "SAR; AIS"
+    assert record["amount"] == 50_000_000.0
+    assert record["amount_raw"] == "50,000,000"
+    assert record["valuation"] is None
+    assert record["matched_targets"] == ["ICEYE", "PLANET"]
+    assert record["summary"] is None
+
+
+def test_csv_round_trip():
+    rows = [_row(), _row(id=2, analysis_payload=None, matched_targets=None)]
+    parsed = list(csv.DictReader(io.StringIO(_chunks("csv", rows).decode("utf-8"))))
+    assert [r["id"] for r in parsed] == ["1", "2"]
+    assert parsed[0]["investors"] == "Seraphim; ESA"
+    assert parsed[0]["published_date"] == "2024-03-01T00:00:00+00:00"
+    assert parsed[1]["amount"] == ""
+
+
+def test_csv_without_rows_still_has_header():
+    assert _chunks("csv", []).decode("utf-8").strip().split(",")[0] == "id"
+
+
+@pytest.mark.parametrize("fmt", ["arrow", "parquet"])
+def test_columnar_round_trip(fmt):
+    pa = pytest.importorskip("pyarrow")
+    rows = [_row(), _row(id=2, analysis_payload=None, matched_targets=None)]
+    data = _chunks(fmt, rows)
+    if fmt == "arrow":
+        table = pa.ipc.open_stream(data).read_all()
+    else:
+        import pyarrow.parquet as pq
+        table = pq.read_table(pa.BufferReader(data))
+    assert table.schema.equals(export._arrow_schema())
+    assert table.column("id").to_pylist() == [1, 2]
+    assert table.column("investors").to_pylist() == [["Seraphim", "ESA"], []]
+    assert table.column("amount").to_pylist() == [50_000_000.0, None]
+
+
+def test_unknown_format_is_rejected():
+    with pytest.raises(ValueError):
+        export.ExportEncoder("xlsx")
+
+
+def test_export_query_date_to_is_inclusive():
+    stmt = export.build_export_query(date_from=date(2024, 3, 1), date_to=date(2024, 3, 31))
+    sql = str(stmt.compile(dialect=postgresql.dialect(), compile_kwargs={"literal_binds": True}))
+    assert ">= '2024-03-01'" in sql
+    assert "< '2024-04-01'" in sql
@@ -0,0 +1,37 @@
+import pytest
+
+import resilience
+
+
+def _half_open_breaker(key: str) -> resilience.CircuitBreaker:
+    breaker = resilience.get_breaker("test", key)
+    breaker.failure_threshold = 1
+    breaker.reset_timeout = 0.0
+    breaker.record_failure()
+    assert breaker.state == breaker.OPEN
+    return breaker
+
+
+def test_half_open_probe_with_non_retryable_error_closes_breaker():
+    breaker = _half_open_breaker("non-retryable")
+
+    def probe():
+        raise ValueError("risposta non valida")
+
+    with pytest.raises(ValueError):
+        resilience.call_with_retry(probe, component="test", key="non-retryable")
+    assert breaker.state == breaker.CLOSED
+    assert resilience.call_with_retry(lambda: "ok", component="test", key="non-retryable") == "ok"
+
+
+def test_half_open_probe_interrupted_reopens_breaker():
+    breaker = _half_open_breaker("interrupted")
+
+    def probe():
+        raise KeyboardInterrupt
+
+    with pytest.raises(KeyboardInterrupt):
+        resilience.call_with_retry(probe, component="test", key="interrupted")
+    assert breaker.state == breaker.OPEN
+    assert resilience.call_with_retry(lambda: "ok", component="test", key="interrupted") == "ok"
+    assert breaker.state == breaker.CLOSED
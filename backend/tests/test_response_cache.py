@@ -0,0 +1,69 @@
+import asyncio
+import gzip
+
+from starlette.requests import Request
+
+import response_cache
+
+
+def _request(**headers) -> Request:
+    raw = [(k.replace("_", "-").encode(), v.encode()) for k, v in headers.items()]
+    return Request({"type": "http", "method": "GET", "path": "/", "headers": raw})
+
+
+def _respond(request: Request, payload):
+    async def compute():
+        return payload
+    return asyncio.run(response_cache.cached_json_response(request, "test", {}, compute))
+
+
+def test_etag_differs_per_encoding():
+    entry = response_cache.CachedBody(b'{"a": 1}')
+    assert entry.etag("identity") == f'"{entry.digest}"'
+    assert entry.etag("gzip") == f'"{entry.digest}-gzip"'
+    assert entry.etag("gzip") != entry.etag("br")
+    assert gzip.decompress(entry.encoded("gzip")) == entry.body
+
+
+def test_if_none_match_parsing():
+    etag = '"abc"'
+    assert response_cache._etag_matches('"abc"', etag)
+    assert response_cache._etag_matches('"xyz", W/"abc"', etag)
+    assert response_cache._etag_matches("*", etag)
+    assert not response_cache._etag_matches('"abc-gzip"', etag)
+    assert not response_cache._etag_matches(None, etag)
+    assert not response_cache._etag_matches("", etag)
+
+
+def test_matching_if_none_match_returns_304(monkeypatch):
+    async def no_version():
+        return None
+    monkeypatch.setattr(response_cache, "get_data_version", no_version)
+
+    first = _respond(_request(), {"deals": 3})
+    assert first.status_code == 200
+    etag = first.headers["etag"]
+
+    second = _respond(_request(if_none_match=etag), {"deals": 3})
+    assert second.status_code == 304
+    assert second.headers["etag"] == etag
+    assert second.body == b""
+
+    changed = _respond(_request(if_none_match=etag), {"deals": 4})
+    assert changed.status_code == 200
+    assert changed.headers["etag"] != etag
+
+
+def test_gzip_etag_does_not_validate_identity_body(monkeypatch):
+    async def no_version():
+        return None
+    monkeypatch.setattr(response_cache, "get_data_version", no_version)
+    payload = {"rows": ["x" * 50] * 50}
+
+    compressed = _respond(_request(accept_encoding="gzip"), payload)
+    assert compressed.headers["content-encoding"] == "gzip"
+    assert compressed.headers["etag"].endswith('-gzip"')
+
+    plain = _respond(_request(if_none_match=compressed.headers["etag"]), payload)
+    assert plain.status_code == 200
+    assert "content-encoding" not in plain.headers
@@ -0,0 +1,64 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from scraper_service import RequestCoalescer, TargetMatcher
+
+
+def test_target_matcher_finds_whole_words_case_insensitively():
+    matcher = TargetMatcher(["Iceye", "Rheinmetall", "Planet"])
+    assert matcher.match("Rheinmetall and ICEYE sign SAR deal") == ["RHEINMETALL", "ICEYE"]
+    assert matcher.match("Planetary science roundup") == []
+
+
+def test_target_matcher_prefers_longest_target_and_dedups_across_texts():
+    matcher = TargetMatcher(["Space", "Space Force"])
+    assert matcher.match("U.S. Space Force awards contract", "Space Force again") == ["SPACE FORCE"]
+    assert matcher.match(None, "space news") == ["SPACE"]
+
+
+def test_target_matcher_escapes_targets_and_handles_empty_watchlist():
+    assert TargetMatcher(["C++ Labs"]).match("C++ Labs raises seed") == ["C++ LABS"]
+    assert TargetMatcher([]).match("anything") == []
+
+
+def test_request_coalescer_runs_identical_requests_once():
+    coalescer = RequestCoalescer()
+    calls = []
+    started, release = threading.Event(), threading.Event()
+
+    def fetch():
+        calls.append(1)
+        started.set()
+        release.wait(5)
+        return {"feed": "rss"}
+
+    with ThreadPoolExecutor(max_workers=4) as pool:
+        first = pool.submit(coalescer.get, ("rss", "iceye"), fetch)
+        started.wait(5)
+        others = [pool.submit(coalescer.get, ("rss", "iceye"), fetch) for _ in range(3)]
+        while coalescer.coalesced < 3:
+            time.sleep(0.01)
+        release.set()
+        results = [first.result()] + [f.result() for f in others]
+
+    assert len(calls) == 1
+    assert all(r is results[0] for r in results)
+    assert coalescer.get(("rss", "other"), lambda: "x") == "x"
+
+
+def test_request_coalescer_shares_errors_and_clear_forgets_results():
+    coalescer = RequestCoalescer()
+
+    def boom():
+        raise ValueError("feed non disponibile")
+
+    for _ in range(2):
+        with pytest.raises(ValueError):
+            coalescer.get(("rss", "x"), boom)
+    assert coalescer.coalesced == 1
+
+    coalescer.clear()
+    assert coalescer.get(("rss", "x"), lambda: "ok") == "ok"
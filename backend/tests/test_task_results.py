@@ -0,0 +1,27 @@
+from sqlalchemy.dialects import postgresql
+
+import task_results
+
+
+def _sql(stmt) -> str:
+    return str(stmt.compile(dialect=postgresql.dialect(), compile_kwargs={"literal_binds": True}))
+
+
+def test_results_query_reads_after_cursor_in_id_order():
+    sql = _sql(task_results.build_results_query("task-1", after=42, limit=100))
+    assert "task_results.task_id = 'task-1'" in sql
+    assert "task_results.id > 42" in sql
+    assert "ORDER BY task_results.id" in sql
+    assert "LIMIT 100" in sql
+
+
+def test_results_page_advances_cursor_to_last_id():
+    rows = [(43, {"title": "a"}), (47, {"title": "b"})]
+    page = task_results.results_page("task-1", rows, after=42)
+    assert page == {"task_id": "task-1", "items": [{"title": "a"}, {"title": "b"}], "next_cursor": 47}
+
+
+def test_results_page_keeps_cursor_when_empty():
+    page = task_results.results_page("task-1", [], after=47)
+    assert page["items"] == []
+    assert page["next_cursor"] == 47
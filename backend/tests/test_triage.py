@@ -0,0 +1,28 @@
+import numpy as np
+
+import triage
+
+
+def test_choose_threshold_keeps_recall_floor():
+    scores = np.array([0.05, 0.1, 0.2, 0.3, 0.4, 0.5, 0.6, 0.7, 0.8, 0.9, 0.95, 0.02])
+    labels = np.array([0, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 0])
+    threshold = triage.choose_threshold(scores, labels, recall_floor=0.9)
+    # 10 rilevanti: con floor 0.9 se ne può perdere al massimo uno
+    assert threshold == 0.2
+    assert triage.report(scores, labels, threshold)["recall"] >= 0.9
+
+
+def test_choose_threshold_full_recall_keeps_lowest_positive():
+    scores = np.array([0.1, 0.4, 0.6])
+    labels = np.array([0, 1, 1])
+    assert triage.choose_threshold(scores, labels, recall_floor=1.0) == 0.4
+
+
+def test_choose_threshold_without_positives():
+    assert triage.choose_threshold(np.array([0.3, 0.7]), np.array([0, 0]), recall_floor=0.98) == 0.0
+
+
+def test_is_llm_failure():
+    assert triage.is_llm_failure({"llm_failed": True, "deal_type": "none"})
+    assert triage.is_llm_failure({"is_relevant": False})
+    assert not triage.is_llm_failure({"deal_type": "M&A", "is_relevant": True})
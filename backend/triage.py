@@ -0,0 +1,263 @@
+"""
+Triage locale di rilevanza, addestrato sui verdetti LLM già salvati in `deals`.
+
+Feature: n-grammi (parole 1-2, caratteri 3-5) del titolo con hashing + un flag
+"target nel titolo"; modello: regressione logistica (NumPy, solo CPU).
+La soglia è scelta sul validation set come la più alta che mantiene la recall
+dei rilevanti >= recall floor: sotto la soglia l'articolo è "sicuramente
+irrilevante" e non passa dall'LLM.
+
+    python triage.py export-dataset --output triage_dataset.jsonl
+    python triage.py train [--dataset triage_dataset.jsonl] [--recall-floor 0.98] --report report.json
+    python triage.py evaluate --dataset triage_dataset.jsonl
+"""
+import argparse
+import json
+import os
+import re
+import sys
+import zlib
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+TRIAGE_MODEL_PATH = os.getenv("TRIAGE_MODEL_PATH", "triage_model.npz")
+TRIAGE_ENABLED = os.getenv("TRIAGE_ENABLED", "true").lower() == "true"
+DEFAULT_RECALL_FLOOR = float(os.getenv("TRIAGE_RECALL_FLOOR", "0.98"))
+N_FEATURES = 2 ** 18
+TOKEN_RE = re.compile(r"[a-z0-9]+")
+
+
+# ==========================================
+# 1. FEATURE HASHING
+# ==========================================
+def _hash(token: str) -> int:
+    # crc32 è stabile tra processi (hash() di Python no)
+    return zlib.crc32(token.encode("utf-8")) % N_FEATURES
+
+
+def featurize(title: str, target: Optional[str]) -> np.ndarray:
+    """Indici (con ripetizione) delle feature attive per un articolo."""
+    text = (title or "").lower()
+    words = TOKEN_RE.findall(text)
+    tokens = [f"w:{w}" for w in words]
+    tokens += [f"b:{a}_{b}" for a, b in zip(words, words[1:])]
+    padded = f" {' '.join(words)} "
+    for n in (3, 4, 5):
+        tokens += [f"c{n}:{padded[i:i + n]}" for i in range(len(padded) - n + 1)]
+
+    targets = [t.strip().lower() for t in (target or "").split(",") if t.strip()]
+    in_title = any(t in text for t in targets)
+    tokens.append(f"target_in_title:{in_title}")
+    tokens.append("bias")
+    return np.fromiter((_hash(t) for t in tokens), dtype=np.int64)
+
+
+# ==========================================
+# 2. MODELLO
+# ==========================================
+class TriageModel:
+    def __init__(self, weights: np.ndarray, threshold: float, meta: Dict):
+        self.weights = weights
+        self.threshold = threshold
+        self.meta = meta
+
+    def score(self, title: str, target: Optional[str]) -> float:
+        """Probabilità stimata che l'articolo sia rilevante."""
+        z = self.weights[featurize(title, target)].sum()
+        return float(1.0 / (1.0 + np.exp(-z)))
+
+    def is_confidently_irrelevant(self, title: str, target: Optional[str]) -> Tuple[bool, float]:
+        p = self.score(title, target)
+        return p < self.threshold, p
+
+    def save(self, path: str = TRIAGE_MODEL_PATH) -> None:
+        np.savez_compressed(path, weights=self.weights.astype(np.float32),
+                            threshold=np.array(self.threshold), meta=np.array(json.dumps(self.meta)))
+
+    @classmethod
+    def load(cls, path: str = TRIAGE_MODEL_PATH) -> "TriageModel":
+        data = np.load(path)
+        return cls(data["weights"].astype(np.float64), float(data["threshold"]), json.loads(str(data["meta"])))
+
+
+_loaded: Dict[str, object] = {"mtime": None, "model": None}
+
+
+def load_default_model() -> Optional[TriageModel]:
+    """Modello usato dal worker, se abilitato e presente; ricaricato quando il file cambia (retrain)."""
+    if not TRIAGE_ENABLED or not os.path.exists(TRIAGE_MODEL_PATH):
+        return None
+    mtime = os.path.getmtime(TRIAGE_MODEL_PATH)
+    if _loaded["mtime"] != mtime:
+        try:
+            _loaded["model"] = TriageModel.load(TRIAGE_MODEL_PATH)
+            _loaded["mtime"] = mtime
+            print(f"[Triage] Modello caricato (soglia {_loaded['model'].threshold:.4f})")
+        except Exception as e:
+            print(f"[Triage] Modello non caricabile ({TRIAGE_MODEL_PATH}): {e}")
+            return None
+    return _loaded["model"]
+
+
+def _predict(weights: np.ndarray, features: List[np.ndarray]) -> np.ndarray:
+    z = np.array([weights[f].sum() for f in features])
+    return 1.0 / (1.0 + np.exp(-z))
+
+
+def fit(features: List[np.ndarray], labels: np.ndarray, epochs: int = 8, lr: float = 0.2,
+        l2: float = 1e-6, seed: int = 0) -> np.ndarray:
+    """SGD logistico su feature sparse; le classi sono bilanciate con pesi inversi alla frequenza."""
+    rng = np.random.default_rng(seed)
+    weights = np.zeros(N_FEATURES)
+    pos_rate = max(labels.mean(), 1e-6)
+    class_weight = {1: 0.5 / pos_rate, 0: 0.5 / max(1 - pos_rate, 1e-6)}
+    for epoch in range(epochs):
+        step = lr / (1 + epoch)
+        for i in rng.permutation(len(features)):
+            f = features[i]
+            p = 1.0 / (1.0 + np.exp(-weights[f].sum()))
+            grad = (p - labels[i]) * class_weight[int(labels[i])]
+            np.add.at(weights, f, -step * grad)
+            weights[f] *= (1 - step * l2)
+    return weights
+
+
+def choose_threshold(scores: np.ndarray, labels: np.ndarray, recall_floor: float) -> float:
+    """Soglia più alta per cui la recall dei rilevanti resta >= recall_floor."""
+    positives = np.sort(scores[labels == 1])
+    if positives.size == 0:
+        return 0.0
+    # Si può scartare al massimo floor((1 - recall_floor) * n_pos) positivi
+    # (tolleranza: (1 - 0.9) * 10 in virgola mobile vale 0.999...)
+    allowed_misses = int(np.floor((1 - recall_floor) * positives.size + 1e-9))
+    return float(positives[allowed_misses])
+
+
+def report(scores: np.ndarray, labels: np.ndarray, threshold: float) -> Dict:
+    kept = scores >= threshold
+    tp = int((kept & (labels == 1)).sum())
+    fn = int((~kept & (labels == 1)).sum())
+    fp = int((kept & (labels == 0)).sum())
+    tn = int((~kept & (labels == 0)).sum())
+    return {
+        "threshold": round(threshold, 6),
+        "examples": int(labels.size),
+        "relevant": int(labels.sum()),
+        "recall": round(tp / (tp + fn), 4) if tp + fn else None,
+        "precision": round(tp / (tp + fp), 4) if tp + fp else None,
+        "skipped_llm_share": round(float((~kept).mean()), 4) if labels.size else 0.0,
+        "confusion": {"tp": tp, "fn": fn, "fp": fp, "tn": tn},
+    }
+
+
+# ==========================================
+# 3. DATASET
+# ==========================================
+def dataset_from_db() -> List[Dict]:
+    from database import SessionLocal
+    from models import DealModel
+
+    db = SessionLocal()
+    try:
+        rows = db.query(DealModel.url, DealModel.title, DealModel.search_target,
+                        DealModel.is_relevant, DealModel.analysis_payload).yield_per(5000)
+        return [
+            {"url": url, "title": title or "", "target": target or "", "label": int(bool(rel))}
+            for url, title, target, rel, payload in rows
+            # Escludiamo i deal senza verdetto LLM: decisi dal triage stesso o chiamata LLM fallita
+            if not (payload or {}).get("triage_skipped") and not is_llm_failure(payload or {})
+        ]
+    finally:
+        db.close()
+
+
+def is_llm_failure(payload: Dict) -> bool:
+    """Segnaposto di una chiamata LLM fallita, non un verdetto (anche i deal salvati prima del flag llm_failed, senza deal_type)."""
+    return bool(payload.get("llm_failed")) or "deal_type" not in payload
+
+
+def load_dataset(path: Optional[str]) -> List[Dict]:
+    if not path:
+        return dataset_from_db()
+    with open(path, encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def split(dataset: List[Dict], validation_share: float = 0.2) -> Tuple[List[Dict], List[Dict]]:
+    """Split deterministico per hash dell'URL: stesso dataset -> stesso report."""
+    train, valid = [], []
+    for row in dataset:
+        bucket = zlib.crc32(row["url"].encode("utf-8")) % 1000
+        (valid if bucket < validation_share * 1000 else train).append(row)
+    return train, valid
+
+
+def _xy(rows: Iterable[Dict]) -> Tuple[List[np.ndarray], np.ndarray]:
+    rows = list(rows)
+    return [featurize(r["title"], r["target"]) for r in rows], np.array([r["label"] for r in rows], dtype=np.float64)
+
+
+def train(dataset: List[Dict], recall_floor: float = DEFAULT_RECALL_FLOOR, seed: int = 0) -> Tuple[TriageModel, Dict]:
+    train_rows, valid_rows = split(dataset)
+    x_train, y_train = _xy(train_rows)
+    x_valid, y_valid = _xy(valid_rows)
+    weights = fit(x_train, y_train, seed=seed)
+    valid_scores = _predict(weights, x_valid)
+    threshold = choose_threshold(valid_scores, y_valid, recall_floor)
+    metrics = {
+        "recall_floor": recall_floor,
+        "seed": seed,
+        "train": report(_predict(weights, x_train), y_train, threshold),
+        "validation": report(valid_scores, y_valid, threshold),
+    }
+    return TriageModel(weights, threshold, metrics), metrics
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Triage locale di rilevanza")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p_export = sub.add_parser("export-dataset", help="salva il dataset dal DB in JSONL (per report offline)")
+    p_export.add_argument("--output", required=True)
+
+    p_train = sub.add_parser("train", help="(ri)addestra il modello")
+    p_train.add_argument("--dataset", help="JSONL offline (default: DB)")
+    p_train.add_argument("--recall-floor", type=float, default=DEFAULT_RECALL_FLOOR)
+    p_train.add_argument("--seed", type=int, default=0)
+    p_train.add_argument("--model", default=TRIAGE_MODEL_PATH)
+    p_train.add_argument("--report")
+
+    p_eval = sub.add_parser("evaluate", help="report precision/recall di un modello esistente")
+    p_eval.add_argument("--dataset")
+    p_eval.add_argument("--model", default=TRIAGE_MODEL_PATH)
+
+    args = parser.parse_args(argv)
+
+    if args.command == "export-dataset":
+        dataset = dataset_from_db()
+        with open(args.output, "w", encoding="utf-8") as f:
+            for row in dataset:
+                f.write(json.dumps(row, ensure_ascii=False) + "\n")
+        print(f"[Triage] {len(dataset)} esempi salvati in {args.output}")
+
+    elif args.command == "train":
+        dataset = load_dataset(args.dataset)
+        model, metrics = train(dataset, args.recall_floor, args.seed)
+        model.save(args.model)
+        print(json.dumps(metrics, indent=2))
+        if args.report:
+            with open(args.report, "w", encoding="utf-8") as f:
+                json.dump(metrics, f, indent=2)
+        print(f"[Triage] Modello salvato in {args.model}")
+
+    elif args.command == "evaluate":
+        model = TriageModel.load(args.model)
+        _, valid_rows = split(load_dataset(args.dataset))
+        x_valid, y_valid = _xy(valid_rows)
+        print(json.dumps(report(_predict(model.weights, x_valid), y_valid, model.threshold), indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,20 +1,55 @@
 import os
 from celery import Celery
+from celery.exceptions import SoftTimeLimitExceeded
+from celery.signals import worker_init, worker_process_shutdown, worker_ready
 
 # --- FIX IMPORT: ASSOLUTI (NO PUNTI) ---
 from models import ScrapeSettings
 from scraper_service import SpaceScraperService
+import metrics
+import profiling
+from task_stats import save_task_stats
+from task_control import CancelFlag
+from database import SessionLocal
+import backfill
+from agent_service import StartupAgent
 
 # Recuperiamo le URL di connessione
 CELERY_BROKER_URL = os.getenv("CELERY_BROKER_URL", "redis://redis:6379/0")
 CELERY_RESULT_BACKEND = os.getenv("CELERY_RESULT_BACKEND", "redis://redis:6379/0")
 
+# Limiti di tempo dello scraping: la pipeline si ferma da sola SHUTDOWN_GRACE_SECONDS prima
+# del soft limit; il soft limit solleva SoftTimeLimitExceeded, l'hard limit uccide il processo.
+SCRAPE_SOFT_TIME_LIMIT = int(os.getenv("SCRAPE_SOFT_TIME_LIMIT", "3300"))
+SCRAPE_TIME_LIMIT = SCRAPE_SOFT_TIME_LIMIT + 120
+SHUTDOWN_GRACE_SECONDS = 60
+
 celery_app = Celery(
     "space_worker",
     broker=CELERY_BROKER_URL,
     backend=CELERY_RESULT_BACKEND
 )
 
+# --- CODE: INTERATTIVA vs BULK ---
+# I job piccoli (verifica rapida di un analista) non devono aspettare dietro ai backfill.
+# Ogni coda ha il suo pool di worker (vedi docker-compose.yml).
+INTERACTIVE_QUEUE = "interactive"
+BULK_QUEUE = "bulk"
+SCRAPE_QUEUES = (INTERACTIVE_QUEUE, BULK_QUEUE)
+# Oltre questa stima (pagine da scaricare per sorgente e target) il job va in bulk
+BULK_JOB_SIZE_THRESHOLD = int(os.getenv("BULK_JOB_SIZE_THRESHOLD", "6"))
+
+def estimate_job_size(settings: ScrapeSettings) -> int:
+    """
+    Stima del lavoro: sorgenti distinte x pagine x aziende target.
+    In watchlist i feed si scaricano una volta sola, quindi i target non moltiplicano.
+    """
+    targets = 1 if settings.is_watchlist() else len(settings.target_list())
+    return len(set(settings.sources)) * max(1, settings.max_pages) * max(1, targets)
+
+def route_scrape(settings: ScrapeSettings) -> str:
+    return BULK_QUEUE if estimate_job_size(settings) > BULK_JOB_SIZE_THRESHOLD else INTERACTIVE_QUEUE
+
 # --- TUNING PRODUZIONE ---
 celery_app.conf.update(
     task_serializer="json",
@@ -22,16 +57,34 @@ celery_app.conf.update(
     accept_content=["json"],
     timezone="UTC",
     enable_utc=True,
-    task_time_limit=600, 
+    task_soft_time_limit=SCRAPE_SOFT_TIME_LIMIT,
+    task_time_limit=SCRAPE_TIME_LIMIT,
     task_acks_late=True,
+    task_default_queue=INTERACTIVE_QUEUE,
+    # Task lunghi + acks_late: ogni processo prenota un solo task alla volta,
+    # così un job in coda non resta bloccato dietro a uno in esecuzione
+    worker_prefetch_multiplier=1,
 )
 
-@celery_app.task(bind=True, name="execute_scrape_task", time_limit=3600, soft_time_limit=3600)
+# --- METRICHE PROMETHEUS ---
+@worker_init.connect
+def start_metrics_server(**kwargs):
+    metrics.start_worker_metrics_server()
+
+@worker_process_shutdown.connect
+def cleanup_metrics(pid=None, **kwargs):
+    metrics.mark_process_dead(pid or os.getpid())
+
+@celery_app.task(bind=True, name="execute_scrape_task",
+                 soft_time_limit=SCRAPE_SOFT_TIME_LIMIT, time_limit=SCRAPE_TIME_LIMIT)
 def execute_scrape_task(self, settings_dict: dict):
     """
     Riceve il dizionario JSON, lo riconverte in oggetto Pydantic (gestendo gli Enum)
     e lancia il servizio di scraping multi-sorgente.
+    Cancellazione (POST /api/tasks/{id}/cancel) e scadenza fermano il run in modo ordinato:
+    il task termina con successo restituendo i risultati parziali.
     """
+    service = None
     try:
         # 1. Ricostruzione Oggetto Pydantic
         # Pydantic è intelligente: se 'settings_dict' contiene stringhe per le fonti (es. "SpaceNews"),
@@ -45,12 +98,153 @@ def execute_scrape_task(self, settings_dict: dict):
         print(f"[Worker] Fonti attive: {active_sources}")
 
         # 3. Esecuzione Service (Pattern Adapter)
-        service = SpaceScraperService(settings)
-        results = service.scrape()
-        
-        print(f"[Worker] Task completato. Trovati {len(results)} risultati totali.")
-        return results
+        # La pipeline si ferma da sola prima del soft time limit, lasciando il tempo di chiudere
+        stop_options = {
+            "should_cancel": CancelFlag(self.request.id),
+            "deadline_seconds": SCRAPE_SOFT_TIME_LIMIT - SHUTDOWN_GRACE_SECONDS,
+        }
+        if settings.profile:
+            with profiling.capture(self.request.id) as span_recorder:
+                service = SpaceScraperService(settings, span_recorder=span_recorder, task_id=self.request.id)
+                results = service.scrape(**stop_options)
+        else:
+            service = SpaceScraperService(settings, task_id=self.request.id)
+            results = service.scrape(**stop_options)
+
+    except SoftTimeLimitExceeded:
+        # Ultima difesa (es. una singola chiamata bloccata): l'articolo in corso si perde,
+        # quelli già analizzati sono committati e vengono restituiti
+        if service is None:
+            raise
+        print("[Worker] Soft time limit raggiunto: restituisco i risultati parziali.")
+        service.db.rollback()
+        service.run_stats["stopped_soft_time_limit"] = 1
+        results = service.results
 
     except Exception as e:
         print(f"[Worker] ERRORE CRITICO: {str(e)}")
-        raise e
\ No newline at end of file
+        raise e
+
+    save_task_stats(self.request.id, service.run_stats)
+    if service.stop_reason:
+        print(f"[Worker] Task interrotto ({service.stop_reason}). Risultati parziali: {len(results)}.")
+    else:
+        print(f"[Worker] Task completato. Trovati {len(results)} risultati totali.")
+    print(f"[Worker] Statistiche run: {dict(service.run_stats)}")
+    return results
+
+# --- RIANALISI DALL'ARCHIVIO (nessun download: solo LLM, coda bulk) ---
+@celery_app.task(bind=True, name="execute_reanalyze_task",
+                 soft_time_limit=SCRAPE_SOFT_TIME_LIMIT, time_limit=SCRAPE_TIME_LIMIT)
+def execute_reanalyze_task(self, settings_dict: dict, limit: int = None, concurrency: int = None):
+    settings = ScrapeSettings(**settings_dict)
+    print(f"[Worker] Rianalisi dall'archivio: {settings.target_companies} con {settings.ai_model}")
+    service = SpaceScraperService(settings, task_id=self.request.id)
+    try:
+        results = service.reanalyze(
+            should_cancel=CancelFlag(self.request.id),
+            deadline_seconds=SCRAPE_SOFT_TIME_LIMIT - SHUTDOWN_GRACE_SECONDS,
+            concurrency=concurrency,
+            limit=limit,
+        )
+    except SoftTimeLimitExceeded:
+        print("[Worker] Soft time limit raggiunto: restituisco i risultati parziali.")
+        service.db.rollback()
+        service.run_stats["stopped_soft_time_limit"] = 1
+        results = service.results
+
+    save_task_stats(self.request.id, service.run_stats)
+    print(f"[Worker] Rianalisi completata. {len(results)} risultati rilevanti. Statistiche: {dict(service.run_stats)}")
+    return results
+
+# --- BACKFILL STORICO (chunk con checkpoint, coda bulk) ---
+def dispatch_backfill_chunks(db, chunk_ids):
+    """Mette in coda bulk i chunk indicati (segnandoli queued)."""
+    backfill.mark_queued(db, chunk_ids)
+    for chunk_id in chunk_ids:
+        execute_backfill_chunk.apply_async(args=[chunk_id], queue=BULK_QUEUE)
+
+@worker_ready.connect
+def resume_backfills(sender=None, **kwargs):
+    """Dopo un riavvio del pool bulk riprende i chunk rimasti pending o orfani."""
+    # sender è il Consumer: solo il pool che consuma la coda bulk fa la ripresa
+    task_consumer = getattr(sender, "task_consumer", None)
+    queues = {q.name for q in getattr(task_consumer, "queues", [])}
+    if BULK_QUEUE not in queues:
+        return
+    db = SessionLocal()
+    try:
+        chunk_ids = backfill.resumable_chunk_ids(db, automatic=True)
+        if chunk_ids:
+            print(f"[Backfill] Ripresa automatica di {len(chunk_ids)} chunk.")
+            dispatch_backfill_chunks(db, chunk_ids)
+    except Exception as e:
+        print(f"[Backfill] Ripresa automatica non riuscita: {e}")
+    finally:
+        db.close()
+
+@celery_app.task(bind=True, name="execute_backfill_chunk",
+                 soft_time_limit=SCRAPE_SOFT_TIME_LIMIT, time_limit=SCRAPE_TIME_LIMIT)
+def execute_backfill_chunk(self, chunk_id: int):
+    """
+    Esegue un chunk (target, sorgente, mese) di un backfill e ne registra il checkpoint.
+    Un chunk già completato o in esecuzione altrove viene saltato.
+    """
+    db = SessionLocal()
+    service = None
+    try:
+        chunk = backfill.claim_chunk(db, chunk_id, self.request.id)
+        if chunk is None:
+            print(f"[Backfill] Chunk {chunk_id} già completato o in corso: salto.")
+            return {"chunk_id": chunk_id, "skipped": True}
+
+        settings = backfill.chunk_settings(db, chunk)
+        print(f"[Backfill] Chunk {chunk_id}: {chunk.target} / {chunk.source} / {chunk.period_start} -> {chunk.period_end}")
+        service = SpaceScraperService(settings, task_id=self.request.id)
+        try:
+            results = service.scrape(
+                should_cancel=CancelFlag(self.request.id),
+                deadline_seconds=SCRAPE_SOFT_TIME_LIMIT - SHUTDOWN_GRACE_SECONDS,
+            )
+        except SoftTimeLimitExceeded:
+            service.db.rollback()
+            service.stop_reason = "soft_time_limit"
+            results = service.results
+        save_task_stats(self.request.id, service.run_stats)
+
+        if service.stop_reason:
+            # Checkpoint invariato: il chunk torna pending e riparte (saltando i deal già salvati)
+            backfill.release_chunk(db, chunk_id)
+            if service.stop_reason != "cancelled":
+                dispatch_backfill_chunks(db, [chunk_id])
+            print(f"[Backfill] Chunk {chunk_id} interrotto ({service.stop_reason}), {len(results)} risultati salvati.")
+        else:
+            backfill.complete_chunk(db, chunk_id, len(results))
+        return {"chunk_id": chunk_id, "results": len(results), "stopped": service.stop_reason}
+
+    except Exception as e:
+        print(f"[Backfill] ERRORE chunk {chunk_id}: {e}")
+        db.rollback()
+        backfill.fail_chunk(db, chunk_id, str(e))
+        raise
+    finally:
+        if service is not None:
+            service.db.close()
+        db.close()
+
+# --- INDAGINE AGENTE (ricerca web + LLM, aziende in parallelo) ---
+def route_investigation(companies) -> str:
+    return BULK_QUEUE if len(companies) > BULK_JOB_SIZE_THRESHOLD else INTERACTIVE_QUEUE
+
+@celery_app.task(bind=True, name="investigate_companies_task")
+def investigate_companies_task(self, companies: list, ai_model: str = "mistral-large-latest", api_key: str = ""):
+    agent = StartupAgent(model=ai_model, api_key=api_key or None)
+    reports = agent.investigate_companies(companies)
+    save_task_stats(self.request.id, {
+        "companies": len(reports),
+        "errors": sum(1 for r in reports if r["error"]),
+        "search_cached": sum(1 for r in reports if r["search_cached"]),
+        "retries": agent.retry_budget.spent,
+    })
+    print(f"[Worker] Indagine completata: {len(reports)} aziende.")
+    return reports
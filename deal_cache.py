@@ -0,0 +1,182 @@
+"""
+Cache dei risultati di analisi per scraper.py: un unico file SQLite (WAL)
+al posto di un file JSON per URL in `cache_deals/`.
+
+Le chiavi sono lo SHA-1 dell'URL (come i vecchi nomi file), quindi
+l'import della cartella esistente mantiene gli stessi hit.
+
+Uso da riga di comando:
+    python deal_cache.py import cache_deals      # import una tantum
+    python deal_cache.py stats
+"""
+import hashlib
+import json
+import os
+import sqlite3
+import sys
+import threading
+import time
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Tuple
+
+CACHE_DB_PATH = Path(os.getenv("DEAL_CACHE_PATH", "cache_deals.sqlite3"))
+CACHE_TTL_SECONDS = float(os.getenv("DEAL_CACHE_TTL_SECONDS", "0")) or None   # 0 = nessuna scadenza
+CACHE_MAX_ENTRIES = int(os.getenv("DEAL_CACHE_MAX_ENTRIES", "0")) or None     # 0 = nessun limite
+EVICT_EVERY = 1000  # ogni quante scritture controllare il limite di dimensione
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS deal_cache (
+    key TEXT PRIMARY KEY,
+    url TEXT,
+    data TEXT NOT NULL,
+    created_at REAL NOT NULL
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS idx_deal_cache_created_at ON deal_cache (created_at);
+CREATE TABLE IF NOT EXISTS cache_meta (
+    name TEXT PRIMARY KEY,
+    value TEXT
+);
+"""
+
+
+def url_key(url: str) -> str:
+    return hashlib.sha1(url.encode("utf-8")).hexdigest()
+
+
+class DealCache:
+    def __init__(self, path: Path = CACHE_DB_PATH, ttl_seconds: Optional[float] = CACHE_TTL_SECONDS,
+                 max_entries: Optional[int] = CACHE_MAX_ENTRIES):
+        self.path = Path(path)
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._writes = 0
+        self.conn = sqlite3.connect(str(self.path), check_same_thread=False, isolation_level=None)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.executescript(SCHEMA)
+
+    # --- LETTURA ---
+    def _min_created_at(self) -> float:
+        return time.time() - self.ttl_seconds if self.ttl_seconds else 0.0
+
+    def get(self, url: str) -> Optional[Dict]:
+        with self._lock:
+            row = self.conn.execute(
+                "SELECT data FROM deal_cache WHERE key = ? AND created_at >= ?",
+                (url_key(url), self._min_created_at())
+            ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def get_many(self, urls: Iterable[str]) -> Dict[str, Dict]:
+        """Restituisce {url: data} per gli URL presenti (e non scaduti)."""
+        keys = {url_key(u): u for u in urls}
+        found: Dict[str, Dict] = {}
+        key_list = list(keys)
+        # SQLite limita il numero di parametri per query
+        for i in range(0, len(key_list), 500):
+            chunk = key_list[i:i + 500]
+            placeholders = ",".join("?" * len(chunk))
+            with self._lock:
+                rows = self.conn.execute(
+                    f"SELECT key, data FROM deal_cache WHERE key IN ({placeholders}) AND created_at >= ?",
+                    (*chunk, self._min_created_at())
+                ).fetchall()
+            for key, data in rows:
+                found[keys[key]] = json.loads(data)
+        return found
+
+    # --- SCRITTURA ---
+    def put(self, url: str, data: Dict) -> None:
+        self.put_many([(url, data)])
+
+    def put_many(self, items: Iterable[Tuple[str, Dict]]) -> None:
+        now = time.time()
+        rows = [(url_key(u), u, json.dumps(d, ensure_ascii=False, separators=(",", ":")), now) for u, d in items]
+        if not rows:
+            return
+        self._write_rows(rows)
+
+    def _write_rows(self, rows: List[Tuple]) -> None:
+        with self._lock:
+            self.conn.execute("BEGIN")
+            try:
+                self.conn.executemany(
+                    "INSERT OR REPLACE INTO deal_cache (key, url, data, created_at) VALUES (?, ?, ?, ?)", rows
+                )
+                self.conn.execute("COMMIT")
+            except Exception:
+                # Altrimenti la connessione resta in transazione e il prossimo BEGIN fallisce
+                self.conn.execute("ROLLBACK")
+                raise
+            self._writes += len(rows)
+            should_evict = self._writes >= EVICT_EVERY
+            if should_evict:
+                self._writes = 0
+        if should_evict:
+            self.evict()
+
+    # --- EVICTION ---
+    def evict(self) -> int:
+        """Rimuove le voci scadute (TTL) e le più vecchie oltre max_entries."""
+        removed = 0
+        with self._lock:
+            if self.ttl_seconds:
+                removed += self.conn.execute(
+                    "DELETE FROM deal_cache WHERE created_at < ?", (self._min_created_at(),)
+                ).rowcount
+            if self.max_entries:
+                removed += self.conn.execute(
+                    "DELETE FROM deal_cache WHERE key IN ("
+                    " SELECT key FROM deal_cache ORDER BY created_at DESC LIMIT -1 OFFSET ?)",
+                    (self.max_entries,)
+                ).rowcount
+        return removed
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self.conn.execute("SELECT COUNT(*) FROM deal_cache").fetchone()[0]
+
+    # --- IMPORT UNA TANTUM DELLA VECCHIA CARTELLA ---
+    def import_directory(self, directory: Path, force: bool = False) -> int:
+        """Importa i file `<sha1>.json` di cache_deals/. Eseguito una sola volta salvo force=True."""
+        directory = Path(directory)
+        with self._lock:
+            done = self.conn.execute("SELECT value FROM cache_meta WHERE name = 'legacy_import'").fetchone()
+        if (done and not force) or not directory.is_dir():
+            return 0
+
+        rows = []
+        for p in directory.glob("*.json"):
+            try:
+                data = json.loads(p.read_text(encoding="utf-8"))
+            except Exception:
+                continue
+            # File legacy malformati (lista, stringa...): non sono voci di cache
+            if not isinstance(data, dict):
+                continue
+            rows.append((p.stem, data.get("url"), json.dumps(data, ensure_ascii=False, separators=(",", ":")),
+                         p.stat().st_mtime))
+        for i in range(0, len(rows), 1000):
+            self._write_rows(rows[i:i + 1000])
+
+        with self._lock:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO cache_meta (name, value) VALUES ('legacy_import', ?)", (str(directory),)
+            )
+        return len(rows)
+
+    def close(self):
+        with self._lock:
+            self.conn.close()
+
+
+if __name__ == "__main__":
+    cache = DealCache()
+    cmd = sys.argv[1] if len(sys.argv) > 1 else "stats"
+    if cmd == "import":
+        source = Path(sys.argv[2]) if len(sys.argv) > 2 else Path("cache_deals")
+        print(f"Importate {cache.import_directory(source, force=True)} voci da {source}")
+    elif cmd == "evict":
+        print(f"Rimosse {cache.evict()} voci")
+    print(f"Voci in cache: {len(cache)} ({cache.path})")
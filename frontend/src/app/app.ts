@@ -222,17 +222,20 @@ export class AppComponent implements OnInit, OnDestroy {
         }
     }, 800); 
     
-    this.api.startScrape(this.settings).subscribe({
+    const onPartial = (deals: Deal[]) => {
+        this.allDeals = [...this.allDeals, ...deals];
+        this.sortDealsByDate();
+        this.applyFilter(this.selectedType);
+        this.cdr.detectChanges();
+    };
+
+    this.api.startScrape(this.settings, onPartial).subscribe({
       next: (results) => {
         clearInterval(this.progressInterval);
         this.progressValue = 100;
         this.statusMessage = 'Elaborazione completata!';
         this.allDeals = results;
-        this.allDeals.sort((a, b) => {
-            const dateA = a.published_date ? new Date(a.published_date).getTime() : 0;
-            const dateB = b.published_date ? new Date(b.published_date).getTime() : 0;
-            return dateB - dateA;
-        });
+        this.sortDealsByDate();
         this.applyFilter('ALL');
         this.cdr.detectChanges();
         setTimeout(() => {
@@ -255,6 +258,14 @@ export class AppComponent implements OnInit, OnDestroy {
     });
   }
 
+  sortDealsByDate() {
+      this.allDeals.sort((a, b) => {
+          const dateA = a.published_date ? new Date(a.published_date).getTime() : 0;
+          const dateB = b.published_date ? new Date(b.published_date).getTime() : 0;
+          return dateB - dateA;
+      });
+  }
+
   applyFilter(type: string) {
       this.selectedType = type;
       if (type === 'ALL') {
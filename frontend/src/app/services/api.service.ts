@@ -1,7 +1,7 @@
 import { Injectable } from '@angular/core';
 import { HttpClient } from '@angular/common/http';
 import { Observable, timer, throwError, of } from 'rxjs';
-import { switchMap, map, takeWhile, catchError, filter, take } from 'rxjs/operators';
+import { switchMap, map, takeWhile, catchError, filter, take, tap } from 'rxjs/operators';
 import { Deal, ScrapeSettings } from '../models/deal.model';
 
 // --- 1. IMPORTA IL DATASERVICE CHE ABBIAMO CREATO ---
@@ -14,6 +14,12 @@ export interface TaskResponse {
   error?: string;
 }
 
+export interface TaskResultsPage {
+  task_id: string;
+  items: Deal[];
+  next_cursor: number;
+}
+
 @Injectable({
   providedIn: 'root'
 })
@@ -30,8 +36,9 @@ export class ApiService {
    * 2. Riceve un task_id.
    * 3. Inizia automaticamente a fare polling.
    * 4. Restituisce i risultati finali.
+   * Se passato, onPartial riceve i deal nuovi man mano che il worker li salva.
    */
-  startScrape(settings: ScrapeSettings): Observable<Deal[]> {
+  startScrape(settings: ScrapeSettings, onPartial?: (deals: Deal[]) => void): Observable<Deal[]> {
     
     // --- 3. LA MAGIA AVVIENE QUI! ---
     // Appena viene chiamato startScrape, avvisiamo la Heatmap di ricaricarsi 
@@ -45,7 +52,7 @@ export class ApiService {
     return this.http.post<TaskResponse>(`${this.baseUrl}/start-scrape`, settings).pipe(
       switchMap(initialResponse => {
         console.log(`[ApiService] Task avviato: ${initialResponse.task_id}`);
-        return this.pollTask(initialResponse.task_id);
+        return this.pollTask(initialResponse.task_id, onPartial);
       }),
       catchError(err => {
         console.error("[ApiService] Errore avvio:", err);
@@ -55,9 +62,12 @@ export class ApiService {
   }
 
   // ... (Tutto il resto del file pollTask, getStatus, getResults rimane identico) ...
-  private pollTask(taskId: string): Observable<Deal[]> {
+  private pollTask(taskId: string, onPartial?: (deals: Deal[]) => void): Observable<Deal[]> {
+    const cursor = { after: 0 };
     return timer(0, 2000).pipe(
-      switchMap(() => this.http.get<TaskResponse>(`${this.baseUrl}/tasks/${taskId}`)),
+      switchMap(() => this.fetchPartialResults(taskId, cursor, onPartial).pipe(
+        switchMap(() => this.http.get<TaskResponse>(`${this.baseUrl}/tasks/${taskId}`))
+      )),
       takeWhile(res => {
         const isRunning = res.status !== 'SUCCESS' && res.status !== 'FAILURE';
         if (isRunning) {
@@ -83,6 +93,18 @@ export class ApiService {
     );
   }
 
+  // Scarica solo i deal prodotti dopo l'ultimo cursore ricevuto
+  private fetchPartialResults(taskId: string, cursor: { after: number }, onPartial?: (deals: Deal[]) => void): Observable<unknown> {
+    if (!onPartial) return of(null);
+    return this.http.get<TaskResultsPage>(`${this.baseUrl}/tasks/${taskId}/results`, { params: { after: cursor.after } }).pipe(
+      tap(page => {
+        cursor.after = page.next_cursor;
+        if (page.items.length > 0) onPartial(page.items);
+      }),
+      catchError(() => of(null))
+    );
+  }
+
   getStatus(): Observable<any> {
     return this.http.get(`${this.baseUrl}/status`);
   }
@@ -1,28 +1,69 @@
+import os
 import time
+import threading
 import requests
 import json
 import re
-import hashlib
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 from bs4 import BeautifulSoup
 from models import ScrapeSettings, DealData
+from deal_cache import DealCache
+from resilience import RetryBudget, http_request
 
-# Configurazione Cache
+# Configurazione Cache (SQLite indicizzato; la vecchia cartella JSON viene importata una volta)
 CACHE_DIR = Path("cache_deals")
-CACHE_DIR.mkdir(exist_ok=True)
+_cache = None
+_cache_lock = threading.Lock()
 
-# Stato globale
+# Concorrenza: thread per discovery/analisi e intervallo minimo tra due chiamate LLM
+MAX_WORKERS = int(os.getenv("SCRAPER_MAX_WORKERS", "8"))
+LLM_MIN_INTERVAL = float(os.getenv("SCRAPER_LLM_MIN_INTERVAL", "0.6"))
+LOG_CAPACITY = 150
+MISTRAL_CHAT_URL = os.getenv("MISTRAL_CHAT_URL", "https://api.mistral.ai/v1/chat/completions")
+
+# Stato globale (protetto da status_lock; i log sono un ring buffer, il più recente in testa)
+status_lock = threading.RLock()
 current_status = {
     "is_running": False,
     "total": 0,
     "processed": 0,
     "message": "Idle",
     "last_update": "",
-    "logs": [] 
+    "logs": deque(maxlen=LOG_CAPACITY),
+    # Token consumati nel run corrente (cached = prefisso riusato dalla prompt cache del provider)
+    "llm_usage": {"calls": 0, "prompt_tokens": 0, "completion_tokens": 0, "cached_tokens": 0, "seconds": 0.0},
 }
 
+def get_status_snapshot() -> dict:
+    """Copia coerente dello stato, serializzabile in JSON."""
+    with status_lock:
+        snapshot = dict(current_status)
+        snapshot["logs"] = list(current_status["logs"])
+        snapshot["llm_usage"] = dict(current_status["llm_usage"])
+    return snapshot
+
+def get_cache() -> DealCache:
+    """Cache aperta al primo uso (non all'import del modulo): lì avviene anche l'import una tantum."""
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            cache = DealCache()
+            try:
+                cache.import_directory(CACHE_DIR)
+            except Exception as e:
+                print(f"[Cache] Import di {CACHE_DIR} fallito: {e}")
+            _cache = cache
+        return _cache
+
+def request_stop():
+    """Stop cooperativo: i worker non prendono nuovi URL e lo scrape termina appena possibile."""
+    with status_lock:
+        current_status["is_running"] = False
+
 class SpaceScraperService:
-    def __init__(self, settings: ScrapeSettings):
+    def __init__(self, settings: ScrapeSettings, max_workers: int = MAX_WORKERS):
         self.settings = settings
         if not self.settings.api_key or not self.settings.api_key.strip():
             raise ValueError("API Key non fornita dall'utente!")
@@ -30,39 +71,81 @@ class SpaceScraperService:
         self.companies_list = [c.strip() for c in settings.target_companies.split(",")]
         self.base_url = "https://spacenews.com"
         self.headers = {"User-Agent": "Mozilla/5.0 (compatible; SpaceNewsDealBot/0.1)"}
+        self.max_workers = max(1, max_workers)
+        self._local = threading.local()
+        self._llm_lock = threading.Lock()
+        self._next_llm_slot = 0.0
+        self.retry_budget = RetryBudget()
 
     # --- LOGGING ---
     def add_log(self, message, type="info"):
         timestamp = time.strftime("%H:%M:%S")
         entry = {"timestamp": timestamp, "message": message, "type": type}
         print(f"[{type.upper()}] {message}")
-        current_status["logs"].insert(0, entry)
-        current_status["logs"] = current_status["logs"][:150]
+        with status_lock:
+            current_status["logs"].appendleft(entry)
 
     def update_status(self, message, processed=None, total=None):
-        current_status["message"] = message
-        current_status["last_update"] = time.strftime("%H:%M:%S")
-        if processed is not None: current_status["processed"] = processed
-        if total is not None: current_status["total"] = total
+        with status_lock:
+            current_status["message"] = message
+            current_status["last_update"] = time.strftime("%H:%M:%S")
+            if processed is not None: current_status["processed"] = processed
+            if total is not None: current_status["total"] = total
+
+    def _advance(self, message):
+        """Segna un URL come completato (thread-safe)."""
+        with status_lock:
+            current_status["processed"] += 1
+            current_status["message"] = message
+            current_status["last_update"] = time.strftime("%H:%M:%S")
+
+    def _record_usage(self, usage, seconds):
+        """Somma la `usage` della risposta Mistral ai totali del run (thread-safe)."""
+        usage = usage or {}
+        cached = (usage.get("prompt_tokens_details") or {}).get("cached_tokens") or 0
+        with status_lock:
+            totals = current_status["llm_usage"]
+            totals["calls"] += 1
+            totals["prompt_tokens"] += usage.get("prompt_tokens") or 0
+            totals["completion_tokens"] += usage.get("completion_tokens") or 0
+            totals["cached_tokens"] += cached
+            totals["seconds"] = round(totals["seconds"] + seconds, 3)
 
-    # --- CACHING (Nuovo!) ---
-    def get_cache_path(self, url: str) -> Path:
-        # Crea un nome file unico basato sull'URL
-        file_hash = hashlib.sha1(url.encode("utf-8")).hexdigest()
-        return CACHE_DIR / f"{file_hash}.json"
+    def _should_stop(self) -> bool:
+        with status_lock:
+            return not current_status["is_running"]
 
+    # --- HTTP / RATE LIMIT ---
+    def _session(self) -> requests.Session:
+        # Una sessione per thread: riuso delle connessioni keep-alive
+        session = getattr(self._local, "session", None)
+        if session is None:
+            session = requests.Session()
+            session.headers.update(self.headers)
+            self._local.session = session
+        return session
+
+    def _throttle_llm(self):
+        """Distanzia l'avvio delle chiamate LLM di almeno LLM_MIN_INTERVAL, su tutti i thread."""
+        with self._llm_lock:
+            now = time.monotonic()
+            wait = self._next_llm_slot - now
+            self._next_llm_slot = max(now, self._next_llm_slot) + LLM_MIN_INTERVAL
+        if wait > 0:
+            time.sleep(wait)
+
+    # --- CACHING ---
     def load_cached(self, url: str):
-        p = self.get_cache_path(url)
-        if p.exists():
-            try:
-                return json.loads(p.read_text(encoding="utf-8"))
-            except:
-                return None
-        return None
+        try:
+            return get_cache().get(url)
+        except Exception:
+            return None
+
+    def load_cached_many(self, urls):
+        return get_cache().get_many(urls)
 
     def save_cached(self, url: str, data: dict):
-        p = self.get_cache_path(url)
-        p.write_text(json.dumps(data, indent=2, ensure_ascii=False), encoding="utf-8")
+        get_cache().put(url, data)
 
     # --- TEXT UTILS ---
     def _txt(self, s: str) -> str:
@@ -87,43 +170,114 @@ class SpaceScraperService:
         return "\n".join(body_parts)
 
     # --- DISCOVERY ---
+    def _fetch_page(self, page):
+        if self._should_stop():
+            return []
+        try:
+            self.add_log(f"Fetching Page {page}...", "info")
+            api_url = f"{self.base_url}/wp-json/wp/v2/posts"
+            params = {
+                "per_page": 20, 
+                "page": page, 
+                "search": " ".join(self.companies_list),
+                "after": f"{self.settings.min_year}-01-01T00:00:00"
+            }
+            
+            r = self._session().get(api_url, params=params, timeout=10)
+            if r.status_code == 200:
+                items = r.json()
+                self.add_log(f"Page {page}: Found {len(items)} articles.", "success")
+                return [item['link'] for item in items]
+            self.add_log(f"Page {page}: API Error {r.status_code}", "error")
+        except Exception as e:
+            self.add_log(f"Error Page {page}: {str(e)}", "error")
+        return []
+
     def discover_urls(self):
-        urls = []
         self.add_log(f"Scanning {self.settings.max_pages} pages for {self.companies_list}...", "info")
         
-        for page in range(1, self.settings.max_pages + 1):
-            try:
-                self.add_log(f"Fetching Page {page}...", "info")
-                api_url = f"{self.base_url}/wp-json/wp/v2/posts"
-                params = {
-                    "per_page": 20, 
-                    "page": page, 
-                    "search": " ".join(self.companies_list),
-                    "after": f"{self.settings.min_year}-01-01T00:00:00"
-                }
-                
-                r = requests.get(api_url, params=params, headers=self.headers, timeout=10)
-                if r.status_code == 200:
-                    items = r.json()
-                    self.add_log(f"Page {page}: Found {len(items)} articles.", "success")
-                    for item in items:
-                        urls.append(item['link'])
-                else:
-                    self.add_log(f"Page {page}: API Error {r.status_code}", "error")
-            except Exception as e:
-                self.add_log(f"Error Page {page}: {str(e)}", "error")
+        pages = range(1, self.settings.max_pages + 1)
+        with ThreadPoolExecutor(max_workers=min(self.max_workers, len(pages) or 1)) as executor:
+            pages_urls = list(executor.map(self._fetch_page, pages))
         
-        unique_urls = list(set(urls))
+        # Deduplica mantenendo l'ordine delle pagine
+        unique_urls = list(dict.fromkeys(url for urls in pages_urls for url in urls))
         self.add_log(f"Total Unique URLs found: {len(unique_urls)}", "info")
         return unique_urls
 
+    # --- ANALISI DI UN SINGOLO URL (eseguita nei thread) ---
+    def process_url(self, url):
+        """Fetch, parsing, filtro keyword e analisi AI. Restituisce il deal se rilevante."""
+        if self._should_stop():
+            return None
+
+        short_url = url.split('/')[-2]
+        try:
+            # 1. FETCH & PARSE
+            try:
+                resp = self._session().get(url, timeout=10)
+                if resp.status_code != 200: return None
+                
+                text = self.parse_article_text(resp.text)
+                
+                if len(text) < 100:
+                    self.add_log(f"Skipped (Text too short): {short_url}", "warning")
+                    return None
+                
+                # 2. KEYWORD CHECK (FONDAMENTALE PER PRECISIONE)
+                # Se 'ICEYE' non è nel testo, saltiamo subito!
+                full_content = (short_url + " " + text)
+                if not self.contains_target_company(full_content):
+                    self.add_log(f"Skipped (Target not mentioned): {short_url}", "warning")
+                    # Opzionale: salviamo in cache che è irrilevante per non riprocessarlo
+                    dummy_result = {"is_relevant": False, "url": url, "deal_type": "none"}
+                    self.save_cached(url, dummy_result)
+                    return None
+
+            except Exception as e:
+                self.add_log(f"Fetch Error: {short_url}", "error")
+                return None
+
+            # 3. AI ANALYSIS
+            self._throttle_llm()
+            if self._should_stop():
+                return None
+            try:
+                self.add_log(f"Analyzing with AI: {short_url}...", "info")
+                deal_data = self.call_mistral(text, url)
+                
+                # Salva titolo se l'AI non l'ha trovato
+                if not deal_data.get('title'):
+                    soup = BeautifulSoup(resp.text, "html.parser")
+                    h1 = soup.find("h1")
+                    deal_data['title'] = h1.get_text().strip() if h1 else short_url
+                
+                deal_data['url'] = url # Assicura che l'URL ci sia
+                
+                # SALVA IN CACHE (Qualsiasi sia il risultato)
+                self.save_cached(url, deal_data)
+
+                if deal_data.get('is_relevant', False):
+                    self.add_log(f"✅ RELEVANT DEAL: {short_url}", "success")
+                    return deal_data
+                self.add_log(f"Skipped (AI deemed irrelevant): {short_url}", "warning")
+                    
+            except Exception as e:
+                self.add_log(f"AI Error: {str(e)}", "error")
+            return None
+        finally:
+            self._advance(f"Processed: {short_url}")
+
     # --- MAIN LOOP ---
     def scrape(self):
-        current_status["is_running"] = True
-        current_status["logs"] = [] 
-        current_status["processed"] = 0
-        current_status["total"] = 0
-        
+        with status_lock:
+            current_status["is_running"] = True
+            current_status["logs"].clear()
+            current_status["llm_usage"] = {"calls": 0, "prompt_tokens": 0, "completion_tokens": 0, "cached_tokens": 0, "seconds": 0.0}
+            current_status["processed"] = 0
+            current_status["total"] = 0
+        self.retry_budget = RetryBudget()
+
         try:
             self.update_status("Starting discovery...")
             urls = self.discover_urls()
@@ -132,108 +286,74 @@ class SpaceScraperService:
             if total == 0:
                 self.add_log("No articles found.", "warning")
                 self.update_status("Completed (No articles)", 0, 0)
-                current_status["is_running"] = False
+                request_stop()
                 return []
 
             self.update_status(f"Processing {total} articles...", 0, total)
             
-            results = []
-            
-            for i, url in enumerate(urls):
-                if not current_status["is_running"]: break 
-
-                short_url = url.split('/')[-2]
-                self.update_status(f"Processing: {short_url}", i+1, total)
-
-                # 1. CHECK CACHE
-                cached_data = self.load_cached(url)
-                if cached_data:
-                    self.add_log(f"Loaded from cache: {short_url}", "info")
-                    # Se era rilevante in cache, lo aggiungiamo ai risultati
-                    if cached_data.get('is_relevant'):
-                        results.append(cached_data)
-                    continue # Salta al prossimo URL
-
-                # 2. FETCH & PARSE
-                try:
-                    resp = requests.get(url, headers=self.headers, timeout=10)
-                    if resp.status_code != 200: continue
-                    
-                    text = self.parse_article_text(resp.text)
-                    
-                    if len(text) < 100:
-                        self.add_log(f"Skipped (Text too short): {short_url}", "warning")
-                        continue
-                    
-                    # 3. KEYWORD CHECK (FONDAMENTALE PER PRECISIONE)
-                    # Se 'ICEYE' non è nel testo, saltiamo subito!
-                    full_content = (short_url + " " + text)
-                    if not self.contains_target_company(full_content):
-                        self.add_log(f"Skipped (Target not mentioned): {short_url}", "warning")
-                        # Opzionale: salviamo in cache che è irrilevante per non riprocessarlo
-                        dummy_result = {"is_relevant": False, "url": url, "deal_type": "none"}
-                        self.save_cached(url, dummy_result)
-                        continue
-
-                except Exception as e:
-                    self.add_log(f"Fetch Error: {short_url}", "error")
-                    continue
+            # 1. CHECK CACHE (una sola query per tutti gli URL)
+            cached = self.load_cached_many(urls)
+            results_by_url = {}
+            for url, cached_data in cached.items():
+                self.add_log(f"Loaded from cache: {url.split('/')[-2]}", "info")
+                # Se era rilevante in cache, lo aggiungiamo ai risultati
+                if cached_data.get('is_relevant'):
+                    results_by_url[url] = cached_data
+                self._advance("Loaded from cache")
 
-                # 4. AI ANALYSIS
-                try:
-                    self.add_log(f"Analyzing with AI: {short_url}...", "info")
-                    deal_data = self.call_mistral(text, url)
-                    
-                    # Salva titolo se l'AI non l'ha trovato
-                    if not deal_data.get('title'):
-                        soup = BeautifulSoup(resp.text, "html.parser")
-                        h1 = soup.find("h1")
-                        deal_data['title'] = h1.get_text().strip() if h1 else short_url
-                    
-                    deal_data['url'] = url # Assicura che l'URL ci sia
-                    
-                    # SALVA IN CACHE (Qualsiasi sia il risultato)
-                    self.save_cached(url, deal_data)
-
-                    is_rel = deal_data.get('is_relevant', False)
-                    if is_rel:
-                        self.add_log(f"✅ RELEVANT DEAL: {short_url}", "success")
-                        results.append(deal_data)
-                    else:
-                        self.add_log(f"Skipped (AI deemed irrelevant): {short_url}", "warning")
-                        
-                except Exception as e:
-                    self.add_log(f"AI Error: {str(e)}", "error")
-                
-                time.sleep(0.6)
+            # 2. ANALISI PARALLELA (concorrenza limitata a max_workers)
+            pending = [url for url in urls if url not in cached]
+            executor = ThreadPoolExecutor(max_workers=self.max_workers)
+            try:
+                futures = {url: executor.submit(self.process_url, url) for url in pending}
+                stopping = False
+                for url, future in futures.items():
+                    if not stopping and self._should_stop():
+                        self.add_log("Stop requested: skipping remaining articles.", "warning")
+                        stopping = True
+                        # Si cancellano solo i task non ancora avviati: quelli conclusi o in corso
+                        # (già pagati) vengono comunque raccolti
+                        for pending_future in futures.values():
+                            pending_future.cancel()
+                    if future.cancelled():
+                        continue
+                    deal_data = future.result()
+                    if deal_data:
+                        results_by_url[url] = deal_data
+            finally:
+                # Su errore i task non ancora avviati vengono cancellati
+                executor.shutdown(wait=True, cancel_futures=True)
 
+            results = [results_by_url[url] for url in urls if url in results_by_url]
             self.add_log(f"Analysis Completed. Found {len(results)} deals.", "success")
             self.update_status("Analysis Completed", total, total)
-            current_status["is_running"] = False
+            request_stop()
             return results
 
         except Exception as e:
             self.add_log(f"FATAL ERROR: {str(e)}", "error")
-            current_status["is_running"] = False
+            request_stop()
             return []
 
     def call_mistral(self, text, url):
         companies_str = ", ".join(self.companies_list)
+        # Istruzioni variabili (aziende del task) DOPO il prompt di sistema statico:
+        # il prefisso resta identico tra run diversi e il provider può riusarlo dalla cache.
         focus_instruction = (
-            f"\n\nFOCUS SU: {companies_str}\n"
+            f"FOCUS SU: {companies_str}\n"
             f"- L'articolo è considerato rilevante (is_relevant=true) SOLO se una di queste aziende ({companies_str}) "
             "è direttamente coinvolta nel deal (acquisizione, contratto, partnership, investimento).\n"
             "- Se l'azienda è citata solo come contesto, o se il deal riguarda ALTRE aziende (es. D-Orbit compra Planetek), is_relevant=false."
         )
-        
-        full_system_prompt = self.settings.system_prompt + focus_instruction
+
+        system_prompt = (self.settings.system_prompt or "").strip()
 
         payload = {
             "model": self.settings.ai_model,
             "response_format": {"type": "json_object"},
             "messages": [
-                {"role": "system", "content": full_system_prompt},
-                {"role": "user", "content": f"URL: {url}\nTEXT: {text[:18000]}"} 
+                {"role": "system", "content": system_prompt},
+                {"role": "user", "content": f"{focus_instruction}\n\nURL: {url}\nTEXT: {text[:18000]}"}
             ]
         }
         
@@ -242,12 +362,13 @@ class SpaceScraperService:
             "Content-Type": "application/json"
         }
         
-        max_retries = 3
-        for attempt in range(max_retries):
-            try:
-                r = requests.post("https://api.mistral.ai/v1/chat/completions", json=payload, headers=headers, timeout=45)
-                r.raise_for_status()
-                return json.loads(r.json()["choices"][0]["message"]["content"])
-            except Exception as e:
-                if attempt == max_retries - 1: raise e
-                time.sleep((attempt + 1) * 2)
\ No newline at end of file
+        # Retry con backoff/Retry-After e breaker sul provider (resilience.py):
+        # se Mistral è giù, le chiamate successive falliscono subito (CircuitOpenError)
+        r = http_request(
+            "POST", MISTRAL_CHAT_URL, session=self._session(), budget=self.retry_budget,
+            component="llm", key="mistral", json=payload, headers=headers, timeout=45,
+        )
+        r.raise_for_status()
+        body = r.json()
+        self._record_usage(body.get("usage"), r.elapsed.total_seconds())
+        return json.loads(body["choices"][0]["message"]["content"])
\ No newline at end of file
@@ -0,0 +1,64 @@
+import json
+import sqlite3
+import time
+
+import pytest
+
+from deal_cache import DealCache, url_key
+
+
+@pytest.fixture
+def cache(tmp_path):
+    c = DealCache(tmp_path / "cache.sqlite3")
+    yield c
+    c.close()
+
+
+def _old_row(url, data, age_seconds):
+    return (url_key(url), url, json.dumps(data), time.time() - age_seconds)
+
+
+def test_put_and_get_many(cache):
+    cache.put_many([("https://a", {"is_relevant": True}), ("https://b", {"is_relevant": False})])
+    assert cache.get("https://a") == {"is_relevant": True}
+    assert cache.get_many(["https://a", "https://b", "https://c"]) == {
+        "https://a": {"is_relevant": True},
+        "https://b": {"is_relevant": False},
+    }
+
+
+def test_expired_entries_are_hidden_and_evicted(cache):
+    cache.ttl_seconds = 60
+    cache._write_rows([_old_row("https://old", {"n": 1}, 120)])
+    cache.put("https://new", {"n": 2})
+    assert cache.get("https://old") is None
+    assert cache.get_many(["https://old", "https://new"]) == {"https://new": {"n": 2}}
+    assert cache.evict() == 1
+    assert len(cache) == 1
+
+
+def test_evict_keeps_newest_entries(cache):
+    cache.max_entries = 2
+    cache._write_rows([_old_row(f"https://{i}", {"n": i}, 100 - i) for i in range(4)])
+    assert cache.evict() == 2
+    assert set(cache.get_many([f"https://{i}" for i in range(4)])) == {"https://2", "https://3"}
+
+
+def test_failed_write_rolls_back(cache):
+    with pytest.raises(sqlite3.Error):
+        cache._write_rows([("k", "https://bad", "{}")])  # colonna mancante
+    assert not cache.conn.in_transaction
+    cache.put("https://ok", {"n": 1})
+    assert cache.get("https://ok") == {"n": 1}
+
+
+def test_import_directory_skips_malformed_files(cache, tmp_path):
+    legacy = tmp_path / "cache_deals"
+    legacy.mkdir()
+    (legacy / f"{url_key('https://a')}.json").write_text(json.dumps({"url": "https://a", "n": 1}))
+    (legacy / "list.json").write_text("[1, 2]")
+    (legacy / "broken.json").write_text("{not json")
+    assert cache.import_directory(legacy) == 1
+    assert cache.get("https://a") == {"url": "https://a", "n": 1}
+    # Una sola volta, salvo force
+    assert cache.import_directory(legacy) == 0